@@ -1,35 +1,74 @@
 from expense_manager_agent.agent import root_agent as expense_manager_agent
-from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
 from google.adk.events import Event
-from fastapi import FastAPI, Body, Depends
-from typing import AsyncIterator
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from fastapi import FastAPI, Body, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match
+from typing import AsyncIterator, Optional
 from types import SimpleNamespace
 import uvicorn
+from uvicorn.protocols.http.auto import AutoHTTPProtocol
 from contextlib import asynccontextmanager
 import asyncio
+import inspect
+import json
+import math
+import os
+import socket
+import tempfile
+import time
+from urllib.parse import urlencode
 from utils import (
     extract_attachment_ids_and_sanitize_response,
     download_image_from_gcs,
     extract_thinking_process,
     format_user_request_to_adk_content_and_store_artifacts,
+    load_image_artifact,
+    parse_byte_range,
+    ResponseStreamParser,
 )
-from schema import ImageData, ChatRequest, ChatResponse
+from schema import ImageData, ChatRequest, ChatResponse, AttachmentReference
+from uploads import read_multipart_chat_request
+from session_store import BoundedSessionService
+from clients import CLIENTS, get_client_status, retry_clients, warm_up_clients
+from expense_manager_agent.history_compaction import get_compaction_stats
+from expense_manager_agent.tools import get_embedding_cache
+from telemetry import (
+    HTTP_RESPONSES,
+    METRIC_PREFIX,
+    MULTIPROC_DIR_ENV,
+    StatsCounter,
+    mark_worker_stopped,
+    prepare_metrics_dir,
+    render_metrics,
+    setup_tracing,
+    shutdown_tracing,
+    stage,
+)
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge
 import logger
 from google.adk.artifacts import GcsArtifactService
 from settings import get_settings
 
 SETTINGS = get_settings()
 APP_NAME = "expense_manager_app"
+# Workers busy importing the agent can miss the default health check of uvicorn and be restarted
+WORKER_HEALTHCHECK_TIMEOUT_SECONDS = 60
+# Interval between two copies of the cache and session statistics into the metrics
+SERVICE_METRICS_REFRESH_SECONDS = 15
 
 
 # Application state to hold service contexts
 class AppContexts(SimpleNamespace):
     """A class to hold application contexts with attribute access"""
 
-    session_service: InMemorySessionService = None
+    session_service: BoundedSessionService = None
     artifact_service: GcsArtifactService = None
     expense_manager_agent_runner: Runner = None
+    started_at: float = 0.0
+    client_retry: Optional[asyncio.Task] = None
+    metrics_refresh: Optional[asyncio.Task] = None
 
 
 # Initialize application state
@@ -38,8 +77,18 @@ app_contexts = AppContexts()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    app_contexts.started_at = time.monotonic()
+    setup_tracing()
+
     # Initialize service contexts during application startup
-    app_contexts.session_service = InMemorySessionService()
+    app_contexts.session_service = BoundedSessionService(
+        store_path=SETTINGS.SESSION_STORE_PATH,
+        max_sessions=SETTINGS.SESSION_CACHE_MAX_SESSIONS,
+        max_bytes=SETTINGS.SESSION_CACHE_MAX_BYTES,
+        ttl_seconds=SETTINGS.SESSION_CACHE_TTL_SECONDS,
+        # Other workers of the backend write to the same store
+        shared=bool(SETTINGS.SESSION_STORE_PATH),
+    )
     app_contexts.artifact_service = GcsArtifactService(
         bucket_name=SETTINGS.STORAGE_BUCKET_NAME
     )
@@ -50,10 +99,19 @@ async def lifespan(app: FastAPI):
         artifact_service=app_contexts.artifact_service,  # Uses our artifact manager
     )
 
-    logger.info("Application started successfully")
+    # Create the data-plane clients before the first request instead of during it
+    if SETTINGS.WARM_UP_CLIENTS:
+        client_status = await asyncio.to_thread(warm_up_clients)
+        logger.info("Clients warmed up", clients=client_status)
+
+    app_contexts.metrics_refresh = asyncio.create_task(refresh_service_metrics_periodically())
+
+    logger.info("Application started successfully", worker_pid=os.getpid())
     yield
     logger.info("Application shutting down")
-    # Perform cleanup during application shutdown if necessary
+    app_contexts.metrics_refresh.cancel()
+    mark_worker_stopped()
+    shutdown_tracing()
 
 
 # Helper function to get application state as a dependency
@@ -61,24 +119,149 @@ async def get_app_contexts() -> AppContexts:
     return app_contexts
 
 
+def ensure_session(app_context: AppContexts, user_id: str, session_id: str) -> None:
+    """Create the session if it doesn't exist"""
+    if not app_context.session_service.get_session(
+        app_name=APP_NAME, user_id=user_id, session_id=session_id
+    ):
+        app_context.session_service.create_session(
+            app_name=APP_NAME, user_id=user_id, session_id=session_id
+        )
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Event message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def build_attachment_reference(
+    image_hash_id: str, user_id: str, session_id: str
+) -> AttachmentReference:
+    """Build the reference to an attachment served by the attachments endpoint"""
+    query = urlencode({"user_id": user_id, "session_id": session_id})
+    return AttachmentReference(
+        id=image_hash_id, url=f"/attachments/{image_hash_id}?{query}"
+    )
+
+
+async def download_attachments(
+    attachment_ids: list[str], user_id: str, session_id: str, app_context: AppContexts
+) -> AsyncIterator[tuple[str, ImageData]]:
+    """Download attachments concurrently with a bounded pool.
+
+    Yields:
+        Tuple of the image hash ID and its base64 image data, in the order of
+        attachment_ids. Images that cannot be downloaded are skipped.
+    """
+    semaphore = asyncio.Semaphore(SETTINGS.ATTACHMENT_DOWNLOAD_CONCURRENCY)
+
+    async def download(image_hash_id: str) -> tuple[str, str] | None:
+        async with semaphore:
+            return await asyncio.to_thread(
+                download_image_from_gcs,
+                artifact_service=app_context.artifact_service,
+                image_hash=image_hash_id,
+                app_name=APP_NAME,
+                user_id=user_id,
+                session_id=session_id,
+            )
+
+    downloads = [
+        asyncio.create_task(download(image_hash_id)) for image_hash_id in attachment_ids
+    ]
+    try:
+        for image_hash_id, task in zip(attachment_ids, downloads):
+            result = await task
+            if result:
+                base64_data, mime_type = result
+                yield image_hash_id, ImageData(
+                    serialized_image=base64_data, mime_type=mime_type
+                )
+    finally:
+        for task in downloads:
+            task.cancel()
+
+
 # Create FastAPI app
 app = FastAPI(title="Personal Expense Assistant API", lifespan=lifespan)
 
 
+def get_route_template(scope: dict) -> str:
+    """Get the path template of the route serving a request, to keep metric labels bounded"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware tracing every HTTP request and counting the responses by status.
+
+    The request span is the parent of the spans of the agent, the tools and the
+    data-plane calls. The duration covers the whole response, streamed or not.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = get_route_template(scope)
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            with stage("http", route, **{"http.method": scope["method"]}) as span:
+                await self.app(scope, receive, send_with_status)
+                span.set_attribute("http.status_code", status_code)
+        finally:
+            HTTP_RESPONSES.labels(route=route, status=status_code).inc()
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest = Body(...),
     app_context: AppContexts = Depends(get_app_contexts),
 ) -> ChatResponse:
     """Process chat request and get response from the agent"""
+    return await process_chat_request(request, app_context)
+
+
+@app.post("/chat/multipart", response_model=ChatResponse)
+async def chat_multipart(
+    http_request: Request,
+    app_context: AppContexts = Depends(get_app_contexts),
+) -> ChatResponse:
+    """Process a multipart/form-data chat request with binary image uploads"""
+    request = await read_multipart_chat_request(http_request)
+    return await process_chat_request(request, app_context)
+
+
+async def process_chat_request(
+    request: ChatRequest, app_context: AppContexts
+) -> ChatResponse:
+    """Run the agent on a chat request and build the complete response"""
 
     # Prepare the user's message in ADK format and store image artifacts
-    content = await asyncio.to_thread(
-        format_user_request_to_adk_content_and_store_artifacts,
-        request=request,
-        app_name=APP_NAME,
-        artifact_service=app_context.artifact_service,
-    )
+    with stage("request_preparation"):
+        content = await asyncio.to_thread(
+            format_user_request_to_adk_content_and_store_artifacts,
+            request=request,
+            app_name=APP_NAME,
+            artifact_service=app_context.artifact_service,
+        )
 
     final_response_text = "Agent did not produce a final response."  # Default
 
@@ -87,12 +270,7 @@ async def chat(
     user_id = request.user_id
 
     # Create session if it doesn't exist
-    if not app_context.session_service.get_session(
-        app_name=APP_NAME, user_id=user_id, session_id=session_id
-    ):
-        app_context.session_service.create_session(
-            app_name=APP_NAME, user_id=user_id, session_id=session_id
-        )
+    ensure_session(app_context, user_id=user_id, session_id=session_id)
 
     try:
         # Process the message with the agent
@@ -102,16 +280,17 @@ async def chat(
                 user_id=user_id, session_id=session_id, new_message=content
             )
         )
-        async for event in events_iterator:  # event has type Event
-            # Key Concept: is_final_response() marks the concluding message for the turn
-            if event.is_final_response():
-                if event.content and event.content.parts:
-                    # Extract text from the first part
-                    final_response_text = event.content.parts[0].text
-                elif event.actions and event.actions.escalate:
-                    # Handle potential errors/escalations
-                    final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
-                break  # Stop processing events once the final response is found
+        with stage("agent", expense_manager_agent.name):
+            async for event in events_iterator:  # event has type Event
+                # Key Concept: is_final_response() marks the concluding message for the turn
+                if event.is_final_response():
+                    if event.content and event.content.parts:
+                        # Extract text from the first part
+                        final_response_text = event.content.parts[0].text
+                    elif event.actions and event.actions.escalate:
+                        # Handle potential errors/escalations
+                        final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
+                    break  # Stop processing events once the final response is found
 
         logger.info(
             "Received final response from agent", raw_final_response=final_response_text
@@ -119,27 +298,18 @@ async def chat(
 
         # Extract and process any attachments and thinking process in the response
         base64_attachments = []
-        sanitized_text, attachment_ids = extract_attachment_ids_and_sanitize_response(
-            final_response_text
-        )
-        sanitized_text, thinking_process = extract_thinking_process(sanitized_text)
-
-        # Download images from GCS and replace hash IDs with base64 data
-        for image_hash_id in attachment_ids:
-            # Download image data and get MIME type
-            result = await asyncio.to_thread(
-                download_image_from_gcs,
-                artifact_service=app_context.artifact_service,
-                image_hash=image_hash_id,
-                app_name=APP_NAME,
-                user_id=user_id,
-                session_id=session_id,
+        with stage("postprocess"):
+            sanitized_text, attachment_ids = extract_attachment_ids_and_sanitize_response(
+                final_response_text
             )
-            if result:
-                base64_data, mime_type = result
-                base64_attachments.append(
-                    ImageData(serialized_image=base64_data, mime_type=mime_type)
-                )
+            sanitized_text, thinking_process = extract_thinking_process(sanitized_text)
+
+        # Download images from GCS only for clients that want them inline
+        if request.inline_attachments:
+            async for _, image_data in download_attachments(
+                attachment_ids, user_id, session_id, app_context
+            ):
+                base64_attachments.append(image_data)
 
         logger.info(
             "Processed response with attachments",
@@ -152,6 +322,10 @@ async def chat(
             response=sanitized_text,
             thinking_process=thinking_process,
             attachments=base64_attachments,
+            attachment_refs=[
+                build_attachment_reference(image_hash_id, user_id, session_id)
+                for image_hash_id in attachment_ids
+            ],
         )
 
     except Exception as e:
@@ -161,6 +335,401 @@ async def chat(
         )
 
 
+async def stream_agent_response(
+    content,
+    user_id: str,
+    session_id: str,
+    inline_attachments: bool,
+    app_context: AppContexts,
+) -> AsyncIterator[str]:
+    """Run the agent and yield its progress as Server-Sent Events.
+
+    Events:
+        tool_call: {"name"} when the agent calls a tool.
+        tool_result: {"name"} when a tool returns.
+        thinking: {"delta"} new thinking process text.
+        response: {"delta"} new final response text.
+        attachment: {"id", "serialized_image", "mime_type"} one downloaded attachment,
+            only sent for inline attachments.
+        done: {"response", "thinking_process", "attachment_ids", "attachment_refs"}
+            the complete response.
+        error: {"error"} if something went wrong.
+    """
+    try:
+        parser = ResponseStreamParser()
+        final_response_text = "Agent did not produce a final response."  # Default
+
+        events_iterator: AsyncIterator[Event] = (
+            app_context.expense_manager_agent_runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=content,
+                run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+            )
+        )
+        async for event in events_iterator:
+            for function_call in event.get_function_calls():
+                yield format_sse("tool_call", {"name": function_call.name})
+            for function_response in event.get_function_responses():
+                yield format_sse("tool_result", {"name": function_response.name})
+
+            if event.partial:
+                # Partial events carry the text delta of the current model turn
+                if event.content and event.content.parts and event.content.parts[0].text:
+                    for kind, data in parser.feed(event.content.parts[0].text):
+                        if kind != "attachments":
+                            yield format_sse(kind, {"delta": data})
+                continue
+
+            if event.is_final_response():
+                if event.content and event.content.parts:
+                    final_response_text = event.content.parts[0].text
+                elif event.actions and event.actions.escalate:
+                    final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
+                break
+
+            # The turn ended with a tool call, following text belongs to a new turn
+            parser = ResponseStreamParser()
+
+        parser.close()
+        logger.info(
+            "Received final response from agent", raw_final_response=final_response_text
+        )
+
+        # The aggregated final text is authoritative over the streamed deltas
+        final_parser = ResponseStreamParser()
+        final_parser.feed(final_response_text)
+        final_parser.close()
+
+        yield format_sse(
+            "done",
+            {
+                "response": final_parser.response,
+                "thinking_process": final_parser.thinking_process,
+                "attachment_ids": final_parser.attachment_ids,
+                "attachment_refs": [
+                    build_attachment_reference(
+                        image_hash_id, user_id, session_id
+                    ).model_dump()
+                    for image_hash_id in final_parser.attachment_ids
+                ],
+            },
+        )
+
+        # Download attachments concurrently and send each one as soon as it is ready
+        if inline_attachments:
+            async for image_hash_id, image_data in download_attachments(
+                final_parser.attachment_ids, user_id, session_id, app_context
+            ):
+                yield format_sse(
+                    "attachment", {"id": image_hash_id, **image_data.model_dump()}
+                )
+
+        logger.info(
+            "Streamed response with attachments",
+            sanitized_response=final_parser.response,
+            thinking_process=final_parser.thinking_process,
+            attachment_ids=final_parser.attachment_ids,
+        )
+    except Exception as e:
+        logger.error("Error processing chat stream request", error_message=str(e))
+        yield format_sse("error", {"error": f"Error in generating response: {str(e)}"})
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest = Body(...),
+    app_context: AppContexts = Depends(get_app_contexts),
+) -> StreamingResponse:
+    """Process chat request and stream the agent progress as Server-Sent Events"""
+    return await start_chat_stream(request, app_context)
+
+
+@app.post("/chat/stream/multipart")
+async def chat_stream_multipart(
+    http_request: Request,
+    app_context: AppContexts = Depends(get_app_contexts),
+) -> StreamingResponse:
+    """Process a multipart/form-data chat request and stream the agent progress"""
+    request = await read_multipart_chat_request(http_request)
+    return await start_chat_stream(request, app_context)
+
+
+async def start_chat_stream(
+    request: ChatRequest, app_context: AppContexts
+) -> StreamingResponse:
+    """Store the request artifacts and start streaming the agent response"""
+
+    # Prepare the user's message in ADK format and store image artifacts
+    with stage("request_preparation"):
+        content = await asyncio.to_thread(
+            format_user_request_to_adk_content_and_store_artifacts,
+            request=request,
+            app_name=APP_NAME,
+            artifact_service=app_context.artifact_service,
+        )
+    ensure_session(app_context, user_id=request.user_id, session_id=request.session_id)
+
+    return StreamingResponse(
+        stream_agent_response(
+            content,
+            user_id=request.user_id,
+            session_id=request.session_id,
+            inline_attachments=request.inline_attachments,
+            app_context=app_context,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/attachments/{image_hash_id}")
+async def get_attachment(
+    image_hash_id: str,
+    http_request: Request,
+    user_id: str = Query("default_user"),
+    session_id: str = Query("default_session"),
+    app_context: AppContexts = Depends(get_app_contexts),
+) -> Response:
+    """Serve an image artifact by its content hash, with HTTP caching and range support"""
+
+    # Artifacts are content addressed, so the hash is a strong validator and never changes
+    etag = f'"{image_hash_id}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if etag in http_request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=cache_headers)
+
+    result = await asyncio.to_thread(
+        load_image_artifact,
+        artifact_service=app_context.artifact_service,
+        app_name=APP_NAME,
+        user_id=user_id,
+        session_id=session_id,
+        image_hash=image_hash_id,
+    )
+    if result is None:
+        return Response(status_code=404)
+
+    image_data, mime_type = result
+    size = len(image_data)
+
+    range_header = http_request.headers.get("range")
+    if range_header and http_request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416, headers={**cache_headers, "Content-Range": f"bytes */{size}"}
+            )
+
+        if byte_range:
+            start, end = byte_range
+            return Response(
+                content=image_data[start : end + 1],
+                status_code=206,
+                media_type=mime_type,
+                headers={**cache_headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+            )
+
+    return Response(content=image_data, media_type=mime_type, headers=cache_headers)
+
+
+@app.get("/sessions/stats")
+async def get_session_stats(
+    app_context: AppContexts = Depends(get_app_contexts),
+) -> dict:
+    """Report the memory usage and eviction counters of the session store"""
+    return await asyncio.to_thread(app_context.session_service.stats)
+
+
+EMBEDDING_CACHE_LOOKUPS = StatsCounter(
+    "embedding_cache_lookups", "Lookups of the embedding cache by tier.", ("result",)
+)
+SESSION_CACHE_LOOKUPS = StatsCounter(
+    "session_cache_lookups", "Lookups of the hot set of the session store.", ("result",)
+)
+HISTORY_TOKENS = StatsCounter(
+    "history_tokens",
+    "Estimated history tokens of the model requests, before and after compaction.",
+    ("phase",),
+)
+SESSION_HOT_SESSIONS = Gauge(
+    METRIC_PREFIX + "session_hot_sessions",
+    "Sessions held in memory.",
+    multiprocess_mode="livesum",
+)
+SESSION_HOT_BYTES = Gauge(
+    METRIC_PREFIX + "session_hot_bytes",
+    "Estimated size of the sessions held in memory.",
+    multiprocess_mode="livesum",
+)
+CLIENT_READY = Gauge(
+    METRIC_PREFIX + "client_ready",
+    "Whether each client is created, in every worker.",
+    ("client",),
+    multiprocess_mode="livemin",
+)
+
+
+def refresh_service_metrics() -> None:
+    """Copy the statistics kept by the caches, the session store and the clients into the metrics"""
+    # The embedding cache is opened on first use, not by a refresh
+    if get_embedding_cache.initialized:
+        embedding_stats = get_embedding_cache().stats()
+        for result, key in (
+            ("memory_hit", "memory_hits"),
+            ("disk_hit", "disk_hits"),
+            ("miss", "misses"),
+        ):
+            EMBEDDING_CACHE_LOOKUPS.update(embedding_stats[key], result=result)
+
+    if app_contexts.session_service is not None:
+        session_stats = app_contexts.session_service.stats()
+        SESSION_CACHE_LOOKUPS.update(session_stats["hits"], result="hit")
+        SESSION_CACHE_LOOKUPS.update(session_stats["misses"], result="miss")
+        SESSION_HOT_SESSIONS.set(session_stats["hot_sessions"])
+        SESSION_HOT_BYTES.set(session_stats["hot_bytes"])
+
+    compaction_stats = get_compaction_stats()
+    HISTORY_TOKENS.update(compaction_stats["tokens_before"], phase="before")
+    HISTORY_TOKENS.update(compaction_stats["tokens_after"], phase="after")
+
+    for name, client in CLIENTS.items():
+        CLIENT_READY.labels(client=name).set(int(client.state == "ready"))
+
+
+async def refresh_service_metrics_periodically() -> None:
+    """Copy the statistics of this worker into the metrics, a scrape is served by any worker"""
+    while True:
+        try:
+            await asyncio.to_thread(refresh_service_metrics)
+        except Exception as e:
+            logger.warning("Failed to refresh the service metrics", error_message=str(e))
+        await asyncio.sleep(SERVICE_METRICS_REFRESH_SECONDS)
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus metrics of the backend: stage latencies, in-flight stages, tokens and caches"""
+    await asyncio.to_thread(refresh_service_metrics)
+    return Response(await asyncio.to_thread(render_metrics), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/healthz")
+async def healthz(app_context: AppContexts = Depends(get_app_contexts)) -> dict:
+    """Liveness probe, the process is up and serving requests"""
+    return {
+        "status": "ok",
+        "worker_pid": os.getpid(),
+        "uptime_seconds": round(time.monotonic() - app_context.started_at, 3),
+    }
+
+
+@app.get("/readyz")
+async def readyz(app_context: AppContexts = Depends(get_app_contexts)) -> JSONResponse:
+    """Readiness probe, reports the initialization state of every dependency.
+
+    Services created at startup must be ready. Clients must be ready when they are
+    warmed up at startup, otherwise they are created on first use and only a failed
+    initialization makes the backend not ready. The clients that are not ready are
+    created again in the background, with a backoff, so that a transient failure
+    does not keep the backend out of rotation.
+    """
+    services = {
+        name: {"state": "ready" if service is not None else "uninitialized"}
+        for name, service in (
+            ("session_service", app_context.session_service),
+            ("artifact_service", app_context.artifact_service),
+            ("agent_runner", app_context.expense_manager_agent_runner),
+        )
+    }
+    clients = get_client_status()
+
+    client_states = {"ready"} if SETTINGS.WARM_UP_CLIENTS else {"ready", "uninitialized"}
+    ready = all(status["state"] == "ready" for status in services.values()) and all(
+        status["state"] in client_states for status in clients.values()
+    )
+
+    if not ready and (app_context.client_retry is None or app_context.client_retry.done()):
+        app_context.client_retry = asyncio.create_task(
+            asyncio.to_thread(retry_clients, SETTINGS.WARM_UP_CLIENTS)
+        )
+
+    return JSONResponse(
+        {"ready": ready, "dependencies": {**services, **clients}},
+        status_code=200 if ready else 503,
+    )
+
+
+class NoDelayHTTPProtocol(AutoHTTPProtocol):
+    """HTTP protocol disabling Nagle's algorithm on every connection.
+
+    Worker processes accept connections on the listening socket created by the
+    uvicorn supervisor, on which asyncio does not set TCP_NODELAY. Responses
+    written in several small writes, such as streamed events, would otherwise
+    wait for the client to acknowledge the previous write.
+    """
+
+    def connection_made(self, transport) -> None:
+        sock = transport.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().connection_made(transport)
+
+
+def get_available_cpus() -> int:
+    """Count the CPU cores available to the process, within its affinity and cgroup quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # Containers are usually limited by a CPU quota rather than an affinity mask
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cpus)
+
+
+def get_worker_count() -> int:
+    """Number of worker processes to run, one per available CPU core unless configured"""
+    return SETTINGS.BACKEND_WORKERS or get_available_cpus()
+
+
 # Only run the server if this file is executed directly
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8081)
\ No newline at end of file
+    workers = get_worker_count()
+    if workers > 1 and not (SETTINGS.SESSION_STORE_PATH and SETTINGS.INDEX_GENERATIONS_PATH):
+        raise ValueError(
+            "Running more than one backend worker requires SESSION_STORE_PATH "
+            "and INDEX_GENERATIONS_PATH, the state shared by the workers"
+        )
+
+    if workers > 1:
+        # Workers write their metrics to files there, a scrape of any worker sums all of them
+        metrics_dir = SETTINGS.METRICS_MULTIPROC_DIR or tempfile.mkdtemp(prefix="expense-metrics-")
+        prepare_metrics_dir(metrics_dir)
+        os.environ[MULTIPROC_DIR_ENV] = metrics_dir
+
+    server_options = {
+        "host": SETTINGS.BACKEND_HOST,
+        "port": SETTINGS.BACKEND_PORT,
+        "workers": workers,
+        "http": NoDelayHTTPProtocol,
+    }
+    # Only recent uvicorn versions let the worker health check timeout be configured
+    if "timeout_worker_healthcheck" in inspect.signature(uvicorn.Config).parameters:
+        server_options["timeout_worker_healthcheck"] = WORKER_HEALTHCHECK_TIMEOUT_SECONDS
+
+    logger.info("Starting backend", workers=workers)
+    # Several workers need the import string, each worker process imports the app
+    uvicorn.run("backend:app" if workers > 1 else app, **server_options)
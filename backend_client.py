@@ -0,0 +1,277 @@
+import base64
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import logger
+from clients import lazy_client
+from settings import get_settings
+
+SETTINGS = get_settings()
+
+# Status codes of a backend that is restarting or overloaded, retried for idempotent requests
+RETRY_STATUS_CODES = (502, 503, 504)
+# Retries allowed per second on top of the budget earned by requests, and the budget cap
+RETRY_BUDGET_RESERVE_PER_SECOND = 0.5
+RETRY_BUDGET_MAX_TOKENS = 10.0
+
+
+class RetryBudget:
+    """Token bucket capping retries to a fraction of the requests sent.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so a
+    backend failing all requests receives at most (1 + ratio) times the load
+    instead of one extra request per configured retry. A small reserve refills
+    over time, so that retries still work when there is little traffic.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.1,
+        reserve_per_second: float = RETRY_BUDGET_RESERVE_PER_SECOND,
+        max_tokens: float = RETRY_BUDGET_MAX_TOKENS,
+    ):
+        self.ratio = ratio
+        self.reserve_per_second = reserve_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def record_request(self) -> None:
+        """Earn the retry budget of one request."""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Withdraw one retry from the budget.
+
+        Returns:
+            bool: True if the retry is allowed, False if the budget is spent.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.max_tokens,
+                self._tokens + (now - self._refilled_at) * self.reserve_per_second,
+            )
+            self._refilled_at = now
+            if self._tokens < 1:
+                self.exhausted += 1
+                return False
+
+            self._tokens -= 1
+            return True
+
+
+RETRY_BUDGET = RetryBudget(ratio=SETTINGS.FRONTEND_RETRY_BUDGET_RATIO)
+
+
+class BudgetedRetry(Retry):
+    """urllib3 retry policy that also draws every retry from the shared retry budget."""
+
+    def increment(self, *args: Any, **kwargs: Any) -> Retry:
+        # Raises when the error cannot be retried or the retries are exhausted
+        new_retry = super().increment(*args, **kwargs)
+        if not RETRY_BUDGET.try_spend():
+            logger.warning("Retry budget exhausted, not retrying the backend request")
+            # Exhausted retries raise the error, or return the response of a retried status
+            return Retry.increment(self.new(total=0), *args, **kwargs)
+
+        return new_retry
+
+
+@lazy_client("backend_http")
+def get_http_session() -> requests.Session:
+    """Get the process-wide HTTP session to the backend, with pooled keep-alive connections.
+
+    Connection failures are retried for every request, as the request was not
+    sent. Read errors and overloaded backend responses are only retried for
+    idempotent requests, a chat message can store receipts.
+    """
+    retry = BudgetedRetry(
+        total=SETTINGS.FRONTEND_HTTP_RETRIES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        status_forcelist=RETRY_STATUS_CODES,
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    # One pooled connection per Gradio worker that can talk to the backend at the same time
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=SETTINGS.FRONTEND_CONCURRENCY_LIMIT,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def request_backend(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """Send a request to the backend on the pooled session, with the configured timeouts.
+
+    Args:
+        method: HTTP method.
+        url: Absolute backend URL.
+        **kwargs: Keyword arguments of `requests.Session.request`.
+
+    Returns:
+        requests.Response: The backend response.
+    """
+    RETRY_BUDGET.record_request()
+    kwargs.setdefault(
+        "timeout",
+        (
+            SETTINGS.FRONTEND_HTTP_CONNECT_TIMEOUT_SECONDS,
+            SETTINGS.FRONTEND_HTTP_READ_TIMEOUT_SECONDS,
+        ),
+    )
+    return get_http_session().request(method, url, **kwargs)
+
+
+class AttachmentCache:
+    """Content-addressed cache of the image attachments returned by the backend.
+
+    Attachments are identified by the hash of their content and never change,
+    so each one is downloaded or decoded once and kept as a file that Gradio
+    serves directly, without decoding it. The oldest files are removed once
+    the cache grows over its byte budget.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """Initialize the cache with the files left by previous runs.
+
+        Args:
+            cache_dir: Directory of the cached attachment files.
+            max_bytes: Size budget of the cache in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Attachment ID to (path, size), from the oldest to the most recent file
+        self._files: OrderedDict[str, Tuple[str, int]] = OrderedDict()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = sorted(
+            (entry for entry in os.scandir(cache_dir) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+                continue
+            attachment_id = entry.name.split(".", 1)[0]
+            self._files[attachment_id] = (entry.path, entry.stat().st_size)
+        self._total_bytes = sum(size for _, size in self._files.values())
+
+    def lookup(self, attachment_id: str) -> Optional[str]:
+        """Return the cached file of an attachment, None if it is not cached."""
+        with self._lock:
+            cached = self._files.get(attachment_id)
+            return cached[0] if cached else None
+
+    def store(self, attachment_id: str, data: bytes, mime_type: Optional[str]) -> str:
+        """Write an attachment to the cache.
+
+        Args:
+            attachment_id: The content hash of the attachment.
+            data: The image bytes.
+            mime_type: The MIME type of the image, used for the file extension.
+
+        Returns:
+            str: The path of the cached file.
+
+        Raises:
+            ValueError: If the attachment ID cannot be used as a file name.
+        """
+        if not attachment_id.isalnum():
+            raise ValueError(f"Invalid attachment ID: {attachment_id}")
+
+        extension = mimetypes.guess_extension((mime_type or "").split(";")[0].strip()) or ".bin"
+        path = os.path.join(self.cache_dir, f"{attachment_id}{extension}")
+
+        # Concurrent writers of the same attachment write the same bytes
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._files.pop(attachment_id, None)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            self._files[attachment_id] = (path, len(data))
+            self._total_bytes += len(data)
+
+            # Keep the file just written, it is about to be displayed
+            while self._total_bytes > self.max_bytes and len(self._files) > 1:
+                _, (evicted_path, size) = self._files.popitem(last=False)
+                self._total_bytes -= size
+                try:
+                    os.remove(evicted_path)
+                except FileNotFoundError:
+                    pass
+
+        return path
+
+
+@lazy_client("attachment_cache")
+def get_attachment_cache() -> AttachmentCache:
+    """Get the process-wide attachment cache, created on first use."""
+    return AttachmentCache(
+        cache_dir=SETTINGS.FRONTEND_ATTACHMENT_CACHE_DIR
+        or os.path.join(tempfile.gettempdir(), "personal-expense-assistant-attachments"),
+        max_bytes=SETTINGS.FRONTEND_ATTACHMENT_CACHE_MAX_BYTES,
+    )
+
+
+def fetch_attachment(attachment_id: str, attachment_url: str) -> str:
+    """Get the cached file of an attachment, downloading it from the backend on a miss.
+
+    Args:
+        attachment_id: The content hash of the attachment.
+        attachment_url: Backend relative URL of the attachment.
+
+    Returns:
+        str: The path of the cached attachment file.
+    """
+    cache = get_attachment_cache()
+    path = cache.lookup(attachment_id)
+    if path is not None:
+        return path
+
+    response = request_backend("GET", urljoin(SETTINGS.BACKEND_URL, attachment_url))
+    response.raise_for_status()
+    logger.info("Downloaded attachment", attachment_id=attachment_id, size=len(response.content))
+
+    return cache.store(attachment_id, response.content, response.headers.get("content-type"))
+
+
+def store_inline_attachment(attachment_id: str, serialized_image: str, mime_type: str) -> str:
+    """Get the cached file of an attachment sent inline, decoding it on a miss.
+
+    Args:
+        attachment_id: The content hash of the attachment.
+        serialized_image: The base64 encoded image.
+        mime_type: The MIME type of the image.
+
+    Returns:
+        str: The path of the cached attachment file.
+    """
+    cache = get_attachment_cache()
+    path = cache.lookup(attachment_id)
+    if path is not None:
+        return path
+
+    return cache.store(attachment_id, base64.b64decode(serialized_image), mime_type)
@@ -0,0 +1,121 @@
+# benchmarks/async_tools_concurrency.py
+"""Throughput of the sync and async agent tools as the number of in-flight calls grows.
+
+Runs receipt lookups through ADK function tools on one event loop, as the
+backend does for concurrent /chat requests. The Firestore point read is
+replaced by a simulated round trip of fixed latency, blocking for the sync
+tool and awaiting for the async one, so only the scheduling is measured.
+A sync tool blocks the event loop for the whole round trip, its throughput
+stays flat while the async tool scales with the number of in-flight calls.
+
+Usage:
+    uv run python -m benchmarks.async_tools_concurrency --in-flight 1 4 16 64
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from google.adk.tools import FunctionTool
+
+from expense_manager_agent import async_tools, tools
+
+
+class SimulatedSnapshot:
+    def __init__(self, doc_id: str):
+        self.id = doc_id
+        self.exists = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"receipt_id": self.id, "store_name": "Benchmark Store"}
+
+
+class BlockingDocument:
+    """Document reference whose reads block for the simulated round trip."""
+
+    def __init__(self, doc_id: str, latency: float):
+        self.doc_id = doc_id
+        self.latency = latency
+
+    def get(self, field_paths: List[str] | None = None) -> SimulatedSnapshot:
+        time.sleep(self.latency)
+        return SimulatedSnapshot(self.doc_id)
+
+
+class AwaitingDocument(BlockingDocument):
+    """Document reference whose reads await the simulated round trip."""
+
+    async def get(self, field_paths: List[str] | None = None) -> SimulatedSnapshot:
+        await asyncio.sleep(self.latency)
+        return SimulatedSnapshot(self.doc_id)
+
+
+async def measure(
+    tool: FunctionTool, in_flight: int, calls: int
+) -> Dict[str, float]:
+    """Run `calls` lookups with at most `in_flight` of them running at the same time."""
+    tool_context = SimpleNamespace(_invocation_context=SimpleNamespace(user_id="benchmark"))
+    semaphore = asyncio.Semaphore(in_flight)
+    latencies: List[float] = []
+
+    async def call(number: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await tool.run_async(
+                args={"image_id": f"receipt-{number}"}, tool_context=tool_context
+            )
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(number) for number in range(calls)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "calls_per_second": round(calls / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+def run_benchmark(
+    in_flight_levels: List[int], calls: int, latency_ms: float
+) -> Dict[str, Any]:
+    latency = latency_ms / 1000
+    document_factories: Dict[str, Callable[..., BlockingDocument]] = {
+        "sync": lambda user_id, image_id: BlockingDocument(image_id, latency),
+        "async": lambda user_id, image_id: AwaitingDocument(image_id, latency),
+    }
+    tools.get_receipt_document = document_factories["sync"]
+    async_tools.get_async_receipt_document = document_factories["async"]
+
+    variants = {
+        "sync": FunctionTool(tools.get_receipt_data_by_image_id),
+        "async": FunctionTool(async_tools.get_receipt_data_by_image_id),
+    }
+    results: Dict[str, Any] = {"latency_ms": latency_ms, "calls": calls}
+    for in_flight in in_flight_levels:
+        results[f"in_flight_{in_flight}"] = {
+            name: asyncio.run(measure(tool, in_flight, calls))
+            for name, tool in variants.items()
+        }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--calls", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.in_flight, args.calls, args.latency_ms), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# benchmarks/backend_workers_load.py
+"""Load test of the backend throughput as the number of worker processes grows.
+
+For each worker count the backend is started with `python backend.py` and
+BACKEND_WORKERS set, on fresh session and index generation stores shared by
+its workers. Client processes then send requests for a fixed duration and
+open a new connection every few requests, so the load spreads over all the
+workers. The scaling efficiency is the throughput of N workers divided by N
+times the throughput of one worker, 1.0 for linear scaling. Clients compete
+with the workers for the CPU, run the test on a host with at least twice as
+many cores as the largest worker count.
+
+The default path reads the session store shared by the workers. Without
+application default credentials, set STORAGE_EMULATOR_HOST and
+FIRESTORE_EMULATOR_HOST so that the backend starts offline.
+
+Usage:
+    uv run python -m benchmarks.backend_workers_load --workers 1 2 4 --clients 8
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(workers: int, port: int, store_dir: str) -> subprocess.Popen:
+    """Start the backend with its own shared stores, from the repository root."""
+    env = {
+        **os.environ,
+        "BACKEND_HOST": "127.0.0.1",
+        "BACKEND_PORT": str(port),
+        "BACKEND_WORKERS": str(workers),
+        "SESSION_STORE_PATH": os.path.join(store_dir, "sessions.sqlite3"),
+        "INDEX_GENERATIONS_PATH": os.path.join(store_dir, "index_generations.sqlite3"),
+        "WARM_UP_CLIENTS": "false",
+    }
+    return subprocess.Popen(
+        [sys.executable, "backend.py"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_for_workers(port: int, workers: int, timeout: float) -> None:
+    """Wait until every worker answered the liveness probe."""
+    deadline = time.monotonic() + timeout
+    worker_pids = set()
+    while len(worker_pids) < workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{len(worker_pids)} of {workers} workers started")
+
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        try:
+            connection.request("GET", "/healthz")
+            worker_pids.add(json.loads(connection.getresponse().read())["worker_pid"])
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.5)
+        finally:
+            connection.close()
+
+
+def run_client(
+    port: int, path: str, duration: float, requests_per_connection: int
+) -> Tuple[int, List[float]]:
+    """Send requests until the duration is over.
+
+    Returns:
+        Tuple[int, List[float]]: The number of failed requests and the latency
+            of every successful one.
+    """
+    errors = 0
+    latencies: List[float] = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        try:
+            for _ in range(requests_per_connection):
+                started = time.perf_counter()
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+        finally:
+            connection.close()
+
+    return errors, latencies
+
+
+def measure(
+    workers: int,
+    clients: int,
+    path: str,
+    duration: float,
+    requests_per_connection: int,
+    startup_timeout: float,
+) -> Dict[str, Any]:
+    """Start the backend with `workers` workers and measure its throughput."""
+    port = get_free_port()
+    with tempfile.TemporaryDirectory() as store_dir:
+        backend = start_backend(workers, port, store_dir)
+        try:
+            wait_for_workers(port, workers, startup_timeout)
+            with multiprocessing.Pool(clients) as pool:
+                results = pool.starmap(
+                    run_client,
+                    [(port, path, duration, requests_per_connection)] * clients,
+                )
+        finally:
+            backend.terminate()
+            backend.wait()
+
+    latencies = sorted(latency for _, client_latencies in results for latency in client_latencies)
+    return {
+        "requests_per_second": round(len(latencies) / duration, 1),
+        "errors": sum(errors for errors, _ in results),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2)
+        if latencies
+        else None,
+    }
+
+
+def run_benchmark(
+    worker_counts: List[int],
+    clients: int,
+    path: str,
+    duration: float,
+    requests_per_connection: int,
+    startup_timeout: float,
+) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"path": path, "clients": clients, "cpus": os.cpu_count()}
+    baseline = None
+    for workers in worker_counts:
+        result = measure(
+            workers, clients, path, duration, requests_per_connection, startup_timeout
+        )
+        if baseline is None:
+            baseline = result["requests_per_second"] / workers
+        if baseline:
+            result["scaling_efficiency"] = round(
+                result["requests_per_second"] / (baseline * workers), 2
+            )
+        results[f"workers_{workers}"] = result
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--path", default="/sessions/stats")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--requests-per-connection", type=int, default=20)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(
+        json.dumps(
+            run_benchmark(
+                args.workers,
+                args.clients,
+                args.path,
+                args.duration,
+                args.requests_per_connection,
+                args.startup_timeout,
+            ),
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,911 @@
+# benchmarks/fakes.py
+"""Deterministic in-process stand-ins for the Google services used by the backend.
+
+Each stand-in implements the subset of the client API the application calls
+and goes through a `SimulatedService`, which sleeps for a configurable round
+trip and records the calls made to it. With the default zero latency the
+benchmarks only measure the application code; with a latency set they show
+how the round trips add up along a request.
+
+- `InMemoryFirestore`: sync and async Firestore clients over a dict, with
+  filters, ordering, cursors, projections, batched writes with increments and
+  `find_nearest` vector search.
+- `FakeGenAIClient`: embeddings built from hashed tokens, so texts sharing
+  words are close to each other, and structured receipt extraction derived
+  from the hash of the image.
+- `ScriptedLlm`: a model replaying scripted tool calls and final answers.
+- `LocalArtifactService`: the ADK in-memory artifact service.
+
+`install_fakes` makes the lazy clients of the application return the stand-ins.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import cmp_to_key
+from types import SimpleNamespace
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
+from google.cloud.firestore_v1.transforms import Increment
+from google.cloud.firestore_v1.vector import Vector
+from google.genai import types
+from pydantic import ConfigDict, Field
+
+DOCUMENT_ID_FIELD = "__name__"
+FAKE_EMBEDDING_DIMENSION = 768
+# Dimensions each token of a text adds to its fake embedding
+FAKE_EMBEDDING_DIMENSIONS_PER_TOKEN = 8
+# Stores and items of the receipts extracted from images by the fake model
+FAKE_RECEIPT_STORES = ["Kopi Kenangan", "Indomaret", "Alfamart", "Gramedia"]
+FAKE_RECEIPT_ITEMS = ["Es Kopi Susu", "Roti Tawar", "Air Mineral", "Buku Tulis", "Teh Botol"]
+
+
+class SimulatedService:
+    """Simulated round trips and call accounting of one remote service.
+
+    Every call waits for the configured latency, plus a jitter drawn from a
+    seeded generator so that runs are reproducible, and is counted by operation.
+    """
+
+    def __init__(self, name: str, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.simulated_seconds = 0.0
+
+    def _record(self, operation: str) -> float:
+        with self._lock:
+            delay = self.latency_ms
+            if self.jitter_ms:
+                delay += self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            delay = max(0.0, delay) / 1000
+            self.calls[operation] += 1
+            self.simulated_seconds += delay
+            return delay
+
+    def wait(self, operation: str) -> None:
+        """Block for one simulated round trip."""
+        delay = self._record(operation)
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, operation: str) -> None:
+        """Await one simulated round trip."""
+        delay = self._record(operation)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.simulated_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": dict(sorted(self.calls.items())),
+                "simulated_ms": round(self.simulated_seconds * 1000, 3),
+            }
+
+
+def copy_value(value: Any) -> Any:
+    """Copy the containers of a document value, leaving immutable leaves shared."""
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def get_field(data: Dict[str, Any], field_path: str) -> Any:
+    """Read a dotted field path.
+
+    Raises:
+        KeyError: If the field is missing.
+    """
+    value: Any = data
+    for name in field_path.split("."):
+        if not isinstance(value, dict) or name not in value:
+            raise KeyError(field_path)
+        value = value[name]
+    return value
+
+
+def set_field(data: Dict[str, Any], field_path: str, value: Any) -> None:
+    names = field_path.split(".")
+    for name in names[:-1]:
+        data = data.setdefault(name, {})
+    data[names[-1]] = value
+
+
+def apply_transforms(value: Any, current: Any) -> Any:
+    """Resolve increments against the current value, as Firestore does on commit."""
+    if isinstance(value, Increment):
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    if isinstance(value, dict):
+        return {
+            key: apply_transforms(item, current.get(key) if isinstance(current, dict) else None)
+            for key, item in value.items()
+        }
+    return copy_value(value)
+
+
+def merge_fields(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge a `set(..., merge=True)` write into a document, map fields are merged recursively."""
+    merged = dict(current)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_fields(merged[key], value)
+        else:
+            merged[key] = apply_transforms(value, merged.get(key))
+    return merged
+
+
+def project_fields(data: Dict[str, Any], field_paths: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Keep only the selected fields of a document, all of them without selection."""
+    if field_paths is None:
+        return copy_value(data)
+
+    projected: Dict[str, Any] = {}
+    for field_path in field_paths:
+        try:
+            set_field(projected, field_path, copy_value(get_field(data, field_path)))
+        except KeyError:
+            continue
+    return projected
+
+
+def compare_values(left: Any, right: Any) -> int:
+    if left == right:
+        return 0
+    return -1 if left < right else 1
+
+
+class InMemorySnapshot:
+    """Document snapshot with the read API of Firestore snapshots."""
+
+    def __init__(self, reference: "InMemoryDocument", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy_value(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        if self._data is None:
+            return None
+        return get_field(self._data, field_path)
+
+
+class InMemoryDocument:
+    """Document reference of the in-memory Firestore."""
+
+    def __init__(self, client: "InMemoryFirestore", path: Tuple[str, ...]):
+        self._client = client
+        self._path = path
+        self.id = path[-1]
+
+    @property
+    def path(self) -> str:
+        return "/".join(self._path)
+
+    def collection(self, name: str) -> "InMemoryCollection":
+        return InMemoryCollection(self._client, self._path + (name,))
+
+    def get(self, field_paths: Optional[List[str]] = None) -> Any:
+        return self._client._call(
+            "get", lambda: self._client._snapshot(self, field_paths)
+        )
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> Any:
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        return batch.commit()
+
+    def create(self, document_data: Dict[str, Any]) -> Any:
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        return batch.commit()
+
+    def delete(self) -> Any:
+        batch = self._client.batch()
+        batch.delete(self)
+        return batch.commit()
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, InMemoryDocument) and self._path == other._path
+
+    def __hash__(self) -> int:
+        return hash(self._path)
+
+
+class InMemoryQuery:
+    """Immutable query over one collection, evaluated when streamed."""
+
+    def __init__(
+        self,
+        client: "InMemoryFirestore",
+        path: Tuple[str, ...],
+        filters: Tuple[Any, ...] = (),
+        field_paths: Optional[Tuple[str, ...]] = None,
+        orders: Tuple[Tuple[str, bool], ...] = (),
+        cursor: Optional[Tuple[Dict[str, Any], bool]] = None,
+        limit_count: Optional[int] = None,
+        nearest: Optional[Tuple[str, List[float], DistanceMeasure, int]] = None,
+    ):
+        self._client = client
+        self._path = path
+        self._filters = filters
+        self._field_paths = field_paths
+        self._orders = orders
+        self._cursor = cursor
+        self._limit = limit_count
+        self._nearest = nearest
+
+    def _copy(self, **changes: Any) -> "InMemoryQuery":
+        options = {
+            "filters": self._filters,
+            "field_paths": self._field_paths,
+            "orders": self._orders,
+            "cursor": self._cursor,
+            "limit_count": self._limit,
+            "nearest": self._nearest,
+            **changes,
+        }
+        return InMemoryQuery(self._client, self._path, **options)
+
+    def where(
+        self,
+        field_path: Optional[str] = None,
+        op_string: Optional[str] = None,
+        value: Any = None,
+        *,
+        filter: Any = None,
+    ) -> "InMemoryQuery":
+        if filter is None:
+            filter = (field_path, op_string, value)
+        return self._copy(filters=self._filters + (filter,))
+
+    def select(self, field_paths: Iterable[str]) -> "InMemoryQuery":
+        return self._copy(field_paths=tuple(field_paths))
+
+    def order_by(self, field_path: Any, direction: str = "ASCENDING") -> "InMemoryQuery":
+        return self._copy(orders=self._orders + ((str(field_path), direction == "DESCENDING"),))
+
+    def start_at(self, document_fields: Dict[str, Any]) -> "InMemoryQuery":
+        return self._copy(cursor=(document_fields, True))
+
+    def start_after(self, document_fields: Dict[str, Any]) -> "InMemoryQuery":
+        return self._copy(cursor=(document_fields, False))
+
+    def limit(self, count: int) -> "InMemoryQuery":
+        return self._copy(limit_count=count)
+
+    def find_nearest(
+        self,
+        vector_field: str,
+        query_vector: Any,
+        limit: int,
+        distance_measure: DistanceMeasure,
+        **kwargs: Any,
+    ) -> "InMemoryQuery":
+        return self._copy(nearest=(vector_field, list(query_vector), distance_measure, limit))
+
+    def stream(self) -> Any:
+        return self._client._stream(
+            "find_nearest" if self._nearest else "query", self._run
+        )
+
+    def get(self) -> Any:
+        if self._client.asynchronous:
+            async def read() -> List[InMemorySnapshot]:
+                return [snapshot async for snapshot in self.stream()]
+
+            return read()
+        return list(self.stream())
+
+    def _matches(self, data: Dict[str, Any], doc_id: str, condition: Any) -> bool:
+        if hasattr(condition, "filters"):
+            results = (self._matches(data, doc_id, item) for item in condition.filters)
+            return any(results) if condition.operator.name == "OR" else all(results)
+
+        if isinstance(condition, tuple):
+            field_path, op_string, expected = condition
+        else:
+            field_path, op_string, expected = (
+                condition.field_path,
+                condition.op_string,
+                condition.value,
+            )
+        try:
+            value = doc_id if field_path == DOCUMENT_ID_FIELD else get_field(data, field_path)
+        except KeyError:
+            return False
+
+        try:
+            if op_string == "==":
+                return value == expected
+            if op_string == "!=":
+                return value != expected
+            if op_string == "<":
+                return value < expected
+            if op_string == "<=":
+                return value <= expected
+            if op_string == ">":
+                return value > expected
+            if op_string == ">=":
+                return value >= expected
+            if op_string == "in":
+                return value in expected
+            if op_string == "not-in":
+                return value not in expected
+            if op_string == "array_contains":
+                return isinstance(value, list) and expected in value
+            if op_string == "array_contains_any":
+                return isinstance(value, list) and any(item in value for item in expected)
+        except TypeError:
+            # Firestore only compares values of the same type
+            return False
+        raise NotImplementedError(f"Unsupported operator: {op_string}")
+
+    def _sort_key(self, doc_id: str, data: Dict[str, Any]) -> Optional[List[Any]]:
+        key = []
+        for field_path, _ in self._orders:
+            if field_path == DOCUMENT_ID_FIELD:
+                key.append(doc_id)
+                continue
+            try:
+                key.append(get_field(data, field_path))
+            except KeyError:
+                # Documents without an ordered field are not returned
+                return None
+        return key
+
+    def _compare_keys(self, left: List[Any], right: List[Any]) -> int:
+        for (_, descending), left_value, right_value in zip(self._orders, left, right):
+            result = compare_values(left_value, right_value)
+            if result:
+                return -result if descending else result
+        return 0
+
+    def _after_cursor(self, key: List[Any]) -> bool:
+        fields, inclusive = self._cursor
+        cursor_key = []
+        for field_path, _ in self._orders:
+            value = fields[field_path]
+            cursor_key.append(value.id if isinstance(value, InMemoryDocument) else value)
+        result = self._compare_keys(key, cursor_key)
+        return result >= 0 if inclusive else result > 0
+
+    def _run(self) -> List[InMemorySnapshot]:
+        documents = self._client._documents_of(self._path)
+        rows = [
+            (doc_id, data)
+            for doc_id, data in documents
+            if all(self._matches(data, doc_id, condition) for condition in self._filters)
+        ]
+
+        if self._nearest is not None:
+            return self._run_nearest(rows)
+
+        if self._orders:
+            keyed = [
+                (key, doc_id, data)
+                for doc_id, data in rows
+                if (key := self._sort_key(doc_id, data)) is not None
+            ]
+            keyed.sort(key=cmp_to_key(lambda left, right: self._compare_keys(left[0], right[0])))
+            if self._cursor is not None:
+                keyed = [row for row in keyed if self._after_cursor(row[0])]
+            rows = [(doc_id, data) for _, doc_id, data in keyed]
+        else:
+            rows.sort(key=lambda row: row[0])
+
+        if self._limit is not None:
+            rows = rows[: self._limit]
+
+        return [
+            InMemorySnapshot(
+                InMemoryDocument(self._client, self._path + (doc_id,)),
+                project_fields(data, self._field_paths),
+            )
+            for doc_id, data in rows
+        ]
+
+    def _run_nearest(self, rows: List[Tuple[str, Dict[str, Any]]]) -> List[InMemorySnapshot]:
+        vector_field, query_vector, distance_measure, limit = self._nearest
+        doc_ids, matrix = self._client._vector_matrix(self._path, vector_field, len(query_vector))
+        documents = dict(rows)
+        candidates = [idx for idx, doc_id in enumerate(doc_ids) if doc_id in documents]
+        if not candidates:
+            return []
+
+        matrix = matrix[candidates]
+        query = np.asarray(query_vector, dtype=np.float32)
+        if distance_measure == DistanceMeasure.EUCLIDEAN:
+            distances = np.linalg.norm(matrix - query, axis=1)
+        elif distance_measure == DistanceMeasure.COSINE:
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            distances = 1.0 - (matrix @ query) / np.where(norms == 0, 1.0, norms)
+        else:
+            # Larger dot products are nearer
+            distances = -(matrix @ query)
+
+        order = np.argsort(distances, kind="stable")[:limit]
+        return [
+            InMemorySnapshot(
+                InMemoryDocument(self._client, self._path + (doc_ids[candidates[idx]],)),
+                copy_value(documents[doc_ids[candidates[idx]]]),
+            )
+            for idx in order
+        ]
+
+
+class InMemoryCollection(InMemoryQuery):
+    """Collection reference of the in-memory Firestore."""
+
+    def __init__(self, client: "InMemoryFirestore", path: Tuple[str, ...]):
+        super().__init__(client, path)
+        self.id = path[-1]
+
+    def document(self, document_id: Optional[str] = None) -> InMemoryDocument:
+        if document_id is None:
+            document_id = uuid.uuid4().hex[:20]
+        return InMemoryDocument(self._client, self._path + (document_id,))
+
+    def list_documents(self, page_size: Optional[int] = None) -> Any:
+        return self._client._stream(
+            "list_documents",
+            lambda: [
+                InMemoryDocument(self._client, self._path + (doc_id,))
+                for doc_id in self._client._document_ids_of(self._path)
+            ],
+        )
+
+
+class InMemoryWriteBatch:
+    """Write batch applied atomically on commit, like a Firestore batch."""
+
+    def __init__(self, client: "InMemoryFirestore"):
+        self._client = client
+        self._writes: List[Tuple[str, InMemoryDocument, Optional[Dict[str, Any]], bool]] = []
+
+    def create(self, reference: InMemoryDocument, document_data: Dict[str, Any]) -> None:
+        self._writes.append(("create", reference, document_data, False))
+
+    def set(
+        self, reference: InMemoryDocument, document_data: Dict[str, Any], merge: bool = False
+    ) -> None:
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference: InMemoryDocument, field_updates: Dict[str, Any]) -> None:
+        self._writes.append(("update", reference, field_updates, True))
+
+    def delete(self, reference: InMemoryDocument) -> None:
+        self._writes.append(("delete", reference, None, False))
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def commit(self) -> Any:
+        writes, self._writes = self._writes, []
+        return self._client._call("commit", lambda: self._client._apply(writes))
+
+
+class InMemoryFirestore:
+    """Firestore stand-in keeping the documents of every collection in memory.
+
+    The sync client returns values and iterators, the async client returned by
+    `as_async` shares the same documents and returns awaitables and async
+    iterators, like `firestore.AsyncClient`.
+    """
+
+    def __init__(self, service: Optional[SimulatedService] = None):
+        self.service = service or SimulatedService("firestore")
+        self.asynchronous = False
+        # Collection path to the documents of the collection by ID
+        self._collections: Dict[Tuple[str, ...], Dict[str, Dict[str, Any]]] = {}
+        # Write count of every collection, and the vector matrices built at a write count
+        self._versions: Counter = Counter()
+        self._vector_matrices: Dict[Tuple[Any, ...], Tuple[int, List[str], np.ndarray]] = {}
+        self._lock = threading.RLock()
+
+    def as_async(self) -> "InMemoryFirestore":
+        """Return an async client sharing the documents of this client."""
+        client = InMemoryFirestore.__new__(InMemoryFirestore)
+        client.__dict__.update(self.__dict__)
+        client.asynchronous = True
+        return client
+
+    def collection(self, name: str) -> InMemoryCollection:
+        return InMemoryCollection(self, (name,))
+
+    def batch(self) -> InMemoryWriteBatch:
+        return InMemoryWriteBatch(self)
+
+    def get_all(
+        self, references: Iterable[InMemoryDocument], field_paths: Optional[List[str]] = None
+    ) -> Any:
+        references = list(references)
+        return self._stream(
+            "get_all",
+            lambda: [self._snapshot(reference, field_paths) for reference in references],
+        )
+
+    def document_count(self) -> int:
+        with self._lock:
+            return sum(len(documents) for documents in self._collections.values())
+
+    def _call(self, operation: str, run: Any) -> Any:
+        if self.asynchronous:
+            async def call() -> Any:
+                await self.service.wait_async(operation)
+                return run()
+
+            return call()
+
+        self.service.wait(operation)
+        return run()
+
+    def _stream(self, operation: str, run: Any) -> Any:
+        if self.asynchronous:
+            async def stream() -> AsyncGenerator[Any, None]:
+                await self.service.wait_async(operation)
+                for item in run():
+                    yield item
+
+            return stream()
+
+        def stream_sync() -> Iterable[Any]:
+            self.service.wait(operation)
+            yield from run()
+
+        return stream_sync()
+
+    def _snapshot(
+        self, reference: InMemoryDocument, field_paths: Optional[List[str]]
+    ) -> InMemorySnapshot:
+        with self._lock:
+            data = self._collections.get(reference._path[:-1], {}).get(reference.id)
+            return InMemorySnapshot(
+                reference, project_fields(data, field_paths) if data is not None else None
+            )
+
+    def _documents_of(self, path: Tuple[str, ...]) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return list(self._collections.get(path, {}).items())
+
+    def _vector_matrix(
+        self, path: Tuple[str, ...], vector_field: str, dimension: int
+    ) -> Tuple[List[str], np.ndarray]:
+        """Vectors of a collection as one matrix, rebuilt only after writes to the collection."""
+        with self._lock:
+            key = (path, vector_field, dimension)
+            cached = self._vector_matrices.get(key)
+            if cached is not None and cached[0] == self._versions[path]:
+                return cached[1], cached[2]
+
+            doc_ids = []
+            vectors = []
+            for doc_id, data in self._collections.get(path, {}).items():
+                vector = data.get(vector_field)
+                if isinstance(vector, Vector) and len(vector) == dimension:
+                    doc_ids.append(doc_id)
+                    vectors.append(list(vector))
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(len(doc_ids), dimension)
+            self._vector_matrices[key] = (self._versions[path], doc_ids, matrix)
+            return doc_ids, matrix
+
+    def _document_ids_of(self, path: Tuple[str, ...]) -> List[str]:
+        """IDs of the documents of a collection, including those only holding subcollections."""
+        with self._lock:
+            doc_ids = set(self._collections.get(path, {}))
+            depth = len(path)
+            for collection_path, documents in self._collections.items():
+                if (
+                    documents
+                    and len(collection_path) > depth + 1
+                    and collection_path[:depth] == path
+                ):
+                    doc_ids.add(collection_path[depth])
+            return sorted(doc_ids)
+
+    def _apply(self, writes: List[Tuple[str, InMemoryDocument, Any, bool]]) -> List[Any]:
+        with self._lock:
+            # Check every precondition before applying any write
+            for kind, reference, _, _ in writes:
+                exists = reference.id in self._collections.get(reference._path[:-1], {})
+                if kind == "create" and exists:
+                    raise AlreadyExists(f"Document already exists: {reference.path}")
+                if kind == "update" and not exists:
+                    raise NotFound(f"No document to update: {reference.path}")
+
+            for kind, reference, data, merge in writes:
+                documents = self._collections.setdefault(reference._path[:-1], {})
+                self._versions[reference._path[:-1]] += 1
+                if kind == "delete":
+                    documents.pop(reference.id, None)
+                elif kind == "update":
+                    current = documents[reference.id]
+                    updated = copy_value(current)
+                    for field_path, value in data.items():
+                        try:
+                            existing = get_field(current, field_path)
+                        except KeyError:
+                            existing = None
+                        set_field(updated, field_path, apply_transforms(value, existing))
+                    documents[reference.id] = updated
+                elif merge:
+                    documents[reference.id] = merge_fields(documents.get(reference.id, {}), data)
+                else:
+                    documents[reference.id] = apply_transforms(data, None)
+
+        return [None] * len(writes)
+
+
+def fake_embedding(text: str, dimension: int = FAKE_EMBEDDING_DIMENSION) -> List[float]:
+    """Deterministic unit embedding of a text, the sum of signed hashed dimensions of its tokens."""
+    values = [0.0] * dimension
+    for token in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=32).digest()
+        for offset in range(0, FAKE_EMBEDDING_DIMENSIONS_PER_TOKEN * 4, 4):
+            slot = int.from_bytes(digest[offset : offset + 3], "little") % dimension
+            values[slot] += 1.0 if digest[offset + 3] & 1 else -1.0
+
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [value / norm for value in values]
+
+
+class _FakeModels:
+    def __init__(self, service: SimulatedService, dimension: int):
+        self._service = service
+        self._dimension = dimension
+
+    def _embed(self, contents: Any) -> types.EmbedContentResponse:
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        return types.EmbedContentResponse(
+            embeddings=[
+                types.ContentEmbedding(values=fake_embedding(text, self._dimension))
+                for text in texts
+            ]
+        )
+
+    def embed_content(self, model: str, contents: Any, config: Any = None) -> types.EmbedContentResponse:
+        self._service.wait("embed_content")
+        return self._embed(contents)
+
+
+def fake_receipt_extraction(image_bytes: bytes) -> Dict[str, Any]:
+    """A plausible receipt read from an image, the same for the same bytes."""
+    rng = random.Random(hashlib.blake2b(image_bytes, digest_size=8).digest())
+    items = [
+        {
+            "name": rng.choice(FAKE_RECEIPT_ITEMS),
+            "price": float(rng.randint(5, 80) * 1000),
+            "quantity": 1,
+        }
+        for _ in range(rng.randint(1, 4))
+    ]
+    month, day = rng.randint(1, 12), rng.randint(1, 28)
+    return {
+        "is_receipt": True,
+        "store_name": rng.choice(FAKE_RECEIPT_STORES),
+        "transaction_time": f"2024-{month:02d}-{day:02d}T10:00:00.000000Z",
+        "total_amount": sum(item["price"] for item in items),
+        "currency": "IDR",
+        "purchased_items": items,
+    }
+
+
+class _FakeAsyncModels(_FakeModels):
+    async def embed_content(
+        self, model: str, contents: Any, config: Any = None
+    ) -> types.EmbedContentResponse:
+        await self._service.wait_async("embed_content")
+        return self._embed(contents)
+
+    async def generate_content(
+        self, model: str, contents: Any, config: Any = None
+    ) -> types.GenerateContentResponse:
+        """Answer a structured extraction request with the receipt of its first image."""
+        await self._service.wait_async("generate_content")
+        parts = contents if isinstance(contents, list) else [contents]
+        image = next(
+            part.inline_data.data
+            for part in parts
+            if isinstance(part, types.Part) and part.inline_data is not None
+        )
+        text = json.dumps(fake_receipt_extraction(image))
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))
+            ]
+        )
+
+
+class FakeGenAIClient:
+    """GenAI client stand-in serving deterministic embeddings on its sync and async sides."""
+
+    def __init__(
+        self,
+        service: Optional[SimulatedService] = None,
+        dimension: int = FAKE_EMBEDDING_DIMENSION,
+    ):
+        self.service = service or SimulatedService("genai")
+        self.models = _FakeModels(self.service, dimension)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(self.service, dimension))
+
+
+def substitute(value: Any, replacements: Dict[str, str]) -> Any:
+    """Replace `{name}` placeholders in the strings of a scripted value."""
+    if isinstance(value, str):
+        for name, replacement in replacements.items():
+            value = value.replace("{" + name + "}", replacement)
+        return value
+    if isinstance(value, dict):
+        return {key: substitute(item, replacements) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, replacements) for item in value]
+    return value
+
+
+class ScriptedLlm(BaseLlm):
+    """Model stand-in replaying a script of tool calls then a final answer.
+
+    The script is picked by the first of its keywords found in the last user
+    message, "default" otherwise. Each model call of the turn plays the next
+    step: {"function_call": {"name", "args"}} or {"text"}. `{image_id}` in a
+    step is replaced by the last image placeholder ID of the user message.
+    Streaming calls yield the text in chunks before the aggregated response.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model: str = "scripted-llm"
+    scripts: Dict[str, List[Dict[str, Any]]] = Field(default_factory=dict)
+    service: SimulatedService = Field(default_factory=lambda: SimulatedService("llm"))
+    stream_chunk_chars: int = 24
+
+    def _plan_step(self, llm_request: LlmRequest) -> Dict[str, Any]:
+        user_text = ""
+        steps_played = 0
+        for content in reversed(llm_request.contents):
+            parts = content.parts or []
+            if content.role == "user" and not any(part.function_response for part in parts):
+                user_text = " ".join(part.text for part in parts if part.text)
+                break
+            if content.role == "model":
+                steps_played += 1
+
+        script = self.scripts.get("default", [{"text": "# FINAL RESPONSE\nDone."}])
+        lowered = user_text.lower()
+        for keyword, steps in self.scripts.items():
+            if keyword != "default" and keyword in lowered:
+                script = steps
+                break
+
+        image_ids = re.findall(r"\[IMAGE-ID ([^\]]+)\]", user_text)
+        step = script[min(steps_played, len(script) - 1)]
+        return substitute(step, {"image_id": image_ids[-1] if image_ids else ""})
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        step = self._plan_step(llm_request)
+        await self.service.wait_async("generate_content")
+
+        if "function_call" in step:
+            yield LlmResponse(
+                content=types.Content(
+                    role="model",
+                    parts=[types.Part(function_call=types.FunctionCall(**step["function_call"]))],
+                )
+            )
+            return
+
+        text = step["text"]
+        if stream:
+            for start in range(0, len(text), self.stream_chunk_chars):
+                yield LlmResponse(
+                    content=types.Content(
+                        role="model",
+                        parts=[types.Part(text=text[start : start + self.stream_chunk_chars])],
+                    ),
+                    partial=True,
+                )
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+class LocalArtifactService(InMemoryArtifactService):
+    """Artifact store stand-in for GCS, keeping the artifacts in memory."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    service: SimulatedService = Field(default_factory=lambda: SimulatedService("artifacts"))
+
+    def save_artifact(self, **kwargs: Any) -> int:
+        self.service.wait("save_artifact")
+        return super().save_artifact(**kwargs)
+
+    def load_artifact(self, **kwargs: Any) -> Optional[types.Part]:
+        self.service.wait("load_artifact")
+        return super().load_artifact(**kwargs)
+
+    def list_artifact_keys(self, **kwargs: Any) -> List[str]:
+        self.service.wait("list_artifact_keys")
+        return super().list_artifact_keys(**kwargs)
+
+    def delete_artifact(self, **kwargs: Any) -> None:
+        self.service.wait("delete_artifact")
+        return super().delete_artifact(**kwargs)
+
+    def list_versions(self, **kwargs: Any) -> List[int]:
+        self.service.wait("list_versions")
+        return super().list_versions(**kwargs)
+
+
+class FakeServices:
+    """The stand-ins of every Google service, with their simulated latencies."""
+
+    def __init__(
+        self,
+        latency_ms: Optional[Dict[str, float]] = None,
+        jitter_ms: float = 0.0,
+        seed: int = 0,
+        scripts: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    ):
+        latency_ms = latency_ms or {}
+        self.services = {
+            name: SimulatedService(name, latency_ms.get(name, 0.0), jitter_ms, seed + offset)
+            for offset, name in enumerate(("firestore", "genai", "llm", "artifacts"))
+        }
+        self.firestore = InMemoryFirestore(self.services["firestore"])
+        self.genai = FakeGenAIClient(self.services["genai"])
+        self.llm = ScriptedLlm(scripts=scripts or {}, service=self.services["llm"])
+        self.artifacts = LocalArtifactService(service=self.services["artifacts"])
+
+    def reset_stats(self) -> None:
+        for service in self.services.values():
+            service.reset()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: service.stats() for name, service in self.services.items()}
+
+
+def install_fakes(fakes: FakeServices) -> None:
+    """Make the lazy clients of the application return the stand-ins.
+
+    The embedding cache and the index generations are replaced by fresh
+    in-memory instances, so that runs do not depend on files of previous runs.
+    """
+    from clients import CLIENTS
+    from expense_manager_agent import async_tools, tools  # noqa: F401, registers the clients
+    from expense_manager_agent.embedding_cache import EmbeddingCache
+    from expense_manager_agent.index_generations import IndexGenerations
+
+    CLIENTS["firestore"].override(fakes.firestore)
+    CLIENTS["async_firestore"].override(fakes.firestore.as_async())
+    CLIENTS["genai"].override(fakes.genai)
+    CLIENTS["embedding_cache"].override(
+        EmbeddingCache(max_entries=tools.SETTINGS.EMBEDDING_CACHE_MAX_ENTRIES)
+    )
+    CLIENTS["index_generations"].override(IndexGenerations())
@@ -0,0 +1,152 @@
+# benchmarks/history_callback.py
+"""Micro-benchmark of the image history callback as the history grows.
+
+Simulates a session where every turn uploads one receipt image without a
+placeholder, followed by a tool call, a tool response and a model answer.
+Before each model call the contents are deep copied from the history, as
+ADK does, and only the time spent in the history normalization is measured,
+for the previous stateless implementation and the memoized one.
+
+Usage:
+    uv run python -m benchmarks.history_callback --turns 10 20 40 80 160
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from google.genai import types
+
+from expense_manager_agent.callbacks import HistoryState, normalize_history
+
+
+def stateless_normalize_history(contents: List[types.Content]) -> None:
+    """The callback before memoization, hashing every image on every call."""
+    user_message_count = 0
+    for content in reversed(contents):
+        if (content.role == "user") and (content.parts[0].function_response is None):
+            user_message_count += 1
+            modified_content_parts = []
+            for idx, part in enumerate(content.parts):
+                if part.inline_data is None:
+                    modified_content_parts.append(part)
+                    continue
+
+                if (
+                    (idx + 1 >= len(content.parts))
+                    or (content.parts[idx + 1].text is None)
+                    or (not content.parts[idx + 1].text.startswith("[IMAGE-ID "))
+                ):
+                    image_hash_id = hashlib.sha256(part.inline_data.data).hexdigest()[:12]
+                    if user_message_count <= 3:
+                        modified_content_parts.append(part)
+                    modified_content_parts.append(
+                        types.Part(text=f"[IMAGE-ID {image_hash_id}]")
+                    )
+                elif user_message_count <= 3:
+                    modified_content_parts.append(part)
+
+            content.parts = modified_content_parts
+
+
+def build_turn(turn: int, image_bytes: int) -> List[types.Content]:
+    """Contents of one conversation turn with an uploaded receipt."""
+    return [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    inline_data=types.Blob(
+                        mime_type="image/jpeg", data=os.urandom(image_bytes)
+                    )
+                ),
+                types.Part(text=f"Please store receipt number {turn}"),
+            ],
+        ),
+        types.Content(
+            role="model",
+            parts=[
+                types.Part(
+                    function_call=types.FunctionCall(
+                        name="store_receipt_data", args={"image_id": str(turn)}
+                    )
+                )
+            ],
+        ),
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        name="store_receipt_data", response={"result": "stored"}
+                    )
+                )
+            ],
+        ),
+        types.Content(role="model", parts=[types.Part(text=f"Stored receipt {turn}")]),
+    ]
+
+
+def measure(
+    history: List[types.Content], normalize: Callable[[List[types.Content]], None], calls: int
+) -> float:
+    """Median milliseconds of one normalization over fresh copies of the history."""
+    timings = []
+    for _ in range(calls):
+        contents = copy.deepcopy(history)
+        start = time.perf_counter()
+        normalize(contents)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run_benchmark(turns: List[int], image_bytes: int, calls: int) -> List[Dict[str, float]]:
+    """Measure both implementations for each history length.
+
+    Args:
+        turns: History lengths, in conversation turns.
+        image_bytes: Size of each uploaded image.
+        calls: Model calls measured per history length.
+
+    Returns:
+        List[Dict[str, float]]: One row per history length.
+    """
+    history: List[types.Content] = []
+    state = HistoryState()
+    rows = []
+    for target in sorted(turns):
+        while len(history) < target * 4:
+            history.extend(build_turn(len(history) // 4, image_bytes))
+
+        # The first memoized call of each length also sees the new turns
+        measure(history, lambda contents: normalize_history(state, contents), 1)
+        rows.append(
+            {
+                "turns": target,
+                "stateless_ms": round(measure(history, stateless_normalize_history, calls), 3),
+                "memoized_ms": round(
+                    measure(history, lambda contents: normalize_history(state, contents), calls),
+                    3,
+                ),
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 20, 40, 80, 160])
+    parser.add_argument("--image-bytes", type=int, default=512 * 1024)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.turns, args.image_bytes, args.calls), indent=2))
+
+
+if __name__ == "__main__":
+    main()
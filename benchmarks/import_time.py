@@ -0,0 +1,101 @@
+# benchmarks/import_time.py
+"""Import time of the application modules, each in a fresh interpreter.
+
+Importing a module must not create clients or touch the network, so the
+modules are imported offline and the state of the lazy clients is checked
+after the import. The imports with the highest self time are listed from
+`python -X importtime` to show where startup time goes. With
+--max-seconds the run fails when a median import time exceeds the budget,
+to keep startup fast.
+
+Usage:
+    uv run python -m benchmarks.import_time --runs 5 --max-seconds 15
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+DEFAULT_MODULES = [
+    "settings",
+    "utils",
+    "expense_manager_agent.tools",
+    "expense_manager_agent.async_tools",
+    "backend",
+]
+
+# Printed by the child interpreter after the import, the lazy clients it created
+PROBE = "import json, clients; print(json.dumps({n: s['state'] for n, s in clients.get_client_status().items()}))"
+
+
+def parse_importtime(stderr: str, top: int) -> List[Dict[str, Any]]:
+    """Imports with the highest self time from `-X importtime` output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        entries.append({"module": name.strip(), "self_ms": int(self_us) / 1000})
+
+    return sorted(entries, key=lambda entry: entry["self_ms"], reverse=True)[:top]
+
+
+def measure_import(module: str, runs: int, top: int) -> Dict[str, Any]:
+    """Import a module in `runs` fresh interpreters and report its import time."""
+    durations = []
+    for run in range(runs):
+        command = [sys.executable, "-c", f"import {module}; {PROBE}"]
+        if run == 0:
+            command.insert(1, "-X")
+            command.insert(2, "importtime")
+
+        started = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+
+        if run == 0:
+            slowest = parse_importtime(result.stderr, top)
+            client_states = json.loads(result.stdout.strip().splitlines()[-1])
+        else:
+            durations.append(elapsed)
+
+    return {
+        "median_seconds": round(statistics.median(durations or [elapsed]), 3),
+        "clients_created_at_import": [
+            name for name, state in client_states.items() if state != "uninitialized"
+        ],
+        "slowest_imports": slowest,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=0.0)
+    args = parser.parse_args()
+
+    results = {module: measure_import(module, args.runs, args.top) for module in args.modules}
+    print(json.dumps(results, indent=2))
+
+    failures = [
+        module
+        for module, result in results.items()
+        if "error" in result
+        or result["clients_created_at_import"]
+        or (args.max_seconds and result["median_seconds"] > args.max_seconds)
+    ]
+    if failures:
+        print(f"Import checks failed for: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
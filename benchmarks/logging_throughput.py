@@ -0,0 +1,116 @@
+# benchmarks/logging_throughput.py
+"""Micro-benchmark of the time a request spends logging.
+
+Logs entries shaped like the chat response logs of the backend, with the
+raw model response, the sanitized response and the thinking process, and
+measures the time spent in the logging call. The previous implementation,
+encoding with json.dumps and writing to the stream on the calling thread,
+is compared to the queued writer. The stream can be slowed down to
+simulate a log collector reading stdout behind the application.
+
+Usage:
+    uv run python -m benchmarks.logging_throughput --entries 2000 --response-chars 20000
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import logger
+
+
+class SlowStream:
+    """Stream sleeping on each write, like a pipe whose reader is behind."""
+
+    def __init__(self, stream, write_delay_ms: float):
+        self.stream = stream
+        self.write_delay = write_delay_ms / 1000
+
+    def write(self, data: str) -> int:
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        return self.stream.write(data)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def build_synchronous_logger(stream) -> Callable[..., None]:
+    """The logger before the queued writer, encoding and writing on the calling thread."""
+    sync_logger = logging.getLogger("benchmarks.logging_throughput")
+    sync_logger.setLevel(logging.INFO)
+    sync_logger.propagate = False
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    sync_logger.handlers = [handler]
+
+    def info(message, **kwargs):
+        sync_logger.info(json.dumps({"severity": "INFO", "message": message, **kwargs}))
+
+    return info
+
+
+def measure(info: Callable[..., None], entries: int, response_chars: int) -> List[float]:
+    response = "Here is the summary of your receipts. " * (response_chars // 38 + 1)
+    timings = []
+    for number in range(entries):
+        started = time.perf_counter()
+        info(
+            "Processed response with attachments",
+            sanitized_response=response[:response_chars],
+            thinking_process=response[: response_chars // 2],
+            attachment_ids=[f"{number:012x}"],
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(timings: List[float], total_seconds: float) -> Dict[str, float]:
+    ordered = sorted(timings)
+    return {
+        "mean_us": round(statistics.mean(ordered) * 1000, 2),
+        "p99_us": round(ordered[int(len(ordered) * 0.99)] * 1000, 2),
+        "max_us": round(ordered[-1] * 1000, 2),
+        "total_seconds": round(total_seconds, 3),
+    }
+
+
+def run_benchmark(entries: int, response_chars: int, write_delay_ms: float) -> Dict[str, Dict]:
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        stream = SlowStream(devnull, write_delay_ms)
+
+        started = time.perf_counter()
+        timings = measure(build_synchronous_logger(stream), entries, response_chars)
+        results["synchronous"] = summarize(timings, time.perf_counter() - started)
+
+        logger.set_stream(stream)
+        started = time.perf_counter()
+        timings = measure(logger.info, entries, response_chars)
+        # The total includes writing the queued entries
+        logger.writer.flush()
+        results["queued"] = summarize(timings, time.perf_counter() - started)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--response-chars", type=int, default=20000)
+    parser.add_argument("--write-delay-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(
+        json.dumps(
+            run_benchmark(args.entries, args.response_chars, args.write_delay_ms), indent=2
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
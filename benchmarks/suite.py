@@ -0,0 +1,569 @@
+# benchmarks/suite.py
+"""Offline benchmark suite of the agent tools, the history callback, the response parsers and /chat.
+
+Gemini, the embedding model, Firestore and GCS are replaced by the in-process
+stand-ins of `benchmarks.fakes`, so the suite runs without credentials or
+network and its results are reproducible. The receipts of one user are seeded
+in the in-memory Firestore before the benchmarks run. Each benchmark reports
+its timings in milliseconds and, per iteration, the calls made to every
+service and the simulated latency they added. Services answer instantly by
+default; set a latency with `--latency SERVICE=MS` to see how the round trips
+of a request add up.
+
+Results are printed as JSON and written to `--output`. With `--baseline`, the
+median of every benchmark is compared with a previous output: a benchmark is
+a regression when it is slower than the threshold allows or calls a service
+more often, and the suite then exits with status 1. Compare results of the
+same host and options only.
+
+Usage:
+    uv run python -m benchmarks.suite --output baseline.json
+    uv run python -m benchmarks.suite --baseline baseline.json --threshold 0.2
+    uv run python -m benchmarks.suite --filter tools. --latency firestore=5 genai=30
+"""
+
+import argparse
+import asyncio
+import base64
+import copy
+import gc
+import inspect
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from google.adk.models.llm_request import LlmRequest
+from google.adk.runners import Runner
+from google.adk.tools import FunctionTool
+from google.cloud.firestore_v1.vector import Vector
+from PIL import Image, ImageDraw
+
+import logger
+from benchmarks.fakes import FakeServices, install_fakes
+from benchmarks.history_callback import build_turn
+from expense_manager_agent import async_tools, tools
+from expense_manager_agent.callbacks import modify_image_data_in_history
+from utils import (
+    ResponseStreamParser,
+    extract_attachment_ids_and_sanitize_response,
+    extract_thinking_process,
+)
+
+USER_ID = "benchmark-user"
+STORE_NAMES = ["Kopi Kenangan", "Indomaret", "Alfamart", "Hero Supermarket", "Gramedia", "Shell"]
+ITEM_NAMES = ["coffee", "milk", "bread", "rice", "eggs", "notebook", "fuel", "soap", "tea", "noodles"]
+CURRENCIES = ["IDR", "IDR", "IDR", "USD", "SGD"]
+
+RESPONSE_TEXT = """# THINKING PROCESS
+The user asked for their coffee receipts. I searched the receipts by meaning and
+found the matching ones, so I list them with their totals and show the images.
+
+# FINAL RESPONSE
+Here are your coffee purchases:
+
+- Kopi Kenangan, 2024-03-02, IDR 45,000
+- Kopi Kenangan, 2024-05-14, IDR 52,000
+- Hero Supermarket, 2024-06-01, IDR 125,000 (coffee beans and milk)
+
+You spent IDR 222,000 on coffee over these three receipts.
+
+```json
+{
+  "attachments": ["[IMAGE-ID 1a2b3c4d5e6f]", "[IMAGE-ID 6f5e4d3c2b1a]", "[IMAGE-ID 0a1b2c3d4e5f]"]
+}
+```
+"""
+
+CHAT_SCRIPTS: Dict[str, List[Dict[str, Any]]] = {
+    "store": [
+        {
+            "function_call": {
+                "name": "store_receipt_data",
+                "args": {
+                    "image_id": "{image_id}",
+                    "store_name": "Hero Supermarket",
+                    "transaction_time": "2024-06-01T10:00:00Z",
+                    "total_amount": 125000.0,
+                    "purchased_items": [
+                        {"name": "Coffee beans", "price": 95000.0},
+                        {"name": "Milk", "price": 30000.0},
+                    ],
+                    "currency": "IDR",
+                },
+            }
+        },
+        {
+            "text": "# THINKING PROCESS\nThe receipt was stored.\n\n# FINAL RESPONSE\n"
+            "I stored your Hero Supermarket receipt of IDR 125,000.\n\n"
+            '```json\n{"attachments": ["[IMAGE-ID {image_id}]"]}\n```\n'
+        },
+    ],
+    "coffee": [
+        {
+            "function_call": {
+                "name": "search_relevant_receipts_by_natural_language_query",
+                "args": {"query_text": "coffee", "limit": 5},
+            }
+        },
+        {
+            "text": "# THINKING PROCESS\nThe search returned the coffee receipts.\n\n"
+            "# FINAL RESPONSE\nYou spent IDR 222,000 on coffee over three receipts.\n\n"
+            '```json\n{"attachments": []}\n```\n'
+        },
+    ],
+}
+
+
+def build_receipt_fields(receipt_id: str, rng: random.Random) -> Dict[str, Any]:
+    """Fields of a plausible receipt, as the model passes them to the store tool."""
+    items = [
+        {
+            "name": rng.choice(ITEM_NAMES),
+            "price": float(rng.randint(5, 200) * 1000),
+            "quantity": rng.randint(1, 3),
+        }
+        for _ in range(rng.randint(1, 6))
+    ]
+    return {
+        "image_id": receipt_id,
+        "store_name": rng.choice(STORE_NAMES),
+        "transaction_time": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        f"T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z",
+        "total_amount": sum(item["price"] * item["quantity"] for item in items),
+        "purchased_items": items,
+        "currency": rng.choice(CURRENCIES),
+    }
+
+
+def seed_receipts(user_id: str, count: int, rng: random.Random) -> None:
+    """Store receipts with their rollups in the in-memory Firestore, as the bulk import does."""
+    receipts = [
+        tools.validate_receipt_data(**build_receipt_fields(f"seed{number:06d}", rng))
+        for number in range(count)
+    ]
+    embeddings = tools.embed_texts(
+        [tools.RECEIPT_DESC_FORMAT.format(**receipt) for receipt in receipts]
+    )
+    for start in range(0, count, 200):
+        chunk = receipts[start : start + 200]
+        batch = tools.get_db_client().batch()
+        for receipt, embedding in zip(chunk, embeddings[start : start + 200]):
+            batch.create(
+                tools.get_receipt_document(user_id, receipt["receipt_id"]),
+                {**receipt, tools.EMBEDDING_FIELD_NAME: Vector(embedding)},
+            )
+        tools.add_rollup_writes(batch, user_id, chunk)
+        batch.commit()
+
+
+def build_receipt_image(number: int) -> bytes:
+    """JPEG of a receipt-like page, different for every number."""
+    image = Image.new("RGB", (800, 1200), "white")
+    draw = ImageDraw.Draw(image)
+    for line in range(40):
+        draw.text((40, 30 + line * 28), f"ITEM {line:02d} .......... {number * 7 + line:>8}", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def summarize_timings(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {
+        "iterations": len(timings),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 4),
+        "median_ms": round(statistics.median(timings) * 1000, 4),
+        "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)] * 1000, 4),
+        "min_ms": round(timings[0] * 1000, 4),
+        "stdev_ms": round(statistics.stdev(timings) * 1000, 4) if len(timings) > 1 else 0.0,
+    }
+
+
+class BenchmarkSuite:
+    """Runs the selected benchmarks against the stand-ins and collects their results."""
+
+    def __init__(self, fakes: FakeServices, iterations: int, warmup: int, filters: List[str]):
+        self.fakes = fakes
+        self.iterations = iterations
+        self.warmup = warmup
+        self.filters = filters
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def selected(self, name: str) -> bool:
+        return not self.filters or any(pattern in name for pattern in self.filters)
+
+    async def measure(
+        self,
+        name: str,
+        call: Callable[..., Any],
+        setup: Optional[Callable[[], tuple]] = None,
+    ) -> None:
+        """Time `call`, awaiting it if it is a coroutine, on fresh arguments from `setup`.
+
+        Only the call is timed, the arguments are prepared before the clock starts.
+        """
+        if not self.selected(name):
+            return
+
+        async def run_once() -> float:
+            args = setup() if setup else ()
+            started = time.perf_counter()
+            result = call(*args)
+            if inspect.isawaitable(result):
+                await result
+            return time.perf_counter() - started
+
+        for _ in range(self.warmup):
+            await run_once()
+
+        gc.collect()
+        self.fakes.reset_stats()
+        timings = [await run_once() for _ in range(self.iterations)]
+
+        services = {}
+        for service, stats in self.fakes.stats().items():
+            if stats["calls"]:
+                services[service] = {
+                    "calls_per_iteration": {
+                        operation: round(count / self.iterations, 3)
+                        for operation, count in stats["calls"].items()
+                    },
+                    "simulated_ms_per_iteration": round(
+                        stats["simulated_ms"] / self.iterations, 3
+                    ),
+                }
+        self.results[name] = {**summarize_timings(timings), "services": services}
+
+    async def run_tool_benchmarks(self, receipt_count: int) -> None:
+        tool_context = SimpleNamespace(_invocation_context=SimpleNamespace(user_id=USER_ID))
+        rng = random.Random(1)
+        receipt_numbers = itertools.count()
+
+        def run_tool(function: Callable[..., Any]) -> Callable[[Dict[str, Any]], Any]:
+            tool = FunctionTool(function)
+            return lambda args: tool.run_async(args=args, tool_context=tool_context)
+
+        await self.measure(
+            "tools.store_receipt_data",
+            run_tool(async_tools.store_receipt_data),
+            lambda: (build_receipt_fields(f"bench{next(receipt_numbers):06d}", rng),),
+        )
+        await self.measure(
+            "tools.store_receipt_data.duplicate",
+            run_tool(async_tools.store_receipt_data),
+            lambda: (build_receipt_fields(f"seed{rng.randrange(receipt_count):06d}", rng),),
+        )
+        await self.measure(
+            "tools.get_receipt_data_by_image_id",
+            run_tool(async_tools.get_receipt_data_by_image_id),
+            lambda: ({"image_id": f"seed{rng.randrange(receipt_count):06d}"},),
+        )
+        await self.measure(
+            "tools.search_receipts_by_metadata_filter",
+            run_tool(async_tools.search_receipts_by_metadata_filter),
+            lambda: (
+                {
+                    "start_time": "2024-03-01T00:00:00Z",
+                    "end_time": "2024-05-31T23:59:59Z",
+                    "min_total_amount": 50000.0,
+                },
+            ),
+        )
+        await self.measure(
+            "tools.search_relevant_receipts_by_natural_language_query",
+            run_tool(async_tools.search_relevant_receipts_by_natural_language_query),
+            lambda: ({"query_text": f"{rng.choice(ITEM_NAMES)} at {rng.choice(STORE_NAMES)}"},),
+        )
+        await self.measure(
+            "tools.get_spending_summary",
+            run_tool(async_tools.get_spending_summary),
+            lambda: (
+                {
+                    "start_time": "2024-01-01T00:00:00Z",
+                    "end_time": "2024-12-31T23:59:59Z",
+                    "granularity": "month",
+                    "group_by_store": True,
+                },
+            ),
+        )
+
+    async def run_callback_benchmarks(self, history_turns: int, image_bytes: int) -> None:
+        history = []
+        for turn in range(history_turns):
+            history.extend(build_turn(turn, image_bytes))
+        session_ids = itertools.count()
+
+        # Every call is a new model call of a fresh session over the whole history
+        def fresh_session() -> tuple:
+            session = SimpleNamespace(user_id=USER_ID, id=f"history-{next(session_ids)}")
+            callback_context = SimpleNamespace(_invocation_context=SimpleNamespace(session=session))
+            return callback_context, LlmRequest(contents=copy.deepcopy(history))
+
+        # The next model call of the same session, as ADK copies the history again
+        session = SimpleNamespace(user_id=USER_ID, id="history-memoized")
+        memoized_context = SimpleNamespace(_invocation_context=SimpleNamespace(session=session))
+
+        await self.measure(
+            "callbacks.modify_image_data_in_history.cold",
+            modify_image_data_in_history,
+            fresh_session,
+        )
+        await self.measure(
+            "callbacks.modify_image_data_in_history.memoized",
+            modify_image_data_in_history,
+            lambda: (memoized_context, LlmRequest(contents=copy.deepcopy(history))),
+        )
+
+    async def run_parser_benchmarks(self) -> None:
+        def parse_stream(text: str, chunk_chars: int = 24) -> None:
+            parser = ResponseStreamParser()
+            for start in range(0, len(text), chunk_chars):
+                parser.feed(text[start : start + chunk_chars])
+            parser.close()
+
+        def parse_complete(text: str) -> None:
+            sanitized, _ = extract_attachment_ids_and_sanitize_response(text)
+            extract_thinking_process(sanitized)
+
+        await self.measure(
+            "parsers.extract_attachment_ids_and_sanitize_response",
+            extract_attachment_ids_and_sanitize_response,
+            lambda: (RESPONSE_TEXT,),
+        )
+        await self.measure(
+            "parsers.extract_thinking_process", extract_thinking_process, lambda: (RESPONSE_TEXT,)
+        )
+        await self.measure("parsers.complete_response", parse_complete, lambda: (RESPONSE_TEXT,))
+        await self.measure("parsers.response_stream_parser", parse_stream, lambda: (RESPONSE_TEXT,))
+
+    async def run_chat_benchmarks(self) -> None:
+        if not any(self.selected(name) for name in ("chat.store_receipt", "chat.search")):
+            return
+
+        # Imported here, the backend module builds the app and loads the agent
+        import backend
+        from expense_manager_agent.agent import root_agent
+        from expense_manager_agent.instrumentation import InstrumentedLlm
+        from session_store import BoundedSessionService
+
+        session_service = BoundedSessionService(
+            max_sessions=backend.SETTINGS.SESSION_CACHE_MAX_SESSIONS,
+            max_bytes=backend.SETTINGS.SESSION_CACHE_MAX_BYTES,
+            ttl_seconds=backend.SETTINGS.SESSION_CACHE_TTL_SECONDS,
+        )
+        backend.app_contexts.session_service = session_service
+        backend.app_contexts.artifact_service = self.fakes.artifacts
+        backend.app_contexts.expense_manager_agent_runner = Runner(
+            # The scripted model is wrapped like the real one, so instrumentation is measured
+            agent=root_agent.model_copy(
+                update={"model": InstrumentedLlm(model=self.fakes.llm.model, llm=self.fakes.llm)}
+            ),
+            app_name=backend.APP_NAME,
+            session_service=session_service,
+            artifact_service=self.fakes.artifacts,
+        )
+
+        numbers = itertools.count()
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+
+            async def post_chat(payload: Dict[str, Any]) -> None:
+                response = await client.post("/chat", json=payload, timeout=None)
+                response.raise_for_status()
+                if response.json().get("error"):
+                    raise RuntimeError(f"Chat request failed: {response.json()['error']}")
+
+            # New session and new receipt image on every request
+            def store_request() -> tuple:
+                number = next(numbers)
+                return (
+                    {
+                        "text": "Please store this receipt",
+                        "files": [
+                            {
+                                "serialized_image": base64.b64encode(
+                                    build_receipt_image(number)
+                                ).decode("utf-8"),
+                                "mime_type": "image/jpeg",
+                            }
+                        ],
+                        "session_id": f"chat-{number}",
+                        "user_id": USER_ID,
+                    },
+                )
+
+            def search_request() -> tuple:
+                return (
+                    {
+                        "text": "How much did I spend on coffee?",
+                        "session_id": f"chat-{next(numbers)}",
+                        "user_id": USER_ID,
+                    },
+                )
+
+            await self.measure("chat.store_receipt", post_chat, store_request)
+            await self.measure("chat.search", post_chat, search_request)
+
+
+def compare_results(
+    current: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> Dict[str, Dict[str, Any]]:
+    """Compare the medians and service calls of every benchmark with a baseline run.
+
+    Args:
+        current: Results of this run.
+        baseline: Results of the baseline run.
+        threshold: Allowed relative slowdown of the median, 0.2 for 20%.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The comparison of every benchmark of this run,
+            with its status "regression", "improvement", "unchanged" or "new".
+    """
+    comparison: Dict[str, Dict[str, Any]] = {}
+    for name, result in current["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            comparison[name] = {"status": "new"}
+            continue
+
+        ratio = (
+            result["median_ms"] / previous["median_ms"] if previous["median_ms"] else 1.0
+        )
+        more_calls = {}
+        for service, stats in result["services"].items():
+            previous_calls = (
+                previous.get("services", {}).get(service, {}).get("calls_per_iteration", {})
+            )
+            for operation, calls in stats["calls_per_iteration"].items():
+                if calls > previous_calls.get(operation, 0.0):
+                    more_calls[f"{service}.{operation}"] = {
+                        "baseline": previous_calls.get(operation, 0.0),
+                        "current": calls,
+                    }
+
+        if ratio > 1 + threshold or more_calls:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "unchanged"
+        comparison[name] = {
+            "status": status,
+            "median_ms": result["median_ms"],
+            "baseline_median_ms": previous["median_ms"],
+            "ratio": round(ratio, 3),
+        }
+        if more_calls:
+            comparison[name]["more_calls"] = more_calls
+
+    return comparison
+
+
+def parse_latencies(values: List[str]) -> Dict[str, float]:
+    latencies = {}
+    for value in values:
+        service, _, latency = value.partition("=")
+        if service not in ("firestore", "genai", "llm", "artifacts") or not latency:
+            raise argparse.ArgumentTypeError(f"Invalid latency {value}, use SERVICE=MS")
+        latencies[service] = float(latency)
+    return latencies
+
+
+async def run_suite(args: argparse.Namespace, latencies: Dict[str, float]) -> Dict[str, Any]:
+    fakes = FakeServices(
+        latency_ms=latencies, jitter_ms=args.jitter_ms, seed=args.seed, scripts=CHAT_SCRIPTS
+    )
+    install_fakes(fakes)
+    seed_receipts(USER_ID, args.receipts, random.Random(args.seed))
+
+    suite = BenchmarkSuite(fakes, args.iterations, args.warmup, args.filter)
+    await suite.run_tool_benchmarks(args.receipts)
+    await suite.run_callback_benchmarks(args.history_turns, args.image_bytes)
+    await suite.run_parser_benchmarks()
+    await suite.run_chat_benchmarks()
+
+    settings = tools.SETTINGS
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "options": {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "receipts": args.receipts,
+            "history_turns": args.history_turns,
+            "image_bytes": args.image_bytes,
+            "latency_ms": latencies,
+            "jitter_ms": args.jitter_ms,
+            "seed": args.seed,
+        },
+        "settings": {
+            "SEARCH_MODE": settings.SEARCH_MODE,
+            "VECTOR_INDEX_ENABLED": settings.VECTOR_INDEX_ENABLED,
+            "HISTORY_TOKEN_BUDGET": settings.HISTORY_TOKEN_BUDGET,
+            "IMAGE_PREPROCESS_ENABLED": settings.IMAGE_PREPROCESS_ENABLED,
+        },
+        "benchmarks": suite.results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--receipts", type=int, default=1000)
+    parser.add_argument("--history-turns", type=int, default=40)
+    parser.add_argument("--image-bytes", type=int, default=64 * 1024)
+    parser.add_argument(
+        "--latency", nargs="*", default=[], metavar="SERVICE=MS",
+        help="Simulated latency of firestore, genai, llm or artifacts calls",
+    )
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filter", nargs="*", default=[], help="Only run benchmarks containing one of these")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results of a previous --output")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # The application logs to stdout, keep it for the JSON results
+    logger.set_stream(open(os.devnull, "w"))
+
+    results = asyncio.run(run_suite(args, parse_latencies(args.latency)))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        comparison = compare_results(results, baseline, args.threshold)
+        results["comparison"] = {
+            "threshold": args.threshold,
+            # Timings of runs with different options are not comparable
+            "same_options": baseline.get("options") == results["options"],
+            "benchmarks": comparison,
+        }
+        regressions = [name for name, row in comparison.items() if row["status"] == "regression"]
+        results["comparison"]["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
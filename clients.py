@@ -0,0 +1,155 @@
+import threading
+import time
+from functools import update_wrapper
+from typing import Any, Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+import logger
+
+T = TypeVar("T")
+
+# Backoff between the retries of a failed client outside of its use, doubling up to the maximum
+CLIENT_RETRY_BACKOFF_SECONDS = 1.0
+CLIENT_RETRY_MAX_BACKOFF_SECONDS = 60.0
+
+
+class LazyClient(Generic[T]):
+    """Process-wide client created by its factory on first use.
+
+    Importing a module that declares clients has no side effect, the factory
+    only runs when the client is first requested, once per process. A failed
+    initialization is recorded and retried on the next request, or by
+    `retry_clients` once its backoff has elapsed.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._client: Optional[T] = None
+        self._lock = threading.Lock()
+        self.state = "uninitialized"
+        self.error = ""
+        self.init_seconds: Optional[float] = None
+        self.failures = 0
+        self.retry_at = 0.0
+        update_wrapper(self, factory)
+
+    def __call__(self) -> T:
+        client = self._client
+        if client is not None:
+            return client
+
+        with self._lock:
+            if self._client is None:
+                self.state = "initializing"
+                started = time.perf_counter()
+                try:
+                    self._client = self._factory()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = str(e)
+                    self.failures += 1
+                    self.retry_at = time.monotonic() + min(
+                        CLIENT_RETRY_BACKOFF_SECONDS * 2 ** (self.failures - 1),
+                        CLIENT_RETRY_MAX_BACKOFF_SECONDS,
+                    )
+                    logger.error(
+                        "Client initialization failed", client=self.name, error_message=str(e)
+                    )
+                    raise
+
+                self.init_seconds = round(time.perf_counter() - started, 3)
+                self.state = "ready"
+                self.error = ""
+                self.failures = 0
+                logger.info(
+                    "Client initialized", client=self.name, init_seconds=self.init_seconds
+                )
+
+            return self._client
+
+    def override(self, client: T) -> None:
+        """Use the given client instead of creating one, e.g. an offline stand-in."""
+        with self._lock:
+            self._client = client
+            self.state = "ready"
+            self.error = ""
+            self.init_seconds = 0.0
+
+    @property
+    def initialized(self) -> bool:
+        return self._client is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "init_seconds": self.init_seconds,
+            "failures": self.failures,
+        }
+
+
+# Every lazy client of the process by name, in declaration order
+CLIENTS: Dict[str, LazyClient] = {}
+
+
+def lazy_client(name: str) -> Callable[[Callable[[], T]], LazyClient[T]]:
+    """Turn a client factory into a memoized getter registered for warm-up and readiness.
+
+    Args:
+        name: Name of the dependency reported by the readiness endpoint.
+
+    Returns:
+        The decorator wrapping the factory.
+    """
+
+    def decorator(factory: Callable[[], T]) -> LazyClient[T]:
+        client = LazyClient(name, factory)
+        CLIENTS[name] = client
+        return client
+
+    return decorator
+
+
+def warm_up_clients(names: Iterable[str] | None = None) -> Dict[str, Dict[str, Any]]:
+    """Create the registered clients ahead of the first request.
+
+    Failures are logged and reported, the client is created again on first use.
+
+    Args:
+        names: The clients to create, all registered clients by default.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The status of every registered client.
+    """
+    for name in list(names or CLIENTS):
+        try:
+            CLIENTS[name]()
+        except Exception:
+            continue
+
+    return get_client_status()
+
+
+def retry_clients(include_uninitialized: bool = False) -> None:
+    """Create again the failed clients whose retry backoff has elapsed.
+
+    A failed client is otherwise only retried when it is used, which does not
+    happen while the readiness probe keeps the traffic away from the process.
+
+    Args:
+        include_uninitialized: Also create the clients that were never requested.
+    """
+    now = time.monotonic()
+    for client in list(CLIENTS.values()):
+        if (client.state == "failed" and now >= client.retry_at) or (
+            include_uninitialized and client.state == "uninitialized"
+        ):
+            try:
+                client()
+            except Exception:
+                continue
+
+
+def get_client_status() -> Dict[str, Dict[str, Any]]:
+    """Report the initialization state of every registered client."""
+    return {name: client.status() for name, client in CLIENTS.items()}
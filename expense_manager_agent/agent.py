@@ -1,15 +1,18 @@
 # expense_manager_agent/agent.py
 
 from google.adk.agents import Agent
-from expense_manager_agent.tools import (
+from expense_manager_agent.async_tools import (
     store_receipt_data,
     search_receipts_by_metadata_filter,
     search_relevant_receipts_by_natural_language_query,
     get_receipt_data_by_image_id,
+    get_spending_summary,
 )
-from expense_manager_agent.callbacks import modify_image_data_in_history
+from expense_manager_agent.callbacks import prepare_llm_request
+from expense_manager_agent.instrumentation import InstrumentedLlm, TracedFunctionTool
 import os
 from settings import get_settings
+from google.adk.models import LLMRegistry
 from google.adk.planners import BuiltInPlanner
 from google.genai import types
 
@@ -22,25 +25,31 @@ os.environ["GOOGLE_GENAI_USE_VERTEXAI"] = "TRUE"
 current_dir = os.path.dirname(os.path.abspath(__file__))
 prompt_path = os.path.join(current_dir, "task_prompt.md")
 with open(prompt_path, "r") as file:
-    task_prompt = file.read()
+    task_prompt = file.read().replace("BASE_CURRENCY", SETTINGS.BASE_CURRENCY)
 
 root_agent = Agent(
     name="expense_manager_agent",
-    model="gemini-2.5-flash",
+    model=InstrumentedLlm(
+        model="gemini-2.5-flash", llm=LLMRegistry.new_llm("gemini-2.5-flash")
+    ),
     description=(
         "Personal expense agent to help user track expenses, analyze receipts, and manage their financial records"
     ),
     instruction=task_prompt,
     tools=[
-        store_receipt_data,
-        get_receipt_data_by_image_id,
-        search_receipts_by_metadata_filter,
-        search_relevant_receipts_by_natural_language_query,
+        TracedFunctionTool(tool)
+        for tool in (
+            store_receipt_data,
+            get_receipt_data_by_image_id,
+            search_receipts_by_metadata_filter,
+            search_relevant_receipts_by_natural_language_query,
+            get_spending_summary,
+        )
     ],
     planner=BuiltInPlanner(
         thinking_config=types.ThinkingConfig(
             thinking_budget=2048,
         )
     ),
-    before_model_callback=modify_image_data_in_history,
+    before_model_callback=prepare_llm_request,
 )
\ No newline at end of file
@@ -0,0 +1,547 @@
+# expense_manager_agent/async_tools.py
+
+import asyncio
+import random
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+
+from google.adk.tools import ToolContext
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
+from google.cloud.firestore_v1.vector import Vector
+
+from expense_manager_agent.tools import (
+    EMBEDDING_FIELD_NAME,
+    EMBEDDING_MODEL,
+    HYBRID_CANDIDATES_PER_RESULT,
+    RECEIPT_DESC_FORMAT,
+    RECEIPT_FIELDS,
+    RECEIPTS_SUBCOLLECTION,
+    ROLLUPS_SUBCOLLECTION,
+    SETTINGS,
+    build_metadata_query,
+    build_rollup_increments,
+    check_vector_recall,
+    format_metadata_results,
+    format_search_results,
+    fuse_search_results,
+    get_embedding_cache,
+    get_genai_client,
+    get_receipt_id_filter,
+    get_tool_user_id,
+    get_vector_index,
+    lexical_fast_path_receipts,
+    plan_spending_summary,
+    record_stored_receipt,
+    sanitize_image_id,
+    search_lexical_index,
+    summarize_spending,
+    validate_document_id,
+    validate_receipt_data,
+)
+from clients import lazy_client
+from telemetry import record_cache_lookup, stage
+
+T = TypeVar("T")
+
+
+@lazy_client("async_firestore")
+def get_async_db_client() -> firestore.AsyncClient:
+    """
+    Get the process-wide async Firestore client, created on first use.
+
+    The client shares one gRPC channel between all requests of the process. Embedding
+    requests go through the connection pool of the async side of the shared GenAI client.
+    """
+    return firestore.AsyncClient(project=SETTINGS.GCLOUD_PROJECT_ID)
+
+
+async def with_timeout(
+    awaitable: Awaitable[T], timeout: float, operation: str, stage_name: str = "firestore"
+) -> T:
+    """
+    Await a data-plane call, cancelling it after a timeout, as a traced stage.
+
+    Raises:
+        TimeoutError: If the call did not complete in time.
+    """
+    with stage(stage_name, operation.lower().replace(" ", "_")):
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except TimeoutError:
+            raise TimeoutError(f"{operation} timed out after {timeout} seconds")
+
+
+async def collect(stream: Any) -> List[Any]:
+    """Read every snapshot of an async query stream."""
+    return [snapshot async for snapshot in stream]
+
+
+def get_async_receipts_collection(user_id: str) -> firestore.AsyncCollectionReference:
+    """
+    Get the receipts collection of a user, for the async client.
+
+    Raises:
+        ValueError: If the user ID cannot be used as a document ID.
+    """
+    return (
+        get_async_db_client()
+        .collection(SETTINGS.DB_USER_COLLECTION_NAME)
+        .document(validate_document_id(user_id, "user ID"))
+        .collection(RECEIPTS_SUBCOLLECTION)
+    )
+
+
+def get_async_rollups_collection(user_id: str) -> firestore.AsyncCollectionReference:
+    """
+    Get the spending rollups collection of a user, for the async client.
+
+    Raises:
+        ValueError: If the user ID cannot be used as a document ID.
+    """
+    return (
+        get_async_db_client()
+        .collection(SETTINGS.DB_USER_COLLECTION_NAME)
+        .document(validate_document_id(user_id, "user ID"))
+        .collection(ROLLUPS_SUBCOLLECTION)
+    )
+
+
+def get_async_receipt_document(
+    user_id: str, image_id: str
+) -> firestore.AsyncDocumentReference:
+    """
+    Get the reference of a receipt document, for the async client.
+
+    Raises:
+        ValueError: If the user ID or the image ID cannot be used as a document ID.
+    """
+    return get_async_receipts_collection(user_id).document(
+        validate_document_id(image_id, "image ID")
+    )
+
+
+async def receipt_exists(user_id: str, image_id: str) -> bool:
+    """
+    Check whether a receipt is stored, skipping the database read when the ID was never seen.
+
+    The receipt ID filter is loaded in a worker thread, its first load lists the
+    receipts of the user.
+
+    Args:
+        user_id (str): The ID of the user.
+        image_id (str): The sanitized receipt image ID.
+
+    Returns:
+        bool: True if the receipt is stored.
+    """
+    id_filter = await asyncio.to_thread(get_receipt_id_filter, user_id)
+    skip_read = image_id not in id_filter
+    record_cache_lookup("receipt_id_filter", skip_read)
+    if skip_read:
+        return False
+
+    snapshot = await with_timeout(
+        get_async_receipt_document(user_id, image_id).get(field_paths=["receipt_id"]),
+        SETTINGS.FIRESTORE_TIMEOUT_SECONDS,
+        "Receipt read",
+    )
+    return snapshot.exists
+
+
+async def embed_text(text: str) -> List[float]:
+    """
+    Get the embedding of a text, served from the embedding cache when possible.
+
+    Args:
+        text (str): The text to embed.
+
+    Returns:
+        List[float]: The embedding values.
+    """
+    embedding = get_embedding_cache().get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    result = await with_timeout(
+        get_genai_client().aio.models.embed_content(model=EMBEDDING_MODEL, contents=text),
+        SETTINGS.EMBEDDING_TIMEOUT_SECONDS,
+        "Embedding request",
+        stage_name="embedding",
+    )
+    embedding = result.embeddings[0].values
+    get_embedding_cache().put(EMBEDDING_MODEL, text, embedding)
+
+    return embedding
+
+
+async def find_nearest_receipts_in_firestore(
+    user_id: str, query_embedding: List[float], limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Run a Firestore vector search over the receipts of a user and return them without embeddings.
+
+    Args:
+        user_id (str): The ID of the user.
+        query_embedding (List[float]): The query embedding.
+        limit (int): Maximum number of results to return.
+
+    Returns:
+        List[Dict[str, Any]]: The receipt data ordered from nearest to farthest.
+    """
+    vector_query = get_async_receipts_collection(user_id).find_nearest(
+        vector_field=EMBEDDING_FIELD_NAME,
+        query_vector=Vector(query_embedding),
+        distance_measure=DistanceMeasure.EUCLIDEAN,
+        limit=limit,
+    )
+    snapshots = await with_timeout(
+        collect(vector_query.stream()),
+        SETTINGS.FIRESTORE_TIMEOUT_SECONDS,
+        "Vector search",
+    )
+
+    receipts = []
+    for doc in snapshots:
+        data = doc.to_dict()
+        data.pop(EMBEDDING_FIELD_NAME, None)
+        receipts.append(data)
+
+    return receipts
+
+
+async def search_receipts_by_vector(
+    user_id: str, query_embedding: List[float], limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Find the receipts of a user nearest to a query embedding.
+
+    The local vector index, when enabled, is loaded and searched in a worker thread.
+
+    Args:
+        user_id (str): The ID of the user.
+        query_embedding (List[float]): The query embedding.
+        limit (int): Maximum number of results to return.
+
+    Returns:
+        List[Dict[str, Any]]: The receipt data ordered from nearest to farthest.
+    """
+    index = await asyncio.to_thread(get_vector_index, user_id)
+    if index is None:
+        return await find_nearest_receipts_in_firestore(user_id, query_embedding, limit)
+
+    results = await asyncio.to_thread(index.search, query_embedding, limit)
+    receipts = [data for _, _, data in results]
+
+    # Periodically verify the local index against Firestore
+    if random.random() < SETTINGS.VECTOR_INDEX_RECALL_SAMPLE_RATE:
+        receipts = check_vector_recall(
+            receipts,
+            await find_nearest_receipts_in_firestore(user_id, query_embedding, limit),
+        )
+
+    return receipts
+
+
+async def write_receipt(
+    user_id: str, receipt: Dict[str, Any], embedding: List[float]
+) -> bool:
+    """
+    Write a validated receipt with its spending rollup increments and add it to the local indexes.
+
+    Args:
+        user_id (str): The ID of the user owning the receipt.
+        receipt (Dict[str, Any]): The receipt document built by `validate_receipt_data`.
+        embedding (List[float]): The embedding of the receipt description.
+
+    Returns:
+        bool: True if the receipt was stored, False if it already exists.
+    """
+    # Create-if-absent write, a concurrent store of the same receipt fails here
+    # and its rollup increments in the same batch are not applied
+    batch = get_async_db_client().batch()
+    batch.create(
+        get_async_receipt_document(user_id, receipt["receipt_id"]),
+        {**receipt, EMBEDDING_FIELD_NAME: Vector(embedding)},
+    )
+    rollups_collection = get_async_rollups_collection(user_id)
+    for rollup_id, data in build_rollup_increments([receipt]).items():
+        batch.set(rollups_collection.document(rollup_id), data, merge=True)
+    try:
+        await with_timeout(batch.commit(), SETTINGS.FIRESTORE_TIMEOUT_SECONDS, "Receipt write")
+    except AlreadyExists:
+        return False
+
+    await asyncio.to_thread(record_stored_receipt, user_id, receipt, embedding)
+    return True
+
+
+async def store_receipt_data(
+    image_id: str,
+    store_name: str,
+    transaction_time: str,
+    total_amount: float,
+    purchased_items: List[Dict[str, Any]],
+    tool_context: ToolContext,
+    currency: str = "IDR",
+) -> str:
+    """
+    Store receipt data in the database.
+
+    Args:
+        image_id (str): The unique identifier of the image. For example IMAGE-POSITION 0-ID 12345,
+            the ID of the image is 12345.
+        store_name (str): The name of the store.
+        transaction_time (str): The time of purchase, in ISO format ("YYYY-MM-DDTHH:MM:SS.ssssssZ").
+        total_amount (float): The total amount spent.
+        purchased_items (List[Dict[str, Any]]): A list of items purchased with their prices. Each item must have:
+            - name (str): The name of the item.
+            - price (float): The price of the item.
+            - quantity (int, optional): The quantity of the item. Defaults to 1 if not provided.
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
+        currency (str, optional): The currency of the transaction, can be derived from the store location.
+            If unsure, default is "IDR".
+
+    Returns:
+        str: A success message with the receipt ID.
+
+    Raises:
+        Exception: If the operation failed or input is invalid.
+    """
+    try:
+        # In case of it provide full image placeholder, extract the id string
+        image_id = sanitize_image_id(image_id)
+        user_id = get_tool_user_id(tool_context)
+
+        # Check if the receipt already exists
+        if await receipt_exists(user_id, image_id):
+            return f"Receipt with ID {image_id} already exists"
+
+        receipt = validate_receipt_data(
+            image_id=image_id,
+            store_name=store_name,
+            transaction_time=transaction_time,
+            total_amount=total_amount,
+            purchased_items=purchased_items,
+            currency=currency,
+        )
+
+        # Create a combined text from all receipt information for better embedding
+        embedding = await embed_text(RECEIPT_DESC_FORMAT.format(**receipt))
+
+        if not await write_receipt(user_id, receipt, embedding):
+            return f"Receipt with ID {image_id} already exists"
+
+        return f"Receipt stored successfully with ID: {image_id}"
+    except Exception as e:
+        raise Exception(f"Failed to store receipt: {str(e)}")
+
+
+async def get_spending_summary(
+    start_time: str,
+    end_time: str,
+    tool_context: ToolContext,
+    granularity: str = "month",
+    group_by_store: bool = False,
+) -> Dict[str, Any]:
+    """
+    Summarize spending within a date range: receipt counts, total amounts and averages
+    per currency, grouped by day, week or month and optionally by store.
+    Use this tool for any question about totals, counts or averages of spending
+    instead of adding up receipts from the search tools.
+
+    Args:
+        start_time (str): The start of the range (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
+            Only the UTC date is used, the range covers whole days.
+        end_time (str): The end of the range, inclusive (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
+            Only the UTC date is used, the range covers whole days.
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
+        granularity (str, optional): How to group the results, one of "day", "week" or "month".
+            Defaults to "month".
+        group_by_store (bool, optional): Also break down each period by store. Defaults to False.
+
+    Returns:
+        Dict[str, Any]: A dictionary with the following keys:
+            - granularity (str): The grouping used.
+            - start_date (str): The first date of the range.
+            - end_date (str): The last date of the range.
+            - periods (List[Dict[str, Any]]): One entry per period with its `period` label,
+              `start_date`, `end_date` (clipped to the range), `by_currency` totals and,
+              if requested, `by_store` totals. Each totals entry has `count`, `total` and `average`.
+            - overall (Dict[str, Dict[str, float]]): The totals of the whole range per currency.
+
+    Raises:
+        Exception: If the summary failed or input is invalid.
+    """
+    try:
+        start_date, end_date, periods = plan_spending_summary(
+            start_time, end_time, granularity
+        )
+
+        rollups_collection = get_async_rollups_collection(get_tool_user_id(tool_context))
+        snapshots = await with_timeout(
+            collect(
+                get_async_db_client().get_all(
+                    [
+                        rollups_collection.document(rollup_id)
+                        for *_, rollup_ids in periods
+                        for rollup_id in rollup_ids
+                    ]
+                )
+            ),
+            SETTINGS.FIRESTORE_TIMEOUT_SECONDS,
+            "Rollup read",
+        )
+        rollups = {
+            snapshot.id: snapshot.to_dict() for snapshot in snapshots if snapshot.exists
+        }
+
+        return summarize_spending(
+            granularity, start_date, end_date, periods, rollups, group_by_store
+        )
+    except Exception as e:
+        raise Exception(f"Error summarizing spending: {str(e)}")
+
+
+async def search_receipts_by_metadata_filter(
+    start_time: str,
+    end_time: str,
+    tool_context: ToolContext,
+    min_total_amount: float = -1.0,
+    max_total_amount: float = -1.0,
+    page_size: int = 20,
+    page_token: str = "",
+) -> str:
+    """
+    Filter receipts by metadata within a specific time range and optionally by amount.
+    Results are ordered by transaction time and returned one page at a time.
+
+    Args:
+        start_time (str): The start datetime for the filter (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
+        end_time (str): The end datetime for the filter (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
+        min_total_amount (float): The minimum total amount for the filter (inclusive), in the base
+            currency. Receipts in other currencies are compared by their converted amount, receipts
+            in a currency without an exchange rate are only returned without amount filters. Defaults to -1.
+        max_total_amount (float): The maximum total amount for the filter (inclusive), in the base
+            currency. Receipts in other currencies are compared by their converted amount, receipts
+            in a currency without an exchange rate are only returned without amount filters. Defaults to -1.
+        page_size (int, optional): Maximum number of receipts to return, at most 100. Defaults to 20.
+        page_token (str, optional): The next page token returned by a previous call with the same
+            filters, to get the following receipts. Defaults to "" for the first page.
+
+    Returns:
+        str: A string containing the list of receipt data matching all applied filters,
+            followed by the next page token if more receipts match.
+
+    Raises:
+        Exception: If the search failed or input is invalid.
+    """
+    try:
+        query, page_size = build_metadata_query(
+            get_async_receipts_collection(get_tool_user_id(tool_context)),
+            start_time,
+            end_time,
+            min_total_amount,
+            max_total_amount,
+            page_size,
+            page_token,
+        )
+        snapshots = await with_timeout(
+            collect(query.stream()), SETTINGS.FIRESTORE_TIMEOUT_SECONDS, "Receipt search"
+        )
+
+        return format_metadata_results(snapshots, page_size)
+    except Exception as e:
+        raise Exception(f"Error filtering receipts: {str(e)}")
+
+
+async def search_relevant_receipts_by_natural_language_query(
+    query_text: str, tool_context: ToolContext, limit: int = 5
+) -> str:
+    """
+    Search for receipts with content most similar to the query, matching store and item
+    names exactly and by meaning.
+    This tool can be use for user query that is difficult to translate into metadata filters.
+    Such as store name or item name which sensitive to string matching.
+    Use this tool if you cannot utilize the search by metadata filter tool.
+
+    Args:
+        query_text (str): The search text (e.g., "coffee", "dinner", "groceries").
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
+        limit (int, optional): Maximum number of results to return (default: 5).
+
+    Returns:
+        str: A string containing the list of contextually relevant receipt data.
+
+    Raises:
+        Exception: If the search failed or input is invalid.
+    """
+    try:
+        user_id = get_tool_user_id(tool_context)
+        receipts: Optional[List[Dict[str, Any]]] = None
+
+        lexical_hits = []
+        if SETTINGS.SEARCH_MODE == "hybrid":
+            # Building the index and scoring the receipts both block, off the event loop
+            lexical_hits = await asyncio.to_thread(
+                search_lexical_index, user_id, query_text, limit * HYBRID_CANDIDATES_PER_RESULT
+            )
+            receipts = lexical_fast_path_receipts(lexical_hits, limit)
+
+        if receipts is None:
+            # Generate embedding for the query text
+            query_embedding = await embed_text(query_text)
+
+            if lexical_hits:
+                vector_receipts = await search_receipts_by_vector(
+                    user_id, query_embedding, limit * HYBRID_CANDIDATES_PER_RESULT
+                )
+                receipts = fuse_search_results(lexical_hits, vector_receipts, limit)
+            else:
+                receipts = await search_receipts_by_vector(user_id, query_embedding, limit)
+
+        return format_search_results(receipts)
+    except Exception as e:
+        raise Exception(f"Error searching receipts: {str(e)}")
+
+
+async def get_receipt_data_by_image_id(
+    image_id: str, tool_context: ToolContext
+) -> Dict[str, Any]:
+    """
+    Retrieve receipt data from the database using the image_id.
+
+    Args:
+        image_id (str): The unique identifier of the receipt image. For example, if the placeholder is
+            [IMAGE-ID 12345], the ID to use is 12345.
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
+
+    Returns:
+        Dict[str, Any]: A dictionary containing the receipt data with the following keys:
+            - receipt_id (str): The unique identifier of the receipt image.
+            - store_name (str): The name of the store.
+            - transaction_time (str): The time of purchase in UTC.
+            - total_amount (float): The total amount spent.
+            - currency (str): The currency of the transaction.
+            - purchased_items (List[Dict[str, Any]]): List of items purchased with their details.
+        Returns an empty dictionary if no receipt is found.
+    """
+    # In case of it provide full image placeholder, extract the id string
+    image_id = sanitize_image_id(image_id)
+
+    # Receipts are keyed by their image ID, so this is a single point read
+    try:
+        doc_ref = get_async_receipt_document(get_tool_user_id(tool_context), image_id)
+    except ValueError:
+        return {}
+
+    snapshot = await with_timeout(
+        doc_ref.get(field_paths=RECEIPT_FIELDS),
+        SETTINGS.FIRESTORE_TIMEOUT_SECONDS,
+        "Receipt read",
+    )
+    if not snapshot.exists:
+        return {}
+
+    return snapshot.to_dict()
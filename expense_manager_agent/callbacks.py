@@ -1,55 +1,293 @@
 # expense_manager_agent/callbacks.py
 
 import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
 from google.genai import types
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.models.llm_request import LlmRequest
+from expense_manager_agent.history_compaction import (
+    compact_contents,
+    estimate_content_tokens,
+    is_user_message,
+    record_compaction,
+)
+from settings import get_settings
+import logger
+
+SETTINGS = get_settings()
+
+# Only the last user messages keep their image data
+IMAGE_HISTORY_USER_MESSAGES = 3
+
+# Number of sessions whose history state is kept in memory
+HISTORY_STATE_MAX_SESSIONS = 1024
+
+# Total size of the image bytes memoized by the history states kept in memory
+HISTORY_STATE_MAX_IMAGE_BYTES = 256 * 1024 * 1024
+
+# A normalization plan lists the parts of a message as ("part", index),
+# ("image", index) or ("placeholder", part) entries, placeholder parts are
+# created once and shared by the requests of the session
+PartPlan = List[Tuple[str, int | types.Part]]
+
+
+@dataclass
+class HistoryState:
+    """Normalization state of the conversation history of one session.
+
+    ADK rebuilds `llm_request.contents` as deep copies of the session events
+    before every model call, but the copies share the immutable image bytes
+    and texts of the events, so their identity is stable across calls.
+    """
+
+    # id(image bytes) -> (image bytes, hash ID), the bytes are referenced so their id is not reused
+    image_hashes: dict[int, Tuple[bytes, str]] = field(default_factory=dict)
+    # Total size of the image bytes in the memo
+    image_bytes: int = 0
+    # Number of leading contents already normalized
+    watermark: int = 0
+    # Identity of the first and last normalized contents, to detect a rewritten history
+    fingerprints: Optional[Tuple[tuple, tuple]] = None
+    # Content indexes of the user messages, oldest first
+    user_message_indexes: List[int] = field(default_factory=list)
+    # Content index -> (plan, whether the plan adds placeholders), for user messages with image data
+    image_message_plans: dict[int, Tuple[PartPlan, bool]] = field(default_factory=dict)
+    # Estimated tokens of the leading normalized contents, in content order
+    content_tokens: List[int] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def reset(self) -> None:
+        """Forget the normalized contents, the image hash memo stays valid."""
+        self.watermark = 0
+        self.fingerprints = None
+        self.user_message_indexes = []
+        self.image_message_plans = {}
+        self.content_tokens = []
+
+    def hash_image(self, data: bytes) -> str:
+        """Return the image hash ID, computing it once per image bytes object."""
+        memo = self.image_hashes.get(id(data))
+        if memo is not None and memo[0] is data:
+            return memo[1]
+
+        image_hash_id = hashlib.sha256(data).hexdigest()[:12]
+        # The memo only saves hashing again after a reset, it is cleared past the budget
+        if self.image_bytes + len(data) > HISTORY_STATE_MAX_IMAGE_BYTES:
+            self.image_hashes = {}
+            self.image_bytes = 0
+        self.image_hashes[id(data)] = (data, image_hash_id)
+        self.image_bytes += len(data)
+        return image_hash_id
+
+
+HISTORY_STATES: OrderedDict[Tuple[str, str], HistoryState] = OrderedDict()
+HISTORY_STATES_LOCK = threading.Lock()
+
+
+def get_history_state(user_id: str, session_id: str) -> HistoryState:
+    """Return the history state of a session, evicting the least recently used ones.
+
+    States are evicted once there are more than HISTORY_STATE_MAX_SESSIONS of
+    them or their memoized images exceed HISTORY_STATE_MAX_IMAGE_BYTES, as the
+    images would otherwise outlive the sessions evicted by the session service.
+    """
+    key = (user_id, session_id)
+    with HISTORY_STATES_LOCK:
+        state = HISTORY_STATES.get(key)
+        if state is None:
+            state = HistoryState()
+            HISTORY_STATES[key] = state
+        HISTORY_STATES.move_to_end(key)
+
+        image_bytes = sum(item.image_bytes for item in HISTORY_STATES.values())
+        while len(HISTORY_STATES) > HISTORY_STATE_MAX_SESSIONS or (
+            image_bytes > HISTORY_STATE_MAX_IMAGE_BYTES and len(HISTORY_STATES) > 1
+        ):
+            _, evicted = HISTORY_STATES.popitem(last=False)
+            image_bytes -= evicted.image_bytes
+        return state
+
+
+def content_fingerprint(content: types.Content) -> tuple:
+    """Identity of a content, stable across the deep copies of the same event."""
+    return (
+        content.role,
+        tuple(
+            id(part.text)
+            if part.text is not None
+            else id(part.inline_data.data) if part.inline_data is not None else None
+            for part in content.parts or []
+        ),
+    )
+
+
+def plan_message_parts(
+    parts: List[types.Part], state: HistoryState
+) -> Optional[Tuple[PartPlan, bool]]:
+    """Plan the normalization of a user message.
+
+    Every image data part must be followed by its image ID placeholder, a
+    placeholder is planned after the images that miss one.
+
+    Returns:
+        Optional[Tuple[PartPlan, bool]]: The plan and whether it adds
+            placeholders, None if the message has no image data.
+    """
+    plan: PartPlan = []
+    adds_placeholders = False
+    for idx, part in enumerate(parts):
+        if part.inline_data is None:
+            plan.append(("part", idx))
+            continue
+
+        plan.append(("image", idx))
+        if (
+            (idx + 1 >= len(parts))
+            or (parts[idx + 1].text is None)
+            or (not parts[idx + 1].text.startswith("[IMAGE-ID "))
+        ):
+            image_hash_id = state.hash_image(part.inline_data.data)
+            plan.append(
+                ("placeholder", types.Part(text=f"[IMAGE-ID {image_hash_id}]"))
+            )
+            adds_placeholders = True
+
+    if not any(kind == "image" for kind, _ in plan):
+        return None
+
+    return plan, adds_placeholders
+
+
+def normalize_history(state: HistoryState, contents: List[types.Content]) -> None:
+    """Add missing image placeholders and drop old image data, in place.
+
+    Contents below the watermark were planned by earlier calls, only the new
+    contents are inspected and only user messages with image data are rebuilt.
+
+    Args:
+        state: The history state of the session.
+        contents: The contents of the model request.
+    """
+    if state.fingerprints is not None and (
+        len(contents) < state.watermark
+        or state.fingerprints
+        != (
+            content_fingerprint(contents[0]),
+            content_fingerprint(contents[state.watermark - 1]),
+        )
+    ):
+        state.reset()
+
+    for index in range(state.watermark, len(contents)):
+        content = contents[index]
+        if not is_user_message(content):
+            continue
+
+        state.user_message_indexes.append(index)
+        planned = plan_message_parts(content.parts, state)
+        if planned is not None:
+            state.image_message_plans[index] = planned
+
+    state.watermark = len(contents)
+    if contents:
+        state.fingerprints = (
+            content_fingerprint(contents[0]),
+            content_fingerprint(contents[-1]),
+        )
+
+    # Messages from this index on are among the last user messages and keep their image data
+    recent_messages = state.user_message_indexes[-IMAGE_HISTORY_USER_MESSAGES:]
+    keep_images_from = recent_messages[0] if recent_messages else 0
+
+    for index, (plan, adds_placeholders) in state.image_message_plans.items():
+        keep_images = index >= keep_images_from
+        if keep_images and not adds_placeholders:
+            continue
+
+        parts = contents[index].parts
+        contents[index].parts = [
+            value if kind == "placeholder" else parts[value]
+            for kind, value in plan
+            if keep_images or kind != "image"
+        ]
 
 
 def modify_image_data_in_history(
     callback_context: CallbackContext, llm_request: LlmRequest
 ) -> None:
     # The following code will modify the request sent to LLM
-    # We will only keep image data in the last 3 user messages using a reverse and counter approach
-
-    # Count how many user messages we've processed
-    user_message_count = 0
-
-    # Process the reversed list
-    for content in reversed(llm_request.contents):
-        # Only count for user manual query, not function call
-        if (content.role == "user") and (content.parts[0].function_response is None):
-            user_message_count += 1
-            modified_content_parts = []
-
-            # Check any missing image ID placeholder for any image data
-            # Then remove image data from conversation history if more than 3 user messages
-            for idx, part in enumerate(content.parts):
-                if part.inline_data is None:
-                    modified_content_parts.append(part)
-                    continue
-
-                if (
-                    (idx + 1 >= len(content.parts))
-                    or (content.parts[idx + 1].text is None)
-                    or (not content.parts[idx + 1].text.startswith("[IMAGE-ID "))
-                ):
-                    # Generate hash ID for the image and add a placeholder
-                    image_data = part.inline_data.data
-                    hasher = hashlib.sha256(image_data)
-                    image_hash_id = hasher.hexdigest()[:12]
-                    placeholder = f"[IMAGE-ID {image_hash_id}]"
-
-                    # Only keep image data in the last 3 user messages
-                    if user_message_count <= 3:
-                        modified_content_parts.append(part)
-
-                    modified_content_parts.append(types.Part(text=placeholder))
-
-                else:
-                    # Only keep image data in the last 3 user messages
-                    if user_message_count <= 3:
-                        modified_content_parts.append(part)
-
-            # This will modify the contents inside the llm_request
-            content.parts = modified_content_parts
+    # Every image data gets an image ID placeholder and only the last 3 user
+    # messages keep their image data. The work done by previous calls of the
+    # same session is memoized, so each call only inspects the new contents.
+    session = callback_context._invocation_context.session
+    state = get_history_state(session.user_id, session.id)
+
+    with state.lock:
+        normalize_history(state, llm_request.contents)
+
+
+def estimate_history_tokens(state: HistoryState, contents: List[types.Content]) -> List[int]:
+    """Estimate the tokens of each normalized content, reusing the estimates of earlier calls.
+
+    Only the new contents and the user messages with image data, whose images
+    are dropped once they are no longer among the last user messages, are estimated.
+
+    Args:
+        state: The history state of the session, normalized with the contents.
+        contents: The contents of the model request.
+
+    Returns:
+        List[int]: The estimated tokens of each content.
+    """
+    tokens = state.content_tokens
+    del tokens[len(contents) :]
+    for index in state.image_message_plans:
+        if index < len(tokens):
+            tokens[index] = estimate_content_tokens(contents[index])
+    tokens.extend(estimate_content_tokens(content) for content in contents[len(tokens) :])
+    return list(tokens)
+
+
+def compact_history_to_token_budget(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> None:
+    # Shrink the history sent to the LLM to the configured token budget,
+    # the recent user turns and the current tool calls are kept verbatim
+    if SETTINGS.HISTORY_TOKEN_BUDGET <= 0:
+        return
+
+    session = callback_context._invocation_context.session
+    state = get_history_state(session.user_id, session.id)
+    with state.lock:
+        tokens = estimate_history_tokens(state, llm_request.contents)
+
+    llm_request.contents, report = compact_contents(
+        llm_request.contents,
+        token_budget=SETTINGS.HISTORY_TOKEN_BUDGET,
+        keep_recent_user_messages=SETTINGS.HISTORY_KEEP_RECENT_USER_MESSAGES,
+        tool_response_max_chars=SETTINGS.HISTORY_TOOL_RESPONSE_MAX_CHARS,
+        tokens=tokens,
+    )
+    record_compaction(report)
+    if report.compacted:
+        logger.info(
+            "Compacted conversation history",
+            session_id=session.id,
+            tokens_before=report.tokens_before,
+            tokens_after=report.tokens_after,
+            tool_responses_truncated=report.tool_responses_truncated,
+            tool_calls_collapsed=report.tool_calls_collapsed,
+            turns_dropped=report.turns_dropped,
+        )
+
+
+def prepare_llm_request(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> None:
+    # Normalize the image history first, so that compaction sees the final image parts
+    modify_image_data_in_history(callback_context, llm_request)
+    compact_history_to_token_budget(callback_context, llm_request)
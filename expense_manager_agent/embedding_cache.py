@@ -0,0 +1,202 @@
+# expense_manager_agent/embedding_cache.py
+
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def normalize_embedding_text(text: str) -> str:
+    """Normalize text before hashing so trivially different inputs share a cache entry.
+
+    Applies Unicode NFC normalization and collapses all runs of whitespace
+    into a single space. Casing is preserved because it can change the embedding.
+
+    Args:
+        text: The raw text sent to the embedding model.
+
+    Returns:
+        str: The normalized text.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    """Build the content-addressed cache key for a model and text pair.
+
+    Args:
+        model: The embedding model name.
+        text: The text to embed.
+
+    Returns:
+        str: Hex SHA-256 digest of the model name and normalized text.
+    """
+    hasher = hashlib.sha256(model.encode("utf-8"))
+    hasher.update(b"\x00")
+    hasher.update(normalize_embedding_text(text).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache keyed by model + normalized text hash.
+
+    The first tier is a bounded in-memory LRU. The optional second tier is a
+    SQLite file on disk that survives restarts and is evicted by least recent
+    access once it grows over its byte budget.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        cache_dir: str = "",
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of embeddings kept in memory. 0 disables the memory tier.
+            cache_dir: Directory of the persistent tier. Empty string disables the disk tier.
+            max_disk_bytes: Size budget of the persistent tier in bytes.
+        """
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk = sqlite3.connect(
+                os.path.join(cache_dir, "embeddings.sqlite3"),
+                check_same_thread=False,
+                isolation_level=None,
+            )
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._disk.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_access "
+                "ON embeddings (last_access)"
+            )
+            self._disk_bytes = self._disk.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()[0]
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Look up a cached embedding.
+
+        Args:
+            model: The embedding model name.
+            text: The text that was embedded.
+
+        Returns:
+            Optional[List[float]]: The embedding values, or None on a miss.
+        """
+        key = embedding_cache_key(model, text)
+        with self._lock:
+            values = self._memory.get(key)
+            if values is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return values
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._disk.execute(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    values = array.array("d", row[0]).tolist()
+                    self._remember(key, values)
+                    self._stats["disk_hits"] += 1
+                    return values
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, model: str, text: str, values: List[float]) -> None:
+        """Store an embedding in every enabled tier.
+
+        Args:
+            model: The embedding model name.
+            text: The text that was embedded.
+            values: The embedding values returned by the model.
+        """
+        key = embedding_cache_key(model, text)
+        values = list(values)
+        with self._lock:
+            self._remember(key, values)
+
+            if self._disk is not None:
+                blob = array.array("d", values).tobytes()
+                previous = self._disk.execute(
+                    "SELECT size FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), time.time()),
+                )
+                self._disk_bytes += len(blob) - (previous[0] if previous else 0)
+                self._evict_disk()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and current tier sizes.
+
+        Returns:
+            Dict[str, int]: The cache statistics.
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                "hits": self._stats["memory_hits"] + self._stats["disk_hits"],
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _remember(self, key: str, values: List[float]) -> None:
+        """Insert into the memory tier, evicting the least recently used entries."""
+        if self.max_entries <= 0:
+            return
+
+        self._memory[key] = values
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["memory_evictions"] += 1
+
+    def _evict_disk(self) -> None:
+        """Delete least recently accessed rows until the disk tier fits its budget."""
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._disk.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+
+            for key, size in rows:
+                self._disk.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                self._stats["disk_evictions"] += 1
+                if self._disk_bytes <= self.max_disk_bytes:
+                    return
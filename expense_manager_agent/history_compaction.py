@@ -0,0 +1,270 @@
+# expense_manager_agent/history_compaction.py
+
+import json
+import math
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+# Rough ratio of characters per token for English text and JSON
+CHARS_PER_TOKEN = 4
+
+# Preprocessed receipt images are billed as up to 4 tiles of 258 tokens
+IMAGE_TOKENS = 4 * 258
+
+# Maximum length of the result kept when a stale tool call is collapsed
+COLLAPSED_RESULT_MAX_CHARS = 300
+
+
+@dataclass
+class CompactionReport:
+    """How much one model request was shrunk."""
+
+    tokens_before: int = 0
+    tokens_after: int = 0
+    tool_responses_truncated: int = 0
+    tool_calls_collapsed: int = 0
+    turns_dropped: int = 0
+
+    @property
+    def compacted(self) -> bool:
+        return self.tokens_after < self.tokens_before
+
+
+COMPACTION_STATS = {
+    "requests": 0,
+    "compacted_requests": 0,
+    "tokens_before": 0,
+    "tokens_after": 0,
+    "tool_responses_truncated": 0,
+    "tool_calls_collapsed": 0,
+    "turns_dropped": 0,
+}
+COMPACTION_STATS_LOCK = threading.Lock()
+
+
+def record_compaction(report: CompactionReport) -> None:
+    """Add a request report to the process-wide compaction counters."""
+    with COMPACTION_STATS_LOCK:
+        COMPACTION_STATS["requests"] += 1
+        COMPACTION_STATS["compacted_requests"] += int(report.compacted)
+        for key, value in asdict(report).items():
+            COMPACTION_STATS[key] += value
+
+
+def get_compaction_stats() -> Dict[str, int]:
+    """Return a copy of the process-wide compaction counters."""
+    with COMPACTION_STATS_LOCK:
+        return dict(COMPACTION_STATS)
+
+
+def estimate_text_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def serialize_payload(payload: Any) -> str:
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def estimate_part_tokens(part: types.Part) -> int:
+    """Estimate the tokens of a content part without calling the model."""
+    if part.text is not None:
+        return estimate_text_tokens(part.text)
+    if part.inline_data is not None:
+        return IMAGE_TOKENS
+    if part.function_call is not None:
+        return estimate_text_tokens(
+            (part.function_call.name or "") + serialize_payload(part.function_call.args)
+        )
+    if part.function_response is not None:
+        return estimate_text_tokens(
+            (part.function_response.name or "")
+            + serialize_payload(part.function_response.response)
+        )
+    return 0
+
+
+def estimate_content_tokens(content: types.Content) -> int:
+    return sum(estimate_part_tokens(part) for part in content.parts or [])
+
+
+def is_user_message(content: types.Content) -> bool:
+    """Whether a content is a user query, as opposed to a function response."""
+    return (
+        content.role == "user"
+        and bool(content.parts)
+        and content.parts[0].function_response is None
+    )
+
+
+def is_tool_call(content: types.Content) -> bool:
+    return bool(content.parts) and any(
+        part.function_call is not None for part in content.parts
+    )
+
+
+def is_tool_response(content: types.Content) -> bool:
+    return bool(content.parts) and all(
+        part.function_response is not None for part in content.parts
+    )
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [truncated {len(text) - max_chars} characters]"
+
+
+def truncate_tool_responses(
+    content: types.Content, max_chars: int, report: CompactionReport
+) -> int:
+    """Truncate the long function responses of a content in place.
+
+    Returns:
+        int: The number of estimated tokens saved.
+    """
+    saved = 0
+    for part in content.parts:
+        response = part.function_response
+        if response is None:
+            continue
+
+        serialized = serialize_payload(response.response)
+        if len(serialized) <= max_chars:
+            continue
+
+        before = estimate_part_tokens(part)
+        part.function_response = types.FunctionResponse(
+            id=response.id,
+            name=response.name,
+            response={"result": truncate(serialized, max_chars)},
+        )
+        saved += before - estimate_part_tokens(part)
+        report.tool_responses_truncated += 1
+
+    return saved
+
+
+def collapse_tool_call(
+    call: types.Content, response: types.Content, report: CompactionReport
+) -> types.Content:
+    """Replace a function call and its response by a short model note."""
+    responses = [part.function_response for part in response.parts]
+    notes = [part.text for part in call.parts if part.text and not part.thought]
+    for part in call.parts:
+        if part.function_call is None:
+            continue
+
+        function_call = part.function_call
+        result = next(
+            (
+                serialize_payload(item.response)
+                for item in responses
+                if (function_call.id and item.id == function_call.id)
+                or item.name == function_call.name
+            ),
+            "",
+        )
+        notes.append(
+            f"[Earlier tool call {function_call.name}"
+            f"({serialize_payload(function_call.args)}) returned: "
+            f"{truncate(result, COLLAPSED_RESULT_MAX_CHARS)}]"
+        )
+        report.tool_calls_collapsed += 1
+
+    return types.Content(role="model", parts=[types.Part(text="\n".join(notes))])
+
+
+def compact_contents(
+    contents: List[types.Content],
+    token_budget: int,
+    keep_recent_user_messages: int,
+    tool_response_max_chars: int,
+    tokens: Optional[List[int]] = None,
+) -> tuple[List[types.Content], CompactionReport]:
+    """Shrink the conversation history to fit a token budget.
+
+    The contents from the last `keep_recent_user_messages` user messages on are
+    kept verbatim. Older contents are compacted in stages until the budget is
+    met: long tool responses are truncated, then function call and response
+    pairs are collapsed into short notes, then the oldest turns are dropped.
+
+    Args:
+        contents: The contents of the model request.
+        token_budget: Maximum estimated tokens of the contents.
+        keep_recent_user_messages: Number of recent user turns kept verbatim.
+        tool_response_max_chars: Maximum serialized length of an old tool response.
+        tokens: The estimated tokens of each content, e.g. memoized by earlier
+            requests of the session, estimated here if not given.
+
+    Returns:
+        tuple[List[types.Content], CompactionReport]: The compacted contents and the report.
+    """
+    if tokens is None:
+        tokens = [estimate_content_tokens(content) for content in contents]
+    else:
+        # The estimates are updated as contents are compacted
+        tokens = list(tokens)
+    total = sum(tokens)
+    report = CompactionReport(tokens_before=total, tokens_after=total)
+    if total <= token_budget:
+        return contents, report
+
+    user_messages = [idx for idx, content in enumerate(contents) if is_user_message(content)]
+    recent = user_messages[-keep_recent_user_messages:] if keep_recent_user_messages else []
+    protected_from = recent[0] if recent else len(contents)
+    if protected_from == 0:
+        return contents, report
+
+    # Stage 1: truncate old tool responses, oldest first
+    for idx in range(protected_from):
+        if total <= token_budget:
+            break
+        if contents[idx].role == "user" and not is_user_message(contents[idx]):
+            saved = truncate_tool_responses(contents[idx], tool_response_max_chars, report)
+            tokens[idx] -= saved
+            total -= saved
+
+    # Stage 2: collapse old function call and response pairs, oldest first
+    compacted: List[types.Content] = []
+    compacted_tokens: List[int] = []
+    idx = 0
+    while idx < protected_from:
+        content = contents[idx]
+        if (
+            total > token_budget
+            and idx + 1 < protected_from
+            and is_tool_call(content)
+            and is_tool_response(contents[idx + 1])
+        ):
+            collapsed = collapse_tool_call(content, contents[idx + 1], report)
+            collapsed_tokens = estimate_content_tokens(collapsed)
+            total -= tokens[idx] + tokens[idx + 1] - collapsed_tokens
+            compacted.append(collapsed)
+            compacted_tokens.append(collapsed_tokens)
+            idx += 2
+            continue
+
+        compacted.append(content)
+        compacted_tokens.append(tokens[idx])
+        idx += 1
+
+    # Stage 3: drop the oldest turns, so that the history still starts with a user message
+    while total > token_budget and compacted:
+        end = next(
+            (
+                turn_end
+                for turn_end in range(1, len(compacted))
+                if is_user_message(compacted[turn_end])
+            ),
+            len(compacted),
+        )
+        total -= sum(compacted_tokens[:end])
+        del compacted[:end]
+        del compacted_tokens[:end]
+        report.turns_dropped += 1
+
+    report.tokens_after = total
+    return compacted + contents[protected_from:], report
@@ -0,0 +1,56 @@
+# expense_manager_agent/id_filter.py
+
+import hashlib
+import math
+import threading
+from typing import Iterable
+
+
+class BloomFilter:
+    """Thread-safe bloom filter over string IDs.
+
+    A negative answer is exact: the ID was never added. A positive answer
+    means the ID was probably added and must be confirmed by the caller.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.01):
+        """Size the filter for the expected number of IDs.
+
+        Args:
+            capacity: Expected number of IDs. Exceeding it only raises the false positive rate.
+            error_rate: Target false positive rate at full capacity.
+        """
+        capacity = max(1, capacity)
+        self.num_bits = max(
+            8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        """Bit positions of an item, using double hashing over one SHA-256 digest."""
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str) -> None:
+        """Add an ID to the filter."""
+        positions = list(self._positions(item))
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        """Add many IDs to the filter."""
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
@@ -0,0 +1,166 @@
+# expense_manager_agent/index_generations.py
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Generations of each user whose changed receipts are kept
+INDEX_CHANGES_MAX_GENERATIONS = 256
+# Changes of more receipts are not recorded, the indexes are rebuilt instead
+INDEX_CHANGES_MAX_RECEIPTS = 500
+
+
+class IndexGenerations:
+    """Per-user generation counters of the receipt indexes, shared by the backend workers.
+
+    Every worker process keeps its own receipt ID filters and search indexes in
+    memory. A process storing receipts bumps the generation of their user with
+    the IDs of the stored receipts, the other processes see a generation their
+    indexes do not reflect yet and add the receipts changed since to the
+    indexes of that user on next access. When the changes are not recorded,
+    e.g. for large imports, the indexes of the user are rebuilt instead. The
+    counters are kept in a SQLite file shared by the processes of one host, or
+    in memory when the indexes are only used by a single process.
+    """
+
+    def __init__(self, store_path: str = ""):
+        """Initialize the counters.
+
+        Args:
+            store_path: SQLite file of the shared counters. Empty string keeps
+                them in memory, only visible to the current process.
+        """
+        self._memory: Dict[str, int] = {}
+        # User ID -> generation -> changed receipt IDs, None when not recorded
+        self._memory_changes: Dict[str, Dict[int, Optional[List[str]]]] = {}
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+
+        if store_path:
+            directory = os.path.dirname(store_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._disk = sqlite3.connect(
+                store_path, check_same_thread=False, isolation_level=None
+            )
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("PRAGMA synchronous=NORMAL")
+            self._disk.executescript(
+                "CREATE TABLE IF NOT EXISTS index_generations ("
+                "user_id TEXT PRIMARY KEY, generation INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS index_changes ("
+                "user_id TEXT NOT NULL, generation INTEGER NOT NULL, receipt_ids TEXT, "
+                "PRIMARY KEY (user_id, generation));"
+            )
+
+    def get(self, user_id: str) -> int:
+        """Return the current generation of the indexes of a user, 0 if never bumped."""
+        with self._lock:
+            if self._disk is None:
+                return self._memory.get(user_id, 0)
+
+            row = self._disk.execute(
+                "SELECT generation FROM index_generations WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def changes_since(self, user_id: str, generation: int) -> Tuple[int, Optional[List[str]]]:
+        """Return the receipts of a user changed after a generation.
+
+        Args:
+            user_id: The ID of the user.
+            generation: The generation reflected by the indexes.
+
+        Returns:
+            Tuple[int, Optional[List[str]]]: The current generation and the IDs of the
+                receipts changed since, None if some changes are not recorded.
+        """
+        with self._lock:
+            if self._disk is None:
+                current = self._memory.get(user_id, 0)
+                changes = self._memory_changes.get(user_id, {})
+                logged = [changes.get(number) for number in range(generation + 1, current + 1)]
+            else:
+                # Both reads see the same snapshot of the file
+                self._disk.execute("BEGIN")
+                try:
+                    row = self._disk.execute(
+                        "SELECT generation FROM index_generations WHERE user_id = ?",
+                        (user_id,),
+                    ).fetchone()
+                    current = row[0] if row else 0
+                    rows = self._disk.execute(
+                        "SELECT receipt_ids FROM index_changes "
+                        "WHERE user_id = ? AND generation > ? AND generation <= ?",
+                        (user_id, generation, current),
+                    ).fetchall()
+                finally:
+                    self._disk.execute("COMMIT")
+                logged = [
+                    json.loads(receipt_ids) if receipt_ids is not None else None
+                    for (receipt_ids,) in rows
+                ]
+                if len(logged) != current - generation:
+                    logged.append(None)
+
+        if generation > current or any(receipt_ids is None for receipt_ids in logged):
+            return current, None
+        return current, [receipt_id for receipt_ids in logged for receipt_id in receipt_ids]
+
+    def bump(self, user_id: str, receipt_ids: Optional[Iterable[str]] = None) -> int:
+        """Record a change to the receipts of a user.
+
+        Args:
+            user_id: The ID of the user.
+            receipt_ids: The IDs of the stored receipts, None if unknown, in which case
+                the other processes rebuild the indexes of the user.
+
+        Returns:
+            int: The new generation of the indexes of the user.
+        """
+        receipt_ids = list(receipt_ids) if receipt_ids is not None else None
+        if receipt_ids is not None and len(receipt_ids) > INDEX_CHANGES_MAX_RECEIPTS:
+            receipt_ids = None
+
+        with self._lock:
+            if self._disk is None:
+                generation = self._memory.get(user_id, 0) + 1
+                self._memory[user_id] = generation
+                changes = self._memory_changes.setdefault(user_id, {})
+                changes[generation] = receipt_ids
+                changes.pop(generation - INDEX_CHANGES_MAX_GENERATIONS, None)
+                return generation
+
+            # Other processes write the same rows, take the write lock before reading
+            self._disk.execute("BEGIN IMMEDIATE")
+            try:
+                self._disk.execute(
+                    "INSERT INTO index_generations (user_id, generation) VALUES (?, 1) "
+                    "ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1",
+                    (user_id,),
+                )
+                generation = self._disk.execute(
+                    "SELECT generation FROM index_generations WHERE user_id = ?",
+                    (user_id,),
+                ).fetchone()[0]
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO index_changes (user_id, generation, receipt_ids) "
+                    "VALUES (?, ?, ?)",
+                    (
+                        user_id,
+                        generation,
+                        json.dumps(receipt_ids) if receipt_ids is not None else None,
+                    ),
+                )
+                self._disk.execute(
+                    "DELETE FROM index_changes WHERE user_id = ? AND generation <= ?",
+                    (user_id, generation - INDEX_CHANGES_MAX_GENERATIONS),
+                )
+                self._disk.execute("COMMIT")
+            except Exception:
+                self._disk.execute("ROLLBACK")
+                raise
+
+            return generation
@@ -0,0 +1,101 @@
+# expense_manager_agent/instrumentation.py
+
+import time
+from typing import Any, AsyncGenerator, Tuple
+
+from google.adk.models import BaseLlm
+from google.adk.models.base_llm_connection import BaseLlmConnection
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools import FunctionTool, ToolContext
+from google.genai import types
+
+from expense_manager_agent.history_compaction import (
+    estimate_content_tokens,
+    estimate_text_tokens,
+)
+from telemetry import LLM_TOKENS, STAGE_DURATION, STAGE_ERRORS, STAGE_IN_FLIGHT, stage
+
+
+def estimate_request_tokens(llm_request: LlmRequest) -> int:
+    """Estimate the prompt tokens of a model request, with the system instruction."""
+    tokens = sum(estimate_content_tokens(content) for content in llm_request.contents)
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    if isinstance(instruction, str):
+        tokens += estimate_text_tokens(instruction)
+    elif isinstance(instruction, types.Content):
+        tokens += estimate_content_tokens(instruction)
+    return tokens
+
+
+def get_reported_tokens(response: LlmResponse) -> Tuple[int, int]:
+    """Get the prompt and output tokens reported with a model response, zero if not reported."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    output_tokens = (usage.candidates_token_count or 0) + (
+        getattr(usage, "thoughts_token_count", None) or 0
+    )
+    return usage.prompt_token_count or 0, output_tokens
+
+
+class InstrumentedLlm(BaseLlm):
+    """Model measuring the latency and the tokens of every call of the model it wraps.
+
+    The agent framework already opens a span per model call, so only the
+    metrics are recorded here. Token counts reported by the model are used
+    when available, otherwise they are estimated from the request and response.
+    """
+
+    llm: BaseLlm
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        STAGE_IN_FLIGHT.labels(stage="llm").inc()
+        started = time.perf_counter()
+        prompt_tokens, output_tokens = 0, 0
+        estimated_output_tokens = 0
+        try:
+            async for response in self.llm.generate_content_async(llm_request, stream=stream):
+                reported_prompt, reported_output = get_reported_tokens(response)
+                prompt_tokens = reported_prompt or prompt_tokens
+                output_tokens = reported_output or output_tokens
+                # Streamed chunks are repeated in the final aggregated response
+                if not response.partial and response.content is not None:
+                    estimated_output_tokens += estimate_content_tokens(response.content)
+                yield response
+        except Exception:
+            STAGE_ERRORS.labels(stage="llm", operation=self.model).inc()
+            raise
+        finally:
+            STAGE_DURATION.labels(stage="llm", operation=self.model).observe(
+                time.perf_counter() - started
+            )
+            STAGE_IN_FLIGHT.labels(stage="llm").dec()
+
+        if prompt_tokens:
+            LLM_TOKENS.labels(direction="input", source="reported").inc(prompt_tokens)
+        else:
+            LLM_TOKENS.labels(direction="input", source="estimated").inc(
+                estimate_request_tokens(llm_request)
+            )
+        if output_tokens:
+            LLM_TOKENS.labels(direction="output", source="reported").inc(output_tokens)
+        else:
+            LLM_TOKENS.labels(direction="output", source="estimated").inc(estimated_output_tokens)
+
+    def connect(self, llm_request: LlmRequest) -> BaseLlmConnection:
+        return self.llm.connect(llm_request)
+
+
+class TracedFunctionTool(FunctionTool):
+    """Function tool running every call as a traced "tool" stage.
+
+    The function itself is left undecorated, its docstring and signature are
+    the tool declaration sent to the model.
+    """
+
+    async def run_async(self, *, args: dict[str, Any], tool_context: ToolContext) -> Any:
+        with stage("tool", self.name):
+            return await super().run_async(args=args, tool_context=tool_context)
@@ -0,0 +1,175 @@
+# expense_manager_agent/lexical_index.py
+
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Sequence, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Terms in the store name count more than terms in the item names
+STORE_NAME_WEIGHT = 2.0
+ITEM_NAME_WEIGHT = 1.0
+
+# Reciprocal rank fusion constant, dampens the weight of the first ranks
+RRF_K = 60
+
+
+def tokenize(text: Any) -> List[str]:
+    """Split text into lower-case word tokens, with accents folded.
+
+    Args:
+        text: The text to tokenize, non-strings are converted first.
+
+    Returns:
+        List[str]: The tokens in order, with repetitions.
+    """
+    folded = unicodedata.normalize("NFKD", str(text or "")).casefold()
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return TOKEN_PATTERN.findall(folded)
+
+
+def receipt_term_frequencies(receipt: Dict[str, Any]) -> Dict[str, float]:
+    """Weighted term frequencies of the store name and purchased item names of a receipt."""
+    frequencies: Counter = Counter()
+    for token in tokenize(receipt.get("store_name")):
+        frequencies[token] += STORE_NAME_WEIGHT
+
+    for item in receipt.get("purchased_items") or []:
+        name = item.get("name") if isinstance(item, dict) else None
+        for token in tokenize(name):
+            frequencies[token] += ITEM_NAME_WEIGHT
+
+    return dict(frequencies)
+
+
+class LexicalIndex:
+    """In-process BM25 inverted index over receipt store and item names.
+
+    Store names and item names are matched on exact terms, which embeddings
+    rank poorly. The index is updated in place when a receipt is added, and
+    every search also reports which fraction of the query terms the receipt
+    contains, so that callers can tell a strong term match from a partial one.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """Initialize an empty index.
+
+        Args:
+            k1: BM25 term frequency saturation.
+            b: BM25 document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id: str, receipt: Dict[str, Any], metadata: Dict[str, Any]) -> None:
+        """Insert or replace a receipt.
+
+        Args:
+            doc_id: Identifier of the receipt.
+            receipt: Receipt data with `store_name` and `purchased_items`.
+            metadata: Receipt data returned with search results.
+        """
+        frequencies = receipt_term_frequencies(receipt)
+        with self._lock:
+            self._remove(doc_id)
+
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+            self._doc_terms[doc_id] = frequencies
+            self._doc_lengths[doc_id] = sum(frequencies.values())
+            self._total_length += self._doc_lengths[doc_id]
+            self._metadata[doc_id] = metadata
+
+    def search(
+        self, query: str, k: int
+    ) -> List[Tuple[str, float, float, Dict[str, Any]]]:
+        """Return the k receipts with the highest BM25 score for the query.
+
+        Args:
+            query: The query text.
+            k: Maximum number of results.
+
+        Returns:
+            List[Tuple[str, float, float, Dict[str, Any]]]: (doc_id, score, coverage, metadata)
+                tuples ordered from best to worst, where coverage is the fraction of
+                distinct query terms found in the receipt.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._doc_terms or k <= 0:
+                return []
+
+            doc_count = len(self._doc_terms)
+            average_length = self._total_length / doc_count or 1.0
+            scores: Dict[str, float] = {}
+            matches: Counter = Counter()
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length_norm = 1 - self.b + self.b * self._doc_lengths[doc_id] / average_length
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (
+                        self.k1 + 1
+                    ) / (frequency + self.k1 * length_norm)
+                    matches[doc_id] += 1
+
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [
+                (doc_id, score, matches[doc_id] / len(terms), self._metadata[doc_id])
+                for doc_id, score in top
+            ]
+
+    def _remove(self, doc_id: str) -> None:
+        """Remove a receipt from the postings. Caller must hold the lock."""
+        frequencies = self._doc_terms.pop(doc_id, None)
+        if frequencies is None:
+            return
+
+        for term in frequencies:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        del self._metadata[doc_id]
+
+
+def fuse_rankings(
+    lexical_ids: Sequence[str], vector_ids: Sequence[str], lexical_weight: float
+) -> List[str]:
+    """Merge a lexical and a vector ranking with weighted reciprocal rank fusion.
+
+    Ranks are fused instead of raw scores because BM25 scores and embedding
+    distances are not on comparable scales.
+
+    Args:
+        lexical_ids: Receipt IDs ordered by lexical score.
+        vector_ids: Receipt IDs ordered by vector distance.
+        lexical_weight: Weight of the lexical ranking, from 0 to 1.
+
+    Returns:
+        List[str]: The receipt IDs of both rankings, best fused score first.
+    """
+    scores: Dict[str, float] = {}
+    for weight, ranking in ((lexical_weight, lexical_ids), (1 - lexical_weight, vector_ids)):
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (RRF_K + rank + 1)
+
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,157 @@
+# expense_manager_agent/receipt_schema.py
+
+import datetime
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+RECEIPT_SCHEMA_VERSION = 2
+
+DEFAULT_FX_RATES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fx_rates.json"
+)
+
+
+def parse_transaction_time(value: Any) -> datetime.datetime:
+    """
+    Parse a transaction time emitted by the model into an aware UTC datetime.
+
+    Accepts ISO 8601 with a "Z" suffix or a UTC offset, a space instead of "T"
+    and plain dates. Times without an offset are assumed to be UTC.
+
+    Args:
+        value: The transaction time, a string or a datetime.
+
+    Returns:
+        datetime.datetime: The transaction time in UTC.
+
+    Raises:
+        ValueError: If the value is not a valid ISO date or datetime.
+    """
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, str):
+        text = value.strip()
+        if text.endswith(("Z", "z")):
+            text = f"{text[:-1]}+00:00"
+        parsed = datetime.datetime.fromisoformat(text)
+    else:
+        raise ValueError(f"Invalid transaction time: {value!r}")
+
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+def format_transaction_time(value: datetime.datetime) -> str:
+    """Format a UTC datetime in the canonical 'YYYY-MM-DDTHH:MM:SS.ssssssZ' form."""
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class FxTable:
+    """Exchange rates from a local JSON file, reloaded when the file changes.
+
+    The file lists the number of units of each currency per unit of its
+    `base` currency, as in {"base": "USD", "rates": {"USD": 1.0, "EUR": 0.92}}.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rates: Dict[str, float] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, float]:
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.path, "r") as file:
+                    table = json.load(file)
+                self._rates = {
+                    currency.upper(): float(rate)
+                    for currency, rate in table["rates"].items()
+                }
+                self._mtime = mtime
+            return self._rates
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """
+        Get the rate converting an amount between two currencies.
+
+        Returns:
+            Optional[float]: The rate, or None if a currency is not in the table.
+        """
+        if from_currency == to_currency:
+            return 1.0
+
+        rates = self._load()
+        if from_currency not in rates or to_currency not in rates:
+            return None
+        return rates[to_currency] / rates[from_currency]
+
+
+def normalize_receipt(
+    receipt: Dict[str, Any], fx_table: FxTable, base_currency: str
+) -> Dict[str, Any]:
+    """
+    Build the versioned receipt document with its typed and precomputed query fields.
+
+    Args:
+        receipt: The receipt fields, with `transaction_time`, `total_amount` and `currency`.
+        fx_table: The exchange rates used for the base currency amount.
+        base_currency: The currency all amounts are normalized into.
+
+    Returns:
+        Dict[str, Any]: The receipt with a canonical UTC `transaction_time`, the native
+            `transaction_timestamp`, `transaction_epoch`, `transaction_year_month`,
+            the upper-case `currency`, `total_amount_base`, `base_currency` and
+            `schema_version`. `total_amount_base` is None for currencies missing
+            from the exchange rates.
+
+    Raises:
+        ValueError: If the transaction time or total amount is invalid.
+    """
+    timestamp = parse_transaction_time(receipt["transaction_time"])
+    total_amount = float(receipt["total_amount"])
+    currency = str(receipt.get("currency") or "").strip().upper()
+    base_currency = base_currency.upper()
+
+    fx_rate = fx_table.rate(currency, base_currency)
+    return {
+        **receipt,
+        "transaction_time": format_transaction_time(timestamp),
+        "transaction_timestamp": timestamp,
+        "transaction_epoch": int(timestamp.timestamp()),
+        "transaction_year_month": timestamp.strftime("%Y-%m"),
+        "total_amount": total_amount,
+        "currency": currency,
+        "total_amount_base": round(total_amount * fx_rate, 2) if fx_rate is not None else None,
+        "base_currency": base_currency,
+        "schema_version": RECEIPT_SCHEMA_VERSION,
+    }
+
+
+def receipt_schema_update(
+    data: Dict[str, Any], fx_table: FxTable, base_currency: str
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    Compute the fields to update to bring a stored receipt to the current schema.
+
+    Args:
+        data: The stored receipt fields.
+        fx_table: The exchange rates used for the base currency amount.
+        base_currency: The currency all amounts are normalized into.
+
+    Returns:
+        Tuple[bool, Dict[str, Any]]: Whether the receipt needs an update, and the
+            fields to write.
+
+    Raises:
+        ValueError: If the stored transaction time or total amount is invalid.
+    """
+    if data.get("schema_version", 1) >= RECEIPT_SCHEMA_VERSION:
+        return False, {}
+
+    normalized = normalize_receipt(data, fx_table, base_currency)
+    return True, {key: value for key, value in normalized.items() if data.get(key) != value}
@@ -0,0 +1,144 @@
+# expense_manager_agent/rollups.py
+
+import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+from expense_manager_agent.receipt_schema import parse_transaction_time
+
+ROLLUP_GRANULARITIES = ("day", "week", "month")
+
+UNKNOWN_STORE = "Unknown store"
+
+
+def parse_transaction_date(transaction_time: str) -> datetime.date:
+    """Get the UTC date of an ISO transaction time, naive times are assumed to be UTC."""
+    return parse_transaction_time(transaction_time).date()
+
+
+def period_bounds(
+    granularity: str, day: datetime.date
+) -> Tuple[str, datetime.date, datetime.date]:
+    """Get the period containing a date.
+
+    Args:
+        granularity: One of "day", "week" (ISO weeks starting on Monday) or "month".
+        day: The date.
+
+    Returns:
+        Tuple[str, datetime.date, datetime.date]: The period label, its first and last date.
+
+    Raises:
+        ValueError: If the granularity is not supported.
+    """
+    if granularity == "day":
+        return day.isoformat(), day, day
+
+    if granularity == "week":
+        year, week, weekday = day.isocalendar()
+        start = day - datetime.timedelta(days=weekday - 1)
+        return f"{year}-W{week:02d}", start, start + datetime.timedelta(days=6)
+
+    if granularity == "month":
+        start = day.replace(day=1)
+        next_month = (start + datetime.timedelta(days=32)).replace(day=1)
+        return start.strftime("%Y-%m"), start, next_month - datetime.timedelta(days=1)
+
+    raise ValueError(
+        f"Invalid granularity {granularity!r}, must be one of {', '.join(ROLLUP_GRANULARITIES)}"
+    )
+
+
+def rollup_document_id(granularity: str, period: str) -> str:
+    return f"{granularity}-{period}"
+
+
+def overlapping_periods(
+    granularity: str, start_date: datetime.date, end_date: datetime.date
+) -> List[Tuple[str, datetime.date, datetime.date]]:
+    """List the periods overlapping an inclusive date range, in order."""
+    periods = []
+    day = start_date
+    while day <= end_date:
+        period = period_bounds(granularity, day)
+        periods.append(period)
+        day = period[2] + datetime.timedelta(days=1)
+    return periods
+
+
+def store_key(store_name: Any) -> str:
+    """Normalize a store name into a rollup map key."""
+    return " ".join(str(store_name or "").split()) or UNKNOWN_STORE
+
+
+def currency_key(currency: Any) -> str:
+    return str(currency or "").strip().upper() or "UNKNOWN"
+
+
+def add_amount(
+    totals: Dict[str, Dict[str, float]], currency: str, amount: float, count: int = 1
+) -> None:
+    bucket = totals.setdefault(currency, {"count": 0, "sum": 0.0})
+    bucket["count"] += count
+    bucket["sum"] += amount
+
+
+def build_rollup_deltas(receipts: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Aggregate receipts into the changes of the rollup documents they belong to.
+
+    Each receipt counts towards one rollup document per granularity. A rollup
+    document holds the receipt count and amount sum per currency, overall and
+    per store.
+
+    Args:
+        receipts: Receipt documents with `store_name`, `transaction_time`,
+            `total_amount` and `currency`.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The rollup deltas keyed by rollup document ID.
+    """
+    deltas: Dict[str, Dict[str, Any]] = {}
+    for receipt in receipts:
+        day = parse_transaction_date(receipt["transaction_time"])
+        currency = currency_key(receipt.get("currency"))
+        store = store_key(receipt.get("store_name"))
+        amount = float(receipt["total_amount"])
+
+        for granularity in ROLLUP_GRANULARITIES:
+            period, start, end = period_bounds(granularity, day)
+            delta = deltas.setdefault(
+                rollup_document_id(granularity, period),
+                {
+                    "granularity": granularity,
+                    "period": period,
+                    "start_date": start.isoformat(),
+                    "end_date": end.isoformat(),
+                    "totals": {},
+                    "stores": {},
+                },
+            )
+            add_amount(delta["totals"], currency, amount)
+            add_amount(delta["stores"].setdefault(store, {}), currency, amount)
+
+    return deltas
+
+
+def merge_rollup(target: Dict[str, Any], rollup: Dict[str, Any]) -> None:
+    """Add the totals of a rollup document into an accumulator of the same shape."""
+    for currency, bucket in rollup.get("totals", {}).items():
+        add_amount(target.setdefault("totals", {}), currency, bucket["sum"], bucket["count"])
+    for store, totals in rollup.get("stores", {}).items():
+        store_totals = target.setdefault("stores", {}).setdefault(store, {})
+        for currency, bucket in totals.items():
+            add_amount(store_totals, currency, bucket["sum"], bucket["count"])
+
+
+def describe_totals(totals: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Format per-currency counts and sums with their averages."""
+    return {
+        currency: {
+            "count": int(bucket["count"]),
+            "total": round(bucket["sum"], 2),
+            "average": round(bucket["sum"] / bucket["count"], 2) if bucket["count"] else 0.0,
+        }
+        for currency, bucket in sorted(totals.items())
+    }
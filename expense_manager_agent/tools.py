@@ -1,28 +1,83 @@
 # expense_manager_agent/tools.py
 
+import base64
 import datetime
-from typing import Dict, List, Any
+import hashlib
+import json
+import os
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+from google.adk.tools import ToolContext
+from google.api_core.exceptions import AlreadyExists
 from google.cloud import firestore
 from google.cloud.firestore_v1.vector import Vector
 from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
 from google.cloud.firestore_v1.base_query import And
 from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
 from settings import get_settings
 from google import genai
+from expense_manager_agent.embedding_cache import EmbeddingCache
+from expense_manager_agent.vector_index import LocalVectorIndex
+from expense_manager_agent.lexical_index import LexicalIndex, fuse_rankings
+from expense_manager_agent.id_filter import BloomFilter
+from expense_manager_agent.index_generations import IndexGenerations
+from expense_manager_agent.user_indexes import UserIndexCache
+from expense_manager_agent.receipt_schema import (
+    DEFAULT_FX_RATES_PATH,
+    FxTable,
+    format_transaction_time,
+    normalize_receipt,
+    parse_transaction_time,
+)
+from expense_manager_agent.rollups import (
+    ROLLUP_GRANULARITIES,
+    build_rollup_deltas,
+    describe_totals,
+    merge_rollup,
+    overlapping_periods,
+    parse_transaction_date,
+    rollup_document_id,
+)
+import logger
+from clients import lazy_client
+from telemetry import record_cache_lookup, stage
 
 SETTINGS = get_settings()
-DB_CLIENT = firestore.Client(
-    project=SETTINGS.GCLOUD_PROJECT_ID
-    # database=SETTINGS.FIRESTORE_DATABASE_ID
-)  
-COLLECTION = DB_CLIENT.collection(SETTINGS.DB_COLLECTION_NAME)
-GENAI_CLIENT = genai.Client(
-    vertexai=True, location=SETTINGS.GCLOUD_LOCATION, project=SETTINGS.GCLOUD_PROJECT_ID
-)
+# Receipts and rollups are partitioned per user, under users/{user_id}/receipts and
+# users/{user_id}/rollups, so every query only reads the data of one user
+RECEIPTS_SUBCOLLECTION = "receipts"
+ROLLUPS_SUBCOLLECTION = "rollups"
+FX_TABLE = FxTable(SETTINGS.FX_RATES_PATH or DEFAULT_FX_RATES_PATH)
+EMBEDDING_MODEL = "text-embedding-004"
 EMBEDDING_DIMENSION = 768
 EMBEDDING_FIELD_NAME = "embedding"
+# Fields read back from receipt documents, every field but the embedding
+RECEIPT_FIELDS = [
+    "receipt_id",
+    "store_name",
+    "transaction_time",
+    "total_amount",
+    "currency",
+    "purchased_items",
+]
+METADATA_SEARCH_MAX_PAGE_SIZE = 100
 INVALID_ITEMS_FORMAT_ERR = """
 Invalid items format. Must be a list of dictionaries with 'name', 'price', and 'quantity' keys."""
+# Per-user receipt ID filters and local vector indexes, least recently used users are unloaded
+RECEIPT_ID_FILTERS_MAX_USERS = 1024
+RECEIPT_ID_FILTERS: UserIndexCache[BloomFilter] = UserIndexCache(RECEIPT_ID_FILTERS_MAX_USERS)
+VECTOR_INDEXES_MAX_USERS = 64
+VECTOR_INDEXES: UserIndexCache[LocalVectorIndex] = UserIndexCache(VECTOR_INDEXES_MAX_USERS)
+LEXICAL_INDEXES_MAX_USERS = 256
+LEXICAL_INDEXES: UserIndexCache[LexicalIndex] = UserIndexCache(LEXICAL_INDEXES_MAX_USERS)
+# Generation of the receipts of each user reflected by the local indexes of this process
+INDEXED_GENERATIONS: OrderedDict[str, int] = OrderedDict()
+INDEXED_GENERATION_LOCK = threading.Lock()
+# Number of candidates taken from each ranking per requested result in hybrid search
+HYBRID_CANDIDATES_PER_RESULT = 4
 RECEIPT_DESC_FORMAT = """
 Store Name: {store_name}
 Transaction Time: {transaction_time}
@@ -34,6 +89,54 @@ Receipt Image ID: {receipt_id}
 """
 
 
+@lazy_client("firestore")
+def get_db_client() -> firestore.Client:
+    """Get the process-wide Firestore client, created on first use."""
+    return firestore.Client(
+        project=SETTINGS.GCLOUD_PROJECT_ID
+        # database=SETTINGS.FIRESTORE_DATABASE_ID
+    )
+
+
+@lazy_client("genai")
+def get_genai_client() -> genai.Client:
+    """Get the process-wide GenAI client, created on first use."""
+    return genai.Client(
+        vertexai=True, location=SETTINGS.GCLOUD_LOCATION, project=SETTINGS.GCLOUD_PROJECT_ID
+    )
+
+
+@lazy_client("embedding_cache")
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the process-wide embedding cache, opened on first use."""
+    return EmbeddingCache(
+        max_entries=SETTINGS.EMBEDDING_CACHE_MAX_ENTRIES,
+        cache_dir=SETTINGS.EMBEDDING_CACHE_DIR,
+        max_disk_bytes=SETTINGS.EMBEDDING_CACHE_MAX_DISK_BYTES,
+    )
+
+
+@lazy_client("index_generations")
+def get_index_generations() -> IndexGenerations:
+    """Get the receipt index generations shared by the backend workers, opened on first use."""
+    return IndexGenerations(store_path=SETTINGS.INDEX_GENERATIONS_PATH)
+
+
+def get_users_collection() -> firestore.CollectionReference:
+    """Get the collection of users, holding the receipts and rollups of each user."""
+    return get_db_client().collection(SETTINGS.DB_USER_COLLECTION_NAME)
+
+
+def get_legacy_collection() -> firestore.CollectionReference:
+    """Get the single-user receipts collection of the previous layout, only read by migrations."""
+    return get_db_client().collection(SETTINGS.DB_COLLECTION_NAME)
+
+
+def get_legacy_rollup_collection() -> firestore.CollectionReference:
+    """Get the single-user rollups collection of the previous layout, only read by migrations."""
+    return get_db_client().collection(SETTINGS.DB_ROLLUP_COLLECTION_NAME)
+
+
 def sanitize_image_id(image_id: str) -> str:
     """Sanitize image ID by removing any leading/trailing whitespace."""
     if image_id.startswith("[IMAGE-"):
@@ -42,12 +145,552 @@ def sanitize_image_id(image_id: str) -> str:
     return image_id.strip()
 
 
+def validate_document_id(document_id: str, kind: str) -> str:
+    """
+    Check that a string can be used as a Firestore document ID.
+
+    Raises:
+        ValueError: If the ID cannot be used as a document ID.
+    """
+    if not document_id or "/" in document_id or document_id in (".", ".."):
+        raise ValueError(f"Invalid {kind}: {document_id!r}")
+
+    return document_id
+
+
+def get_tool_user_id(tool_context: ToolContext) -> str:
+    """Get the ID of the user of the session that called a tool."""
+    return tool_context._invocation_context.user_id
+
+
+def list_user_ids() -> List[str]:
+    """List the IDs of the users with stored receipts or rollups, user documents are never written."""
+    return [doc_ref.id for doc_ref in get_users_collection().list_documents()]
+
+
+def get_receipts_collection(user_id: str) -> firestore.CollectionReference:
+    """
+    Get the receipts collection of a user.
+
+    Raises:
+        ValueError: If the user ID cannot be used as a document ID.
+    """
+    return get_users_collection().document(validate_document_id(user_id, "user ID")).collection(
+        RECEIPTS_SUBCOLLECTION
+    )
+
+
+def get_rollups_collection(user_id: str) -> firestore.CollectionReference:
+    """
+    Get the spending rollups collection of a user.
+
+    Raises:
+        ValueError: If the user ID cannot be used as a document ID.
+    """
+    return get_users_collection().document(validate_document_id(user_id, "user ID")).collection(
+        ROLLUPS_SUBCOLLECTION
+    )
+
+
+def get_receipt_document(user_id: str, image_id: str) -> firestore.DocumentReference:
+    """
+    Get the reference of a receipt document, receipts are keyed by their image ID.
+
+    Args:
+        user_id (str): The ID of the user owning the receipt.
+        image_id (str): The sanitized receipt image ID.
+
+    Returns:
+        firestore.DocumentReference: The receipt document reference.
+
+    Raises:
+        ValueError: If the user ID or the image ID cannot be used as a document ID.
+    """
+    return get_receipts_collection(user_id).document(
+        validate_document_id(image_id, "image ID")
+    )
+
+
+def apply_receipt_changes(user_id: str, receipt_ids: List[str]) -> None:
+    """
+    Add receipts stored by another process to the loaded local indexes of their user.
+
+    Only the changed receipts are read. Adding a receipt already indexed replaces it,
+    so changes can be applied more than once.
+
+    Args:
+        user_id (str): The ID of the user.
+        receipt_ids (List[str]): The IDs of the changed receipts.
+    """
+    # Indexes being built may have scanned the receipts before they were stored
+    for indexes in (RECEIPT_ID_FILTERS, VECTOR_INDEXES, LEXICAL_INDEXES):
+        indexes.invalidate_builds(user_id)
+
+    id_filter = RECEIPT_ID_FILTERS.peek(user_id)
+    if id_filter is not None:
+        id_filter.update(receipt_ids)
+
+    vector_index = VECTOR_INDEXES.peek(user_id)
+    lexical_index = LEXICAL_INDEXES.peek(user_id)
+    if vector_index is None and lexical_index is None:
+        return
+
+    with stage("index_build", "changes"):
+        snapshots = get_db_client().get_all(
+            [get_receipt_document(user_id, receipt_id) for receipt_id in receipt_ids]
+        )
+        for snapshot in snapshots:
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict()
+            embedding = data.pop(EMBEDDING_FIELD_NAME, None)
+            if vector_index is not None and embedding is not None:
+                vector_index.add(data["receipt_id"], list(embedding), data, journal=False)
+            if lexical_index is not None:
+                lexical_index.add(
+                    snapshot.id, data, {field: data.get(field) for field in RECEIPT_FIELDS}
+                )
+
+
+def sync_local_indexes(user_id: str) -> None:
+    """
+    Bring the local indexes of a user up to date with the receipts stored by other processes.
+
+    The receipts changed since the indexed generation are added to the loaded
+    indexes, the indexes are unloaded and rebuilt on next access when the
+    changes are not recorded. The indexed generation is advanced before the
+    indexes are built, receipts stored during a build bump the generation
+    again and are applied by the next call.
+
+    Args:
+        user_id (str): The ID of the user.
+    """
+    generations = get_index_generations()
+    with INDEXED_GENERATION_LOCK:
+        indexed = INDEXED_GENERATIONS.get(user_id)
+        if indexed is not None:
+            INDEXED_GENERATIONS.move_to_end(user_id)
+
+    if indexed is None:
+        generation, receipt_ids = generations.get(user_id), None
+    else:
+        generation, receipt_ids = generations.changes_since(user_id, indexed)
+        if generation == indexed:
+            return
+
+    if receipt_ids is None:
+        for indexes in (RECEIPT_ID_FILTERS, VECTOR_INDEXES, LEXICAL_INDEXES):
+            indexes.discard(user_id)
+    else:
+        apply_receipt_changes(user_id, receipt_ids)
+
+    with INDEXED_GENERATION_LOCK:
+        # Concurrent calls apply the same changes, keep the latest generation
+        if INDEXED_GENERATIONS.get(user_id, -1) < generation:
+            INDEXED_GENERATIONS[user_id] = generation
+        INDEXED_GENERATIONS.move_to_end(user_id)
+        while len(INDEXED_GENERATIONS) > RECEIPT_ID_FILTERS_MAX_USERS:
+            INDEXED_GENERATIONS.popitem(last=False)
+
+
+def publish_local_indexes(user_id: str, receipt_ids: Optional[List[str]] = None) -> None:
+    """
+    Bump the index generation of a user after their receipts were stored and added to the local indexes.
+
+    The local indexes stay loaded when no other process stored receipts of the
+    user in the meantime, otherwise the changes are applied on next access.
+
+    Args:
+        user_id (str): The ID of the user.
+        receipt_ids (Optional[List[str]]): The IDs of the stored receipts, None makes
+            the other processes rebuild the indexes of the user.
+    """
+    generation = get_index_generations().bump(user_id, receipt_ids)
+    with INDEXED_GENERATION_LOCK:
+        if INDEXED_GENERATIONS.get(user_id) == generation - 1:
+            INDEXED_GENERATIONS[user_id] = generation
+
+
+def get_receipt_id_filter(user_id: str) -> BloomFilter:
+    """
+    Get the bloom filter of the receipt IDs stored by a user, loading it on first use.
+
+    Document IDs are listed without reading the documents themselves.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        BloomFilter: The receipt ID filter of the user.
+    """
+    sync_local_indexes(user_id)
+
+    def build() -> BloomFilter:
+        id_filter = BloomFilter(capacity=SETTINGS.RECEIPT_ID_FILTER_CAPACITY)
+        with stage("index_build", "receipt_id_filter"):
+            id_filter.update(
+                doc_ref.id for doc_ref in get_receipts_collection(user_id).list_documents()
+            )
+        return id_filter
+
+    return RECEIPT_ID_FILTERS.get(user_id, build)
+
+
+def build_rollup_increments(receipts: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Build the rollup documents counting new receipts, with their totals as increments.
+
+    Args:
+        receipts (List[Dict[str, Any]]): The new receipt documents.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The merge writes keyed by rollup document ID.
+    """
+
+    def as_increments(totals: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            key: as_increments(value)
+            if isinstance(value, dict)
+            else firestore.Increment(value)
+            for key, value in totals.items()
+        }
+
+    return {
+        rollup_id: {
+            **delta,
+            "totals": as_increments(delta["totals"]),
+            "stores": as_increments(delta["stores"]),
+        }
+        for rollup_id, delta in build_rollup_deltas(receipts).items()
+    }
+
+
+def add_rollup_writes(
+    batch: firestore.WriteBatch, user_id: str, receipts: List[Dict[str, Any]]
+) -> int:
+    """
+    Add the rollup increments of new receipts to a write batch.
+
+    The rollups are updated in the same atomic batch that creates the receipts,
+    so a receipt is counted exactly once or, if its create fails, not at all.
+
+    Args:
+        batch (firestore.WriteBatch): The batch creating the receipts.
+        user_id (str): The ID of the user owning the receipts.
+        receipts (List[Dict[str, Any]]): The new receipt documents.
+
+    Returns:
+        int: The number of writes added to the batch.
+    """
+    rollups_collection = get_rollups_collection(user_id)
+    increments = build_rollup_increments(receipts)
+    for rollup_id, data in increments.items():
+        batch.set(rollups_collection.document(rollup_id), data, merge=True)
+
+    return len(increments)
+
+
+def receipt_exists(user_id: str, image_id: str) -> bool:
+    """
+    Check whether a receipt is stored, skipping the database read when the ID was never seen.
+
+    Args:
+        user_id (str): The ID of the user.
+        image_id (str): The sanitized receipt image ID.
+
+    Returns:
+        bool: True if the receipt is stored.
+    """
+    skip_read = image_id not in get_receipt_id_filter(user_id)
+    record_cache_lookup("receipt_id_filter", skip_read)
+    if skip_read:
+        return False
+
+    return get_receipt_document(user_id, image_id).get(field_paths=["receipt_id"]).exists
+
+
+def embed_text(text: str) -> List[float]:
+    """
+    Get the embedding of a text, served from the embedding cache when possible.
+
+    Args:
+        text (str): The text to embed.
+
+    Returns:
+        List[float]: The embedding values.
+    """
+    embedding = get_embedding_cache().get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    with stage("embedding", "embed_content"):
+        result = get_genai_client().models.embed_content(model=EMBEDDING_MODEL, contents=text)
+    embedding = result.embeddings[0].values
+    get_embedding_cache().put(EMBEDDING_MODEL, text, embedding)
+
+    return embedding
+
+
+def get_vector_index_snapshot_path(user_id: str) -> str:
+    """Get the snapshot file of the local vector index of a user, empty if snapshots are disabled."""
+    if not SETTINGS.VECTOR_INDEX_SNAPSHOT_DIR:
+        return ""
+
+    # User IDs are hashed, they can hold characters that are not valid in file names
+    user_hash = hashlib.sha256(user_id.encode()).hexdigest()[:32]
+    return os.path.join(SETTINGS.VECTOR_INDEX_SNAPSHOT_DIR, f"{user_hash}.npz")
+
+
+def get_vector_index(user_id: str) -> Optional[LocalVectorIndex]:
+    """
+    Get the local vector index of a user, building it on first use.
+
+    The index is loaded from its snapshot when available, otherwise it is built
+    with a full scan of the receipts of the user and snapshotted. Only the
+    requests for the same user wait for the build.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        Optional[LocalVectorIndex]: The local vector index, or None if it is disabled.
+    """
+    if not SETTINGS.VECTOR_INDEX_ENABLED:
+        return None
+
+    sync_local_indexes(user_id)
+
+    def build() -> LocalVectorIndex:
+        snapshot_path = get_vector_index_snapshot_path(user_id)
+        if snapshot_path:
+            os.makedirs(SETTINGS.VECTOR_INDEX_SNAPSHOT_DIR, exist_ok=True)
+
+        index = LocalVectorIndex(
+            dimension=EMBEDDING_DIMENSION,
+            mode=SETTINGS.VECTOR_INDEX_MODE,
+            ivf_min_size=SETTINGS.VECTOR_INDEX_IVF_MIN_SIZE,
+            nprobe=SETTINGS.VECTOR_INDEX_IVF_NPROBE,
+            snapshot_path=snapshot_path,
+        )
+        if not index.load_snapshot():
+            with stage("index_build", "vector"):
+                for doc in get_receipts_collection(user_id).stream():
+                    data = doc.to_dict()
+                    embedding = data.pop(EMBEDDING_FIELD_NAME, None)
+                    if embedding is None:
+                        continue
+                    index.add(data["receipt_id"], list(embedding), data, journal=False)
+
+            index.save_snapshot()
+        return index
+
+    return VECTOR_INDEXES.get(user_id, build)
+
+
+def get_lexical_index(user_id: str) -> LexicalIndex:
+    """
+    Get the lexical index of a user, building it on first use.
+
+    The index is built from a scan of the displayed receipt fields, without embeddings,
+    which only blocks the requests for the same user.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        LexicalIndex: The lexical index of the user.
+    """
+    sync_local_indexes(user_id)
+
+    def build() -> LexicalIndex:
+        index = LexicalIndex()
+        with stage("index_build", "lexical"):
+            for doc in get_receipts_collection(user_id).select(RECEIPT_FIELDS).stream():
+                data = doc.to_dict()
+                index.add(doc.id, data, data)
+
+        logger.info("Built lexical index", user_id=user_id, size=len(index))
+        return index
+
+    return LEXICAL_INDEXES.get(user_id, build)
+
+
+def search_lexical_index(
+    user_id: str, query_text: str, k: int
+) -> List[Tuple[str, float, float, Dict[str, Any]]]:
+    """Search the lexical index of a user, building it on first use.
+
+    Returns:
+        List[Tuple[str, float, float, Dict[str, Any]]]: The hits of `LexicalIndex.search`.
+    """
+    return get_lexical_index(user_id).search(query_text, k)
+
+
+def find_nearest_receipts_in_firestore(
+    user_id: str, query_embedding: List[float], limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Run a Firestore vector search over the receipts of a user and return them without embeddings.
+
+    Args:
+        user_id (str): The ID of the user.
+        query_embedding (List[float]): The query embedding.
+        limit (int): Maximum number of results to return.
+
+    Returns:
+        List[Dict[str, Any]]: The receipt data ordered from nearest to farthest.
+    """
+    vector_query = get_receipts_collection(user_id).find_nearest(
+        vector_field=EMBEDDING_FIELD_NAME,
+        query_vector=Vector(query_embedding),
+        distance_measure=DistanceMeasure.EUCLIDEAN,
+        limit=limit,
+    )
+
+    receipts = []
+    for doc in vector_query.stream():
+        data = doc.to_dict()
+        data.pop(
+            EMBEDDING_FIELD_NAME, None
+        )  # Remove embedding as it's not needed for display
+        receipts.append(data)
+
+    return receipts
+
+
+def embed_texts(texts: List[str], batch_size: int = 50) -> List[List[float]]:
+    """
+    Get the embeddings of many texts, batching cache misses into few embedding requests.
+
+    Args:
+        texts (List[str]): The texts to embed.
+        batch_size (int, optional): Maximum number of texts sent in one embedding request.
+
+    Returns:
+        List[List[float]]: The embedding values, in the same order as the texts.
+    """
+    embeddings = [get_embedding_cache().get(EMBEDDING_MODEL, text) for text in texts]
+    missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start : start + batch_size]
+        with stage("embedding", "embed_content", batch_size=len(batch)):
+            result = get_genai_client().models.embed_content(
+                model=EMBEDDING_MODEL, contents=[texts[idx] for idx in batch]
+            )
+        for idx, embedding in zip(batch, result.embeddings):
+            embeddings[idx] = embedding.values
+            get_embedding_cache().put(EMBEDDING_MODEL, texts[idx], embedding.values)
+
+    return embeddings
+
+
+def validate_receipt_data(
+    image_id: str,
+    store_name: str,
+    transaction_time: str,
+    total_amount: float,
+    purchased_items: List[Dict[str, Any]],
+    currency: str = "IDR",
+) -> Dict[str, Any]:
+    """
+    Validate receipt fields and build the receipt document, without its embedding.
+
+    Args:
+        image_id (str): The unique identifier of the receipt image.
+        store_name (str): The name of the store.
+        transaction_time (str): The time of purchase, in ISO format ("YYYY-MM-DDTHH:MM:SS.ssssssZ").
+        total_amount (float): The total amount spent.
+        purchased_items (List[Dict[str, Any]]): A list of items purchased with their prices.
+        currency (str, optional): The currency of the transaction.
+
+    Returns:
+        Dict[str, Any]: The receipt document in the current schema, see `normalize_receipt`.
+
+    Raises:
+        ValueError: If the input is invalid.
+    """
+    # Validate transaction time
+    if not isinstance(transaction_time, str):
+        raise ValueError(
+            "Invalid transaction time: must be a string in ISO format 'YYYY-MM-DDTHH:MM:SS.ssssssZ'"
+        )
+    try:
+        parse_transaction_time(transaction_time)
+    except ValueError:
+        raise ValueError(
+            "Invalid transaction time format. Must be in ISO format 'YYYY-MM-DDTHH:MM:SS.ssssssZ'"
+        )
+
+    # Validate items format
+    if not isinstance(purchased_items, list):
+        raise ValueError(INVALID_ITEMS_FORMAT_ERR)
+
+    for _item in purchased_items:
+        if not isinstance(_item, dict) or "name" not in _item or "price" not in _item:
+            raise ValueError(INVALID_ITEMS_FORMAT_ERR)
+
+        if "quantity" not in _item:
+            _item["quantity"] = 1
+
+    receipt_id = validate_document_id(sanitize_image_id(image_id), "image ID")
+
+    receipt = normalize_receipt(
+        {
+            "receipt_id": receipt_id,
+            "store_name": store_name,
+            "transaction_time": transaction_time,
+            "total_amount": total_amount,
+            "currency": currency,
+            "purchased_items": purchased_items,
+        },
+        fx_table=FX_TABLE,
+        base_currency=SETTINGS.BASE_CURRENCY,
+    )
+    if receipt["total_amount_base"] is None:
+        # The receipt has no base currency amount, amount filters of metadata searches skip it
+        logger.warning(
+            "Receipt currency missing from the exchange rates",
+            receipt_id=receipt_id,
+            currency=receipt["currency"],
+            base_currency=receipt["base_currency"],
+        )
+
+    return receipt
+
+
+def record_stored_receipt(
+    user_id: str, receipt: Dict[str, Any], embedding: List[float]
+) -> None:
+    """
+    Add a newly stored receipt to the receipt ID filter and the local search indexes of its user.
+
+    Args:
+        user_id (str): The ID of the user owning the receipt.
+        receipt (Dict[str, Any]): The stored receipt document, without its embedding.
+        embedding (List[float]): The embedding of the receipt.
+    """
+    get_receipt_id_filter(user_id).add(receipt["receipt_id"])
+
+    index = get_vector_index(user_id)
+    if index is not None:
+        index.add(receipt["receipt_id"], embedding, receipt)
+
+    if SETTINGS.SEARCH_MODE == "hybrid":
+        get_lexical_index(user_id).add(
+            receipt["receipt_id"], receipt, {field: receipt[field] for field in RECEIPT_FIELDS}
+        )
+
+    publish_local_indexes(user_id, [receipt["receipt_id"]])
+
+
 def store_receipt_data(
     image_id: str,
     store_name: str,
     transaction_time: str,
     total_amount: float,
     purchased_items: List[Dict[str, Any]],
+    tool_context: ToolContext,
     currency: str = "IDR",
 ) -> str:
     """
@@ -63,6 +706,7 @@ def store_receipt_data(
             - name (str): The name of the item.
             - price (float): The price of the item.
             - quantity (int, optional): The quantity of the item. Defaults to 1 if not provided.
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
         currency (str, optional): The currency of the transaction, can be derived from the store location.
             If unsure, default is "IDR".
 
@@ -75,151 +719,512 @@ def store_receipt_data(
     try:
         # In case of it provide full image placeholder, extract the id string
         image_id = sanitize_image_id(image_id)
+        user_id = get_tool_user_id(tool_context)
 
         # Check if the receipt already exists
-        doc = get_receipt_data_by_image_id(image_id)
-
-        if doc:
+        if receipt_exists(user_id, image_id):
             return f"Receipt with ID {image_id} already exists"
 
-        # Validate transaction time
-        if not isinstance(transaction_time, str):
-            raise ValueError(
-                "Invalid transaction time: must be a string in ISO format 'YYYY-MM-DDTHH:MM:SS.ssssssZ'"
-            )
+        receipt = validate_receipt_data(
+            image_id=image_id,
+            store_name=store_name,
+            transaction_time=transaction_time,
+            total_amount=total_amount,
+            purchased_items=purchased_items,
+            currency=currency,
+        )
+
+        # Create a combined text from all receipt information for better embedding
+        embedding = embed_text(RECEIPT_DESC_FORMAT.format(**receipt))
+
+        doc = {**receipt, EMBEDDING_FIELD_NAME: Vector(embedding)}
+
+        # Create-if-absent write, a concurrent store of the same receipt fails here
+        # and its rollup increments in the same batch are not applied
+        batch = get_db_client().batch()
+        batch.create(get_receipt_document(user_id, image_id), doc)
+        add_rollup_writes(batch, user_id, [receipt])
         try:
-            datetime.datetime.fromisoformat(transaction_time.replace("Z", "+00:00"))
-        except ValueError:
-            raise ValueError(
-                "Invalid transaction time format. Must be in ISO format 'YYYY-MM-DDTHH:MM:SS.ssssssZ'"
-            )
+            batch.commit()
+        except AlreadyExists:
+            return f"Receipt with ID {image_id} already exists"
 
-        # Validate items format
-        if not isinstance(purchased_items, list):
-            raise ValueError(INVALID_ITEMS_FORMAT_ERR)
+        record_stored_receipt(user_id, receipt, embedding)
 
-        for _item in purchased_items:
-            if (
-                not isinstance(_item, dict)
-                or "name" not in _item
-                or "price" not in _item
-            ):
-                raise ValueError(INVALID_ITEMS_FORMAT_ERR)
+        return f"Receipt stored successfully with ID: {image_id}"
+    except Exception as e:
+        raise Exception(f"Failed to store receipt: {str(e)}")
 
-            if "quantity" not in _item:
-                _item["quantity"] = 1
 
-        # Create a combined text from all receipt information for better embedding
-        result = GENAI_CLIENT.models.embed_content(
-            model="text-embedding-004",
-            contents=RECEIPT_DESC_FORMAT.format(
-                store_name=store_name,
-                transaction_time=transaction_time,
-                total_amount=total_amount,
-                currency=currency,
-                purchased_items=purchased_items,
-                receipt_id=image_id,
-            ),
+def plan_spending_summary(
+    start_time: str, end_time: str, granularity: str
+) -> Tuple[datetime.date, datetime.date, List[Tuple[str, datetime.date, datetime.date, List[str]]]]:
+    """
+    Validate a spending summary request and list the rollups to read for each period.
+
+    Periods inside the range are read from their own rollup, periods cut by the
+    range boundaries are assembled from the daily rollups of the covered days.
+
+    Args:
+        start_time (str): The start of the range in ISO format.
+        end_time (str): The end of the range in ISO format, inclusive.
+        granularity (str): One of "day", "week" or "month".
+
+    Returns:
+        Tuple: The first and last date of the range, and the (period, clipped start,
+            clipped end, rollup IDs) of every period overlapping the range.
+
+    Raises:
+        ValueError: If the input is invalid.
+    """
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError(
+            f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}"
         )
+    try:
+        start_date = parse_transaction_date(start_time)
+        end_date = parse_transaction_date(end_time)
+    except (TypeError, AttributeError, ValueError):
+        raise ValueError("start_time and end_time must be strings in ISO format")
+    if end_date < start_date:
+        raise ValueError("end_time must not be before start_time")
 
-        embedding = result.embeddings[0].values
+    periods = []
+    for period, period_start, period_end in overlapping_periods(
+        granularity, start_date, end_date
+    ):
+        clipped_start = max(period_start, start_date)
+        clipped_end = min(period_end, end_date)
+        if (clipped_start, clipped_end) == (period_start, period_end):
+            rollup_ids = [rollup_document_id(granularity, period)]
+        else:
+            rollup_ids = [
+                rollup_document_id("day", day.isoformat())
+                for _, day, _ in overlapping_periods("day", clipped_start, clipped_end)
+            ]
+        periods.append((period, clipped_start, clipped_end, rollup_ids))
 
-        doc = {
-            "receipt_id": image_id,
-            "store_name": store_name,
-            "transaction_time": transaction_time,
-            "total_amount": total_amount,
-            "currency": currency,
-            "purchased_items": purchased_items,
-            EMBEDDING_FIELD_NAME: Vector(embedding),
+    return start_date, end_date, periods
+
+
+def summarize_spending(
+    granularity: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    periods: List[Tuple[str, datetime.date, datetime.date, List[str]]],
+    rollups: Dict[str, Dict[str, Any]],
+    group_by_store: bool,
+) -> Dict[str, Any]:
+    """
+    Assemble the spending summary from the rollups read for its periods.
+
+    Args:
+        granularity (str): The grouping used.
+        start_date (datetime.date): The first date of the range.
+        end_date (datetime.date): The last date of the range.
+        periods: The periods returned by `plan_spending_summary`.
+        rollups (Dict[str, Dict[str, Any]]): The existing rollup documents keyed by ID.
+        group_by_store (bool): Also break down each period by store.
+
+    Returns:
+        Dict[str, Any]: The summary, see `get_spending_summary`.
+    """
+    overall: Dict[str, Any] = {}
+    summary_periods = []
+    for period, clipped_start, clipped_end, rollup_ids in periods:
+        accumulated: Dict[str, Any] = {}
+        for rollup_id in rollup_ids:
+            if rollup_id in rollups:
+                merge_rollup(accumulated, rollups[rollup_id])
+        if not accumulated:
+            continue
+
+        merge_rollup(overall, accumulated)
+        summary_period = {
+            "period": period,
+            "start_date": clipped_start.isoformat(),
+            "end_date": clipped_end.isoformat(),
+            "by_currency": describe_totals(accumulated["totals"]),
         }
+        if group_by_store:
+            summary_period["by_store"] = {
+                store: describe_totals(totals)
+                for store, totals in sorted(accumulated["stores"].items())
+            }
+        summary_periods.append(summary_period)
 
-        COLLECTION.add(doc)
+    return {
+        "granularity": granularity,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "periods": summary_periods,
+        "overall": describe_totals(overall.get("totals", {})),
+    }
 
-        return f"Receipt stored successfully with ID: {image_id}"
+
+def get_spending_summary(
+    start_time: str,
+    end_time: str,
+    tool_context: ToolContext,
+    granularity: str = "month",
+    group_by_store: bool = False,
+) -> Dict[str, Any]:
+    """
+    Summarize spending within a date range: receipt counts, total amounts and averages
+    per currency, grouped by day, week or month and optionally by store.
+    Use this tool for any question about totals, counts or averages of spending
+    instead of adding up receipts from the search tools.
+
+    Args:
+        start_time (str): The start of the range (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
+            Only the UTC date is used, the range covers whole days.
+        end_time (str): The end of the range, inclusive (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
+            Only the UTC date is used, the range covers whole days.
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
+        granularity (str, optional): How to group the results, one of "day", "week" or "month".
+            Defaults to "month".
+        group_by_store (bool, optional): Also break down each period by store. Defaults to False.
+
+    Returns:
+        Dict[str, Any]: A dictionary with the following keys:
+            - granularity (str): The grouping used.
+            - start_date (str): The first date of the range.
+            - end_date (str): The last date of the range.
+            - periods (List[Dict[str, Any]]): One entry per period with its `period` label,
+              `start_date`, `end_date` (clipped to the range), `by_currency` totals and,
+              if requested, `by_store` totals. Each totals entry has `count`, `total` and `average`.
+            - overall (Dict[str, Dict[str, float]]): The totals of the whole range per currency.
+
+    Raises:
+        Exception: If the summary failed or input is invalid.
+    """
+    try:
+        start_date, end_date, periods = plan_spending_summary(
+            start_time, end_time, granularity
+        )
+
+        rollups_collection = get_rollups_collection(get_tool_user_id(tool_context))
+        rollups = {
+            snapshot.id: snapshot.to_dict()
+            for snapshot in get_db_client().get_all(
+                [
+                    rollups_collection.document(rollup_id)
+                    for *_, rollup_ids in periods
+                    for rollup_id in rollup_ids
+                ]
+            )
+            if snapshot.exists
+        }
+
+        return summarize_spending(
+            granularity, start_date, end_date, periods, rollups, group_by_store
+        )
     except Exception as e:
-        raise Exception(f"Failed to store receipt: {str(e)}")
+        raise Exception(f"Error summarizing spending: {str(e)}")
+
+
+def encode_page_token(transaction_timestamp: datetime.datetime, doc_id: str) -> str:
+    """Encode the position after the last returned receipt as an opaque page token."""
+    position = [format_transaction_time(transaction_timestamp), doc_id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_page_token(page_token: str) -> Dict[str, str]:
+    """
+    Decode a page token into the query cursor of the next page.
+
+    Raises:
+        ValueError: If the page token is invalid.
+    """
+    try:
+        transaction_time, doc_id = json.loads(base64.urlsafe_b64decode(page_token))
+        transaction_timestamp = parse_transaction_time(transaction_time)
+    except Exception:
+        raise ValueError("Invalid page_token, use the token returned by the previous search")
+
+    return {"transaction_timestamp": transaction_timestamp, "__name__": doc_id}
+
+
+def build_metadata_query(
+    collection: Any,
+    start_time: str,
+    end_time: str,
+    min_total_amount: float,
+    max_total_amount: float,
+    page_size: int,
+    page_token: str,
+) -> Tuple[Any, int]:
+    """
+    Build the query of one page of a metadata search, for a sync or async receipts collection.
+
+    The query fetches one more receipt than the page size, which tells whether
+    there is a next page.
+
+    Args:
+        collection: The receipts collection of the user.
+        start_time (str): The start datetime in ISO format.
+        end_time (str): The end datetime in ISO format.
+        min_total_amount (float): The minimum total amount in the base currency, -1 for no minimum.
+            Receipts without a base currency amount never match an amount filter.
+        max_total_amount (float): The maximum total amount in the base currency, -1 for no maximum.
+        page_size (int): The requested page size.
+        page_token (str): The page token of the previous page, empty for the first page.
+
+    Returns:
+        Tuple[Any, int]: The query and the page size, clamped to the allowed range.
+
+    Raises:
+        ValueError: If the input is invalid.
+    """
+    # Validate start and end times
+    if not isinstance(start_time, str) or not isinstance(end_time, str):
+        raise ValueError("start_time and end_time must be strings in ISO format")
+    try:
+        start_timestamp = parse_transaction_time(start_time)
+        end_timestamp = parse_transaction_time(end_time)
+    except ValueError:
+        raise ValueError("start_time and end_time must be strings in ISO format")
+
+    page_size = max(1, min(int(page_size), METADATA_SEARCH_MAX_PAGE_SIZE))
+
+    # Build the composite query by properly chaining conditions
+    filters = [
+        FieldFilter("transaction_timestamp", ">=", start_timestamp),
+        FieldFilter("transaction_timestamp", "<=", end_timestamp),
+    ]
+
+    # Add optional filters, on the amounts converted to the base currency so that
+    # receipts in different currencies compare
+    if min_total_amount != -1:
+        filters.append(FieldFilter("total_amount_base", ">=", min_total_amount))
+
+    if max_total_amount != -1:
+        filters.append(FieldFilter("total_amount_base", "<=", max_total_amount))
+
+    # Only the displayed fields are read, ordered by a unique key for stable pages
+    query = (
+        collection.where(filter=And(filters=filters))
+        .select(RECEIPT_FIELDS + ["transaction_timestamp"])
+        .order_by("transaction_timestamp")
+        .order_by(FieldPath.document_id())
+    )
+    if page_token:
+        query = query.start_after(decode_page_token(page_token))
+
+    return query.limit(page_size + 1), page_size
+
+
+def format_metadata_results(snapshots: List[Any], page_size: int) -> str:
+    """
+    Format one page of metadata search results, with the next page token if there are more.
+
+    Args:
+        snapshots (List[Any]): The receipt snapshots returned by the page query.
+        page_size (int): The page size, one less than the query limit.
+
+    Returns:
+        str: The formatted receipts.
+    """
+    lines = ["Search by Metadata Results:\n"]
+    for doc in snapshots[:page_size]:
+        lines.append(f"\n{RECEIPT_DESC_FORMAT.format(**doc.to_dict())}")
+
+    if len(snapshots) > page_size:
+        last_snapshot = snapshots[page_size - 1]
+        next_page_token = encode_page_token(
+            last_snapshot.get("transaction_timestamp"), last_snapshot.id
+        )
+        lines.append(
+            "\nMore receipts match these filters. To get them, call this tool again "
+            f"with the same filters and page_token=\"{next_page_token}\"\n"
+        )
+
+    return "".join(lines)
 
 
 def search_receipts_by_metadata_filter(
     start_time: str,
     end_time: str,
+    tool_context: ToolContext,
     min_total_amount: float = -1.0,
     max_total_amount: float = -1.0,
+    page_size: int = 20,
+    page_token: str = "",
 ) -> str:
     """
     Filter receipts by metadata within a specific time range and optionally by amount.
+    Results are ordered by transaction time and returned one page at a time.
 
     Args:
         start_time (str): The start datetime for the filter (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
         end_time (str): The end datetime for the filter (in ISO format, e.g. 'YYYY-MM-DDTHH:MM:SS.ssssssZ').
-        min_total_amount (float): The minimum total amount for the filter (inclusive). Defaults to -1.
-        max_total_amount (float): The maximum total amount for the filter (inclusive). Defaults to -1.
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
+        min_total_amount (float): The minimum total amount for the filter (inclusive), in the base
+            currency. Receipts in other currencies are compared by their converted amount, receipts
+            in a currency without an exchange rate are only returned without amount filters. Defaults to -1.
+        max_total_amount (float): The maximum total amount for the filter (inclusive), in the base
+            currency. Receipts in other currencies are compared by their converted amount, receipts
+            in a currency without an exchange rate are only returned without amount filters. Defaults to -1.
+        page_size (int, optional): Maximum number of receipts to return, at most 100. Defaults to 20.
+        page_token (str, optional): The next page token returned by a previous call with the same
+            filters, to get the following receipts. Defaults to "" for the first page.
 
     Returns:
-        str: A string containing the list of receipt data matching all applied filters.
+        str: A string containing the list of receipt data matching all applied filters,
+            followed by the next page token if more receipts match.
 
     Raises:
         Exception: If the search failed or input is invalid.
     """
     try:
-        # Validate start and end times
-        if not isinstance(start_time, str) or not isinstance(end_time, str):
-            raise ValueError("start_time and end_time must be strings in ISO format")
-        try:
-            datetime.datetime.fromisoformat(start_time.replace("Z", "+00:00"))
-            datetime.datetime.fromisoformat(end_time.replace("Z", "+00:00"))
-        except ValueError:
-            raise ValueError("start_time and end_time must be strings in ISO format")
-
-        # Start with the base collection reference
-        query = COLLECTION
-
-        # Build the composite query by properly chaining conditions
-        # Notes that this demo assume 1 user only,
-        # need to refactor the query for multiple user
-        filters = [
-            FieldFilter("transaction_time", ">=", start_time),
-            FieldFilter("transaction_time", "<=", end_time),
-        ]
-
-        # Add optional filters
-        if min_total_amount != -1:
-            filters.append(FieldFilter("total_amount", ">=", min_total_amount))
-
-        if max_total_amount != -1:
-            filters.append(FieldFilter("total_amount", "<=", max_total_amount))
-
-        # Apply the filters
-        composite_filter = And(filters=filters)
-        query = query.where(filter=composite_filter)
-
-        # Execute the query and collect results
-        search_result_description = "Search by Metadata Results:\n"
-        for doc in query.stream():
-            data = doc.to_dict()
-            data.pop(
-                EMBEDDING_FIELD_NAME, None
-            )  # Remove embedding as it's not needed for display
-
-            search_result_description += f"\n{RECEIPT_DESC_FORMAT.format(**data)}"
-
-        return search_result_description
+        query, page_size = build_metadata_query(
+            get_receipts_collection(get_tool_user_id(tool_context)),
+            start_time,
+            end_time,
+            min_total_amount,
+            max_total_amount,
+            page_size,
+            page_token,
+        )
+
+        return format_metadata_results(list(query.stream()), page_size)
     except Exception as e:
         raise Exception(f"Error filtering receipts: {str(e)}")
 
 
+def check_vector_recall(
+    receipts: List[Dict[str, Any]], firestore_receipts: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Compare local vector index results with Firestore vector search results.
+
+    Args:
+        receipts (List[Dict[str, Any]]): The results of the local vector index.
+        firestore_receipts (List[Dict[str, Any]]): The results of Firestore for the same query.
+
+    Returns:
+        List[Dict[str, Any]]: The local results, or the Firestore results if the recall
+            of the local index is below the minimum.
+    """
+    expected_ids = {data["receipt_id"] for data in firestore_receipts}
+    found_ids = {data["receipt_id"] for data in receipts}
+    recall = (
+        len(expected_ids & found_ids) / len(expected_ids)
+        if expected_ids
+        else 1.0
+    )
+    if recall < SETTINGS.VECTOR_INDEX_MIN_RECALL:
+        logger.warning(
+            "Local vector index recall below threshold, using Firestore results",
+            recall=recall,
+            min_recall=SETTINGS.VECTOR_INDEX_MIN_RECALL,
+        )
+        return firestore_receipts
+
+    return receipts
+
+
+def search_receipts_by_vector(
+    user_id: str, query_embedding: List[float], limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Find the receipts of a user nearest to a query embedding.
+
+    The local vector index is used when enabled, and periodically verified against Firestore.
+
+    Args:
+        user_id (str): The ID of the user.
+        query_embedding (List[float]): The query embedding.
+        limit (int): Maximum number of results to return.
+
+    Returns:
+        List[Dict[str, Any]]: The receipt data ordered from nearest to farthest.
+    """
+    index = get_vector_index(user_id)
+    if index is None:
+        return find_nearest_receipts_in_firestore(user_id, query_embedding, limit)
+
+    receipts = [data for _, _, data in index.search(query_embedding, limit)]
+
+    # Periodically verify the local index against Firestore
+    if random.random() < SETTINGS.VECTOR_INDEX_RECALL_SAMPLE_RATE:
+        receipts = check_vector_recall(
+            receipts, find_nearest_receipts_in_firestore(user_id, query_embedding, limit)
+        )
+
+    return receipts
+
+
+def lexical_fast_path_receipts(
+    lexical_hits: List[Tuple[str, float, float, Dict[str, Any]]], limit: int
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Answer a search from the lexical index alone when receipts contain every query term.
+
+    Args:
+        lexical_hits: The lexical search results, best first.
+        limit (int): Maximum number of results to return.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: The receipts matching every query term, or None
+            if the fast path is disabled or no receipt is a strong match.
+    """
+    if not SETTINGS.SEARCH_LEXICAL_FAST_PATH or not lexical_hits or lexical_hits[0][2] < 1.0:
+        return None
+
+    return [data for _, _, coverage, data in lexical_hits if coverage == 1.0][:limit]
+
+
+def fuse_search_results(
+    lexical_hits: List[Tuple[str, float, float, Dict[str, Any]]],
+    vector_receipts: List[Dict[str, Any]],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """
+    Merge lexical and vector search results into one hybrid ranking.
+
+    Args:
+        lexical_hits: The lexical search results, best first.
+        vector_receipts (List[Dict[str, Any]]): The vector search results, nearest first.
+        limit (int): Maximum number of results to return.
+
+    Returns:
+        List[Dict[str, Any]]: The receipt data, best fused rank first.
+    """
+    candidates = {doc_id: data for doc_id, _, _, data in lexical_hits}
+    for data in vector_receipts:
+        candidates.setdefault(data["receipt_id"], data)
+
+    ranking = fuse_rankings(
+        [doc_id for doc_id, *_ in lexical_hits],
+        [data["receipt_id"] for data in vector_receipts],
+        SETTINGS.SEARCH_HYBRID_LEXICAL_WEIGHT,
+    )
+    return [candidates[doc_id] for doc_id in ranking[:limit]]
+
+
+def format_search_results(receipts: List[Dict[str, Any]]) -> str:
+    """Format the receipts found by a natural language search."""
+    search_result_description = "Search by Contextual Relevance Results:\n"
+    for data in receipts:
+        search_result_description += f"\n{RECEIPT_DESC_FORMAT.format(**data)}"
+
+    return search_result_description
+
+
 def search_relevant_receipts_by_natural_language_query(
-    query_text: str, limit: int = 5
+    query_text: str, tool_context: ToolContext, limit: int = 5
 ) -> str:
     """
-    Search for receipts with content most similar to the query using vector search.
+    Search for receipts with content most similar to the query, matching store and item
+    names exactly and by meaning.
     This tool can be use for user query that is difficult to translate into metadata filters.
     Such as store name or item name which sensitive to string matching.
     Use this tool if you cannot utilize the search by metadata filter tool.
 
     Args:
         query_text (str): The search text (e.g., "coffee", "dinner", "groceries").
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
         limit (int, optional): Maximum number of results to return (default: 5).
 
     Returns:
@@ -229,42 +1234,42 @@ def search_relevant_receipts_by_natural_language_query(
         Exception: If the search failed or input is invalid.
     """
     try:
-        # Generate embedding for the query text
-        result = GENAI_CLIENT.models.embed_content(
-            model="text-embedding-004", contents=query_text
-        )
-        query_embedding = result.embeddings[0].values
-
-        # Notes that this demo assume 1 user only,
-        # need to refactor the query for multiple user
-        vector_query = COLLECTION.find_nearest(
-            vector_field=EMBEDDING_FIELD_NAME,
-            query_vector=Vector(query_embedding),
-            distance_measure=DistanceMeasure.EUCLIDEAN,
-            limit=limit,
-        )
+        user_id = get_tool_user_id(tool_context)
+        receipts = None
+
+        lexical_hits = []
+        if SETTINGS.SEARCH_MODE == "hybrid":
+            lexical_hits = search_lexical_index(
+                user_id, query_text, limit * HYBRID_CANDIDATES_PER_RESULT
+            )
 
-        # Execute the query and collect results
-        search_result_description = "Search by Contextual Relevance Results:\n"
-        for doc in vector_query.stream():
-            data = doc.to_dict()
-            data.pop(
-                EMBEDDING_FIELD_NAME, None
-            )  # Remove embedding as it's not needed for display
-            search_result_description += f"\n{RECEIPT_DESC_FORMAT.format(**data)}"
+            receipts = lexical_fast_path_receipts(lexical_hits, limit)
 
-        return search_result_description
+        if receipts is None:
+            # Generate embedding for the query text
+            query_embedding = embed_text(query_text)
+
+            if lexical_hits:
+                vector_receipts = search_receipts_by_vector(
+                    user_id, query_embedding, limit * HYBRID_CANDIDATES_PER_RESULT
+                )
+                receipts = fuse_search_results(lexical_hits, vector_receipts, limit)
+            else:
+                receipts = search_receipts_by_vector(user_id, query_embedding, limit)
+
+        return format_search_results(receipts)
     except Exception as e:
         raise Exception(f"Error searching receipts: {str(e)}")
 
 
-def get_receipt_data_by_image_id(image_id: str) -> Dict[str, Any]:
+def get_receipt_data_by_image_id(image_id: str, tool_context: ToolContext) -> Dict[str, Any]:
     """
     Retrieve receipt data from the database using the image_id.
 
     Args:
         image_id (str): The unique identifier of the receipt image. For example, if the placeholder is
             [IMAGE-ID 12345], the ID to use is 12345.
+        tool_context (ToolContext): The context of the tool call, set by the agent runner.
 
     Returns:
         Dict[str, Any]: A dictionary containing the receipt data with the following keys:
@@ -279,17 +1284,15 @@ def get_receipt_data_by_image_id(image_id: str) -> Dict[str, Any]:
     # In case of it provide full image placeholder, extract the id string
     image_id = sanitize_image_id(image_id)
 
-    # Query the receipts collection for documents with matching receipt_id (image_id)
-    # Notes that this demo assume 1 user only,
-    # need to refactor the query for multiple user
-    query = COLLECTION.where(filter=FieldFilter("receipt_id", "==", image_id)).limit(1)
-    docs = list(query.stream())
-
-    if not docs:
+    # Receipts are keyed by their image ID, so this is a single point read
+    try:
+        snapshot = get_receipt_document(get_tool_user_id(tool_context), image_id).get(
+            field_paths=RECEIPT_FIELDS
+        )
+    except ValueError:
         return {}
 
-    # Get the first matching document
-    doc_data = docs[0].to_dict()
-    doc_data.pop(EMBEDDING_FIELD_NAME, None)
+    if not snapshot.exists:
+        return {}
 
-    return doc_data
\ No newline at end of file
+    return snapshot.to_dict()
\ No newline at end of file
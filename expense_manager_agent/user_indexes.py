@@ -0,0 +1,97 @@
+# expense_manager_agent/user_indexes.py
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class PendingBuild:
+    """Build of the index of one user, shared by the threads requesting it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Threads building or waiting for the index
+        self.waiters = 0
+        # Set when the receipts changed during the build, the built index is then not cached
+        self.stale = False
+
+
+class UserIndexCache(Generic[T]):
+    """Local indexes of the users, the least recently used users are unloaded.
+
+    Indexes are built without holding the lock of the cache, so a user whose
+    index is built from a Firestore scan does not block the other users.
+    Concurrent requests for the same user wait for a single build.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._indexes: OrderedDict[str, T] = OrderedDict()
+        self._builds: Dict[str, PendingBuild] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, user_id: str) -> Optional[T]:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+        return index
+
+    def get(self, user_id: str, build: Callable[[], T]) -> T:
+        """Return the index of a user, building it on first use.
+
+        Args:
+            user_id: The ID of the user.
+            build: Builds the index of the user, called without the lock of the cache.
+
+        Returns:
+            T: The index of the user.
+        """
+        with self._lock:
+            index = self._lookup(user_id)
+            if index is not None:
+                return index
+            pending = self._builds.setdefault(user_id, PendingBuild())
+            pending.waiters += 1
+
+        try:
+            with pending.lock:
+                with self._lock:
+                    index = self._lookup(user_id)
+                    if index is not None:
+                        return index
+                    pending.stale = False
+
+                index = build()
+                with self._lock:
+                    if not pending.stale:
+                        self._indexes[user_id] = index
+                        while len(self._indexes) > self.max_users:
+                            self._indexes.popitem(last=False)
+                return index
+        finally:
+            with self._lock:
+                pending.waiters -= 1
+                if pending.waiters == 0:
+                    del self._builds[user_id]
+
+    def peek(self, user_id: str) -> Optional[T]:
+        """Return the index of a user if it is loaded, without building it."""
+        with self._lock:
+            return self._indexes.get(user_id)
+
+    def invalidate_builds(self, user_id: str) -> None:
+        """Keep the index being built for a user out of the cache, its scan may miss new receipts."""
+        with self._lock:
+            pending = self._builds.get(user_id)
+            if pending is not None:
+                pending.stale = True
+
+    def discard(self, user_id: str) -> None:
+        """Unload the index of a user, it is built again on next use."""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            pending = self._builds.get(user_id)
+            if pending is not None:
+                pending.stale = True
@@ -0,0 +1,365 @@
+# expense_manager_agent/vector_index.py
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import logger
+
+
+class LocalVectorIndex:
+    """In-process euclidean nearest neighbour index over receipt embeddings.
+
+    Small corpora are searched exhaustively ("flat"). Larger corpora are split
+    into k-means partitions and only the partitions closest to the query are
+    scanned ("ivf"). Every insert is appended to a journal next to the
+    snapshot file, so a warm restart only needs to load the snapshot and replay
+    the journal instead of scanning the whole collection.
+
+    The snapshot files can be shared by several processes. They are accessed
+    under a file lock, and rows written by other processes are merged in
+    before the snapshot is rewritten so that none of them is lost.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        mode: str = "auto",
+        ivf_min_size: int = 4096,
+        nprobe: int = 8,
+        snapshot_path: str = "",
+        journal_max_entries: int = 1000,
+    ):
+        """Initialize an empty index.
+
+        Args:
+            dimension: Size of the embedding vectors.
+            mode: "flat", "ivf" or "auto" (ivf once the index reaches ivf_min_size).
+            ivf_min_size: Number of vectors from which "auto" mode switches to ivf.
+            nprobe: Number of partitions scanned per query in ivf mode.
+            snapshot_path: Path of the .npz snapshot file, empty to keep the index in memory only.
+            journal_max_entries: Journal length after which the snapshot is rewritten.
+        """
+        if mode not in ("auto", "flat", "ivf"):
+            raise ValueError(f"Invalid vector index mode: {mode}")
+
+        self.dimension = dimension
+        self.mode = mode
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.snapshot_path = snapshot_path
+        self.journal_max_entries = journal_max_entries
+
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._count = 0
+
+        # IVF state, only populated once the partitions are trained
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+        self._journal_entries = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def journal_path(self) -> str:
+        return f"{self.snapshot_path}.journal"
+
+    def add(
+        self,
+        doc_id: str,
+        vector: Sequence[float],
+        metadata: Dict[str, Any],
+        journal: bool = True,
+    ) -> None:
+        """Insert or replace a vector.
+
+        Args:
+            doc_id: Identifier of the receipt.
+            vector: The embedding of the receipt.
+            metadata: Receipt data returned with search results, without the embedding.
+            journal: Whether to append the insert to the on-disk journal.
+        """
+        with self._lock:
+            self._add(doc_id, np.asarray(vector, dtype=np.float32), metadata)
+            self._maybe_train()
+
+            if journal and self.snapshot_path:
+                self._append_journal(doc_id, vector, metadata)
+
+    def search(
+        self, query: Sequence[float], k: int
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Return the k nearest receipts to the query vector.
+
+        Args:
+            query: The query embedding.
+            k: Maximum number of results.
+
+        Returns:
+            List[Tuple[str, float, Dict[str, Any]]]: (doc_id, euclidean distance, metadata)
+                tuples ordered from nearest to farthest.
+        """
+        with self._lock:
+            if self._count == 0 or k <= 0:
+                return []
+
+            query_vector = np.asarray(query, dtype=np.float32)
+            k = min(k, self._count)
+            candidates = None
+            if self._centroids is not None:
+                candidates = self._ivf_candidates(query_vector)
+            # Probed partitions holding fewer than k receipts fall back to a flat scan
+            if candidates is None or len(candidates) < k:
+                candidates = np.arange(self._count)
+
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+            sq_distances = (
+                self._sq_norms[candidates]
+                - 2.0 * (self._vectors[candidates] @ query_vector)
+                + float(query_vector @ query_vector)
+            )
+
+            top = np.argpartition(sq_distances, k - 1)[:k]
+            top = top[np.argsort(sq_distances[top])]
+
+            return [
+                (
+                    self._ids[candidates[i]],
+                    float(np.sqrt(max(sq_distances[i], 0.0))),
+                    self._metadata[candidates[i]],
+                )
+                for i in top
+            ]
+
+    @property
+    def lock_path(self) -> str:
+        return f"{self.snapshot_path}.lock"
+
+    def save_snapshot(self) -> None:
+        """Write the whole index to the snapshot file and truncate the journal."""
+        if not self.snapshot_path:
+            return
+
+        with self._lock, self._file_lock():
+            self._save_snapshot()
+
+    def load_snapshot(self) -> bool:
+        """Load the snapshot file and replay its journal.
+
+        Returns:
+            bool: True if a snapshot or journal was found and loaded, False otherwise.
+        """
+        if not self.snapshot_path:
+            return False
+
+        with self._lock, self._file_lock():
+            if not self._read_snapshot_files(only_missing=False):
+                return False
+            self._maybe_train()
+
+        logger.info(
+            "Loaded vector index snapshot", path=self.snapshot_path, size=self._count
+        )
+        return True
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the exclusive lock of the snapshot files, across processes."""
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_snapshot_files(self, only_missing: bool) -> bool:
+        """Add the rows of the snapshot file and its journal. Caller must hold both locks.
+
+        Args:
+            only_missing: Skip the rows already in the index, to merge in the rows
+                written by other processes without overwriting newer ones.
+
+        Returns:
+            bool: True if a snapshot or journal was found, False otherwise.
+        """
+        found = False
+        if os.path.exists(self.snapshot_path):
+            found = True
+            with np.load(self.snapshot_path, allow_pickle=False) as snapshot:
+                vectors = snapshot["vectors"]
+                ids = snapshot["ids"].tolist()
+                metadata = json.loads(str(snapshot["metadata"]))
+
+            for doc_id, vector, meta in zip(ids, vectors, metadata):
+                if not (only_missing and doc_id in self._rows):
+                    self._add(doc_id, vector, meta)
+
+        if os.path.exists(self.journal_path):
+            found = True
+            self._journal_entries = 0
+            with open(self.journal_path, "r") as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write at the end of the journal, skip it
+                        continue
+                    self._journal_entries += 1
+                    if not (only_missing and entry["id"] in self._rows):
+                        self._add(
+                            entry["id"],
+                            np.asarray(entry["vector"], dtype=np.float32),
+                            entry["metadata"],
+                        )
+
+        return found
+
+    def _save_snapshot(self) -> None:
+        """Merge the rows of other processes and rewrite the snapshot. Caller must hold both locks."""
+        self._read_snapshot_files(only_missing=True)
+        self._maybe_train()
+
+        tmp_path = f"{self.snapshot_path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=self._vectors[: self._count],
+            ids=np.array(self._ids, dtype=str),
+            metadata=np.array(json.dumps(self._metadata, default=str)),
+        )
+        os.replace(tmp_path, self.snapshot_path)
+
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+
+        logger.info(
+            "Saved vector index snapshot", path=self.snapshot_path, size=self._count
+        )
+
+    def _add(self, doc_id: str, vector: np.ndarray, metadata: Dict[str, Any]) -> None:
+        """Insert or replace a row without journaling. Caller must hold the lock."""
+        if vector.shape != (self.dimension,):
+            raise ValueError(
+                f"Expected vector of dimension {self.dimension}, got {vector.shape}"
+            )
+
+        row = self._rows.get(doc_id)
+        if row is None:
+            row = self._count
+            if row == len(self._vectors):
+                self._grow(max(64, row * 2))
+            self._rows[doc_id] = row
+            self._ids.append(doc_id)
+            self._metadata.append(metadata)
+            self._count += 1
+        else:
+            self._metadata[row] = metadata
+
+        self._vectors[row] = vector
+        self._sq_norms[row] = float(vector @ vector)
+        if self._centroids is not None:
+            self._assignments[row] = self._nearest_centroids(vector, 1)[0]
+
+    def _grow(self, capacity: int) -> None:
+        """Grow the backing arrays to the given capacity."""
+        vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        vectors[: self._count] = self._vectors[: self._count]
+        self._vectors = vectors
+        self._sq_norms = np.resize(self._sq_norms, capacity)
+
+        assignments = np.zeros(capacity, dtype=np.int32)
+        assignments[: self._count] = self._assignments[: self._count]
+        self._assignments = assignments
+
+    def _maybe_train(self) -> None:
+        """(Re)train the ivf partitions when the index outgrew the last training."""
+        if self.mode == "flat" or self._count == 0:
+            return
+        if self.mode == "auto" and self._count < self.ivf_min_size:
+            return
+        if self._centroids is not None and self._count < 2 * self._trained_size:
+            return
+
+        self._train_partitions()
+
+    def _train_partitions(self, iterations: int = 10) -> None:
+        """Cluster the vectors with k-means and assign every row to a partition."""
+        n_partitions = int(min(1024, max(1, np.sqrt(self._count))))
+        vectors = self._vectors[: self._count]
+
+        rng = np.random.default_rng(0)
+        sample_size = min(self._count, n_partitions * 256)
+        sample = vectors[rng.choice(self._count, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_partitions, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = self._closest(sample, centroids)
+            for partition in range(n_partitions):
+                members = sample[labels == partition]
+                if len(members):
+                    centroids[partition] = members.mean(axis=0)
+
+        self._centroids = centroids
+        self._assignments[: self._count] = self._closest(vectors, centroids)
+        self._trained_size = self._count
+
+        logger.info(
+            "Trained vector index partitions",
+            size=self._count,
+            partitions=n_partitions,
+        )
+
+    @staticmethod
+    def _closest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Index of the closest centroid for each vector, computed in chunks."""
+        centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 4096):
+            chunk = vectors[start : start + 4096]
+            labels[start : start + 4096] = np.argmin(
+                centroid_sq_norms - 2.0 * (chunk @ centroids.T), axis=1
+            )
+        return labels
+
+    def _nearest_centroids(self, vector: np.ndarray, n: int) -> np.ndarray:
+        """Indices of the n centroids closest to the vector."""
+        sq_distances = np.einsum(
+            "ij,ij->i", self._centroids, self._centroids
+        ) - 2.0 * (self._centroids @ vector)
+        n = min(n, len(self._centroids))
+        return np.argpartition(sq_distances, n - 1)[:n]
+
+    def _ivf_candidates(self, query: np.ndarray) -> np.ndarray:
+        """Rows belonging to the partitions closest to the query."""
+        probed = np.zeros(len(self._centroids), dtype=bool)
+        probed[self._nearest_centroids(query, self.nprobe)] = True
+        return np.flatnonzero(probed[self._assignments[: self._count]])
+
+    def _append_journal(
+        self, doc_id: str, vector: Sequence[float], metadata: Dict[str, Any]
+    ) -> None:
+        """Append an insert to the journal, compacting it into the snapshot when full."""
+        entry = {"id": doc_id, "vector": [float(v) for v in vector], "metadata": metadata}
+        with self._file_lock():
+            with open(self.journal_path, "a") as journal_file:
+                journal_file.write(json.dumps(entry, default=str) + "\n")
+            self._journal_entries += 1
+
+            if self._journal_entries >= self.journal_max_entries:
+                self._save_snapshot()
@@ -2,11 +2,20 @@ import mimetypes
 import gradio as gr
 import requests
 import base64
-from typing import List, Dict, Any
+import hashlib
+import os
+from typing import List, Dict, Any, Iterator
 from settings import get_settings
-from PIL import Image
-import io
+import json
+from contextlib import ExitStack
+from functools import lru_cache
 from schema import ImageData, ChatRequest, ChatResponse
+from backend_client import (
+    fetch_attachment,
+    get_attachment_cache,
+    request_backend,
+    store_inline_attachment,
+)
 
 
 SETTINGS = get_settings()
@@ -16,6 +25,8 @@ def encode_image_to_base64_and_get_mime_type(image_path: str) -> ImageData:
     """Encode a file to base64 string and get MIME type.
 
     Reads an image file and returns the base64-encoded image data and its MIME type.
+    Gradio stores uploads under a directory named after the hash of their content,
+    so the encoding is cached by path and a repeated image is only encoded once.
 
     Args:
         image_path: Path to the image file to encode.
@@ -23,6 +34,14 @@ def encode_image_to_base64_and_get_mime_type(image_path: str) -> ImageData:
     Returns:
         ImageData object containing the base64 encoded image data and its MIME type.
     """
+    # The size and modification time guard against a file rewritten in place
+    stat = os.stat(image_path)
+    return encode_image_file(image_path, stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=SETTINGS.FRONTEND_UPLOAD_CACHE_MAX_ENTRIES)
+def encode_image_file(image_path: str, size: int, mtime_ns: int) -> ImageData:
+    """Encode one version of an image file, see `encode_image_to_base64_and_get_mime_type`."""
     # Read the image file
     with open(image_path, "rb") as file:
         image_content = file.read()
@@ -37,24 +56,61 @@ def encode_image_to_base64_and_get_mime_type(image_path: str) -> ImageData:
     return ImageData(serialized_image=base64_data, mime_type=mime_type)
 
 
-def decode_base64_to_image(base64_data: str) -> Image.Image:
-    """Decode a base64 string to PIL Image.
+def prepare_request_kwargs(
+    message: Dict[str, Any], endpoint: str, files: ExitStack
+) -> Dict[str, Any]:
+    """Build the backend URL and request body for a chat message.
 
-    Converts a base64-encoded image string back to a PIL Image object
-    that can be displayed or processed further.
+    In "multipart" upload mode the image files are sent as raw bytes in a
+    multipart/form-data body, otherwise they are base64 encoded into the JSON body.
 
     Args:
-        base64_data: Base64 encoded string of the image.
+        message: Dictionary containing the current message with 'text' and optional 'files' keys.
+        endpoint: Backend chat endpoint URL.
+        files: Exit stack that closes the opened image files once the request is done.
 
     Returns:
-        PIL Image object of the decoded image.
+        Keyword arguments for `request_backend`.
     """
-    # Decode the base64 string and convert to PIL Image
-    image_data = base64.b64decode(base64_data)
-    image_buffer = io.BytesIO(image_data)
-    image = Image.open(image_buffer)
+    uploaded_files = message.get("files", [])
 
-    return image
+    if SETTINGS.BACKEND_UPLOAD_MODE == "multipart":
+        return {
+            "url": f"{endpoint}/multipart",
+            "data": {
+                "text": message["text"],
+                "session_id": "default_session",
+                "user_id": "default_user",
+                "inline_attachments": "false",
+            },
+            "files": [
+                (
+                    "files",
+                    (
+                        file_path,
+                        files.enter_context(open(file_path, "rb")),
+                        mimetypes.guess_type(file_path)[0],
+                    ),
+                )
+                for file_path in uploaded_files
+            ],
+        }
+
+    # Extract files and convert to base64
+    image_data = [
+        encode_image_to_base64_and_get_mime_type(file_path)
+        for file_path in uploaded_files
+    ]
+
+    # Prepare the request payload
+    payload = ChatRequest(
+        text=message["text"],
+        files=image_data,
+        session_id="default_session",
+        user_id="default_user",
+        inline_attachments=False,
+    )
+    return {"url": endpoint, "json": payload.model_dump()}
 
 
 def get_response_from_llm_backend(
@@ -70,23 +126,12 @@ def get_response_from_llm_backend(
     Returns:
         List containing text response and any image attachments from the backend service.
     """
-    # Extract files and convert to base64
-    image_data = []
-    if uploaded_files := message.get("files", []):
-        for file_path in uploaded_files:
-            image_data.append(encode_image_to_base64_and_get_mime_type(file_path))
-
-    # Prepare the request payload
-    payload = ChatRequest(
-        text=message["text"],
-        files=image_data,
-        session_id="default_session",
-        user_id="default_user",
-    )
-
     # Send request to backend
     try:
-        response = requests.post(SETTINGS.BACKEND_URL, json=payload.model_dump())
+        with ExitStack() as files:
+            response = request_backend(
+                "POST", **prepare_request_kwargs(message, SETTINGS.BACKEND_URL, files)
+            )
         response.raise_for_status()  # Raise exception for HTTP errors
 
         result = ChatResponse(**response.json())
@@ -106,19 +151,134 @@ def get_response_from_llm_backend(
 
         chat_responses.append(gr.ChatMessage(role="assistant", content=result.response))
 
+        # Attachments are cached as files by content hash, Gradio serves them without decoding
         if result.attachments:
             for attachment in result.attachments:
                 image_data = attachment.serialized_image
-                chat_responses.append(gr.Image(decode_base64_to_image(image_data)))
+                attachment_id = hashlib.sha256(image_data.encode("utf-8")).hexdigest()
+                chat_responses.append(
+                    gr.Image(
+                        store_inline_attachment(attachment_id, image_data, attachment.mime_type)
+                    )
+                )
+        else:
+            for attachment_ref in result.attachment_refs:
+                chat_responses.append(
+                    gr.Image(fetch_attachment(attachment_ref.id, attachment_ref.url))
+                )
 
         return chat_responses
     except requests.exceptions.RequestException as e:
         return [f"Error connecting to backend service: {str(e)}"]
 
 
+def iter_server_sent_events(response: requests.Response) -> Iterator[tuple[str, dict]]:
+    """Parse a Server-Sent Events HTTP response.
+
+    Args:
+        response: Streaming HTTP response from the backend.
+
+    Yields:
+        Tuple of the event name and its decoded JSON data.
+    """
+    event_name, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            field, _, value = line.partition(":")
+            if field == "event":
+                event_name = value.strip()
+            elif field == "data":
+                data_lines.append(value.removeprefix(" "))
+            continue
+
+        # A blank line terminates the event
+        if data_lines:
+            yield event_name, json.loads("\n".join(data_lines))
+        event_name, data_lines = "message", []
+
+
+def stream_response_from_llm_backend(
+    message: Dict[str, Any],
+    history: List[Dict[str, Any]],
+) -> Iterator[List[str | gr.Image]]:
+    """Send the message to the streaming backend endpoint and render the response progressively.
+
+    Args:
+        message: Dictionary containing the current message with 'text' and optional 'files' keys.
+        history: List of previous message dictionaries in the conversation.
+
+    Yields:
+        The chat messages received so far: thinking process, response text and image attachments.
+    """
+    thinking_process, response_text, attachments = "", "", []
+    tool_progress = []
+
+    def render() -> List[str | gr.Image]:
+        chat_responses = []
+        thinking_content = "\n".join(tool_progress + [thinking_process]).strip()
+        if thinking_content:
+            chat_responses.append(
+                gr.ChatMessage(
+                    role="assistant",
+                    content=thinking_content,
+                    metadata={"title": "🧠 Thinking Process"},
+                )
+            )
+        if response_text:
+            chat_responses.append(gr.ChatMessage(role="assistant", content=response_text))
+        chat_responses.extend(attachments)
+        return chat_responses
+
+    try:
+        with ExitStack() as files, request_backend(
+            "POST",
+            **prepare_request_kwargs(message, f"{SETTINGS.BACKEND_URL}/stream", files),
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+
+            for event_name, data in iter_server_sent_events(response):
+                if event_name == "error":
+                    yield [f"Error: {data['error']}"]
+                    return
+                elif event_name == "tool_call":
+                    tool_progress.append(f"🔧 Calling `{data['name']}`")
+                elif event_name == "tool_result":
+                    tool_progress.append(f"✅ `{data['name']}` finished")
+                elif event_name == "thinking":
+                    thinking_process += data["delta"]
+                elif event_name == "response":
+                    response_text += data["delta"]
+                elif event_name == "done":
+                    thinking_process = data["thinking_process"]
+                    response_text = data["response"]
+                    yield render()
+
+                    for attachment_ref in data["attachment_refs"]:
+                        attachments.append(
+                            gr.Image(
+                                fetch_attachment(attachment_ref["id"], attachment_ref["url"])
+                            )
+                        )
+                        yield render()
+                    continue
+                elif event_name == "attachment":
+                    attachments.append(
+                        gr.Image(
+                            store_inline_attachment(
+                                data["id"], data["serialized_image"], data["mime_type"]
+                            )
+                        )
+                    )
+
+                yield render()
+    except requests.exceptions.RequestException as e:
+        yield [f"Error connecting to backend service: {str(e)}"]
+
+
 if __name__ == "__main__":
     demo = gr.ChatInterface(
-        get_response_from_llm_backend,
+        stream_response_from_llm_backend,
         title="Personal Expense Assistant",
         description="This assistant can help you to store receipts data, find receipts, and track your expenses during certain period.",
         type="messages",
@@ -126,7 +286,14 @@ if __name__ == "__main__":
         textbox=gr.MultimodalTextbox(file_count="multiple", file_types=["image"]),
     )
 
+    # Chat handlers mostly wait on the backend, let many users chat at the same time
+    demo.queue(
+        default_concurrency_limit=SETTINGS.FRONTEND_CONCURRENCY_LIMIT,
+        max_size=SETTINGS.FRONTEND_QUEUE_MAX_SIZE,
+    )
     demo.launch(
         server_name="0.0.0.0",
         server_port=8080,
+        max_threads=max(40, SETTINGS.FRONTEND_CONCURRENCY_LIMIT),
+        allowed_paths=[get_attachment_cache().cache_dir],
     )
\ No newline at end of file
@@ -0,0 +1,182 @@
+import io
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+import logger
+from schema import UploadedImage
+from settings import get_settings
+
+SETTINGS = get_settings()
+
+# Gemini bills an image up to 384px on both edges as one tile, larger images
+# are split into 768x768 tiles
+IMAGE_TILE_TOKENS = 258
+IMAGE_SMALL_EDGE = 384
+IMAGE_TILE_EDGE = 768
+
+OUTPUT_MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+@dataclass
+class PreprocessReport:
+    """Size and estimated token cost of an image before and after preprocessing."""
+
+    hash_id: str
+    original_bytes: int
+    processed_bytes: int
+    original_size: tuple[int, int]
+    processed_size: tuple[int, int]
+    original_tokens: int
+    processed_tokens: int
+    elapsed_ms: float
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.processed_bytes
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.processed_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "saved_bytes": self.saved_bytes,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Estimate the number of input tokens the model bills for an image.
+
+    Args:
+        width: Image width in pixels.
+        height: Image height in pixels.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    if width <= IMAGE_SMALL_EDGE and height <= IMAGE_SMALL_EDGE:
+        return IMAGE_TILE_TOKENS
+
+    tiles = math.ceil(width / IMAGE_TILE_EDGE) * math.ceil(height / IMAGE_TILE_EDGE)
+    return tiles * IMAGE_TILE_TOKENS
+
+
+def preprocess_image_bytes(
+    data: bytes,
+    max_long_edge: int,
+    grayscale: bool,
+    output_format: str,
+    quality: int,
+) -> tuple[bytes, tuple[int, int], tuple[int, int]]:
+    """Normalize orientation, downscale and recompress an image.
+
+    Args:
+        data: The original encoded image.
+        max_long_edge: Maximum length in pixels of the longest edge, 0 to keep the size.
+        grayscale: Convert the image to grayscale.
+        output_format: Output format, "WEBP" or "JPEG".
+        quality: Encoder quality from 1 to 100.
+
+    Returns:
+        tuple[bytes, tuple[int, int], tuple[int, int]]: The encoded image, the
+            original size and the processed size.
+
+    Raises:
+        PIL.UnidentifiedImageError: If the data is not a supported image.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        original_size = image.size
+
+        # Decode at a reduced scale when the format supports it (JPEG)
+        if max_long_edge:
+            image.draft(None, (max_long_edge, max_long_edge))
+
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("L" if grayscale else "RGB")
+        if max_long_edge and max(image.size) > max_long_edge:
+            image.thumbnail((max_long_edge, max_long_edge), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format=output_format, quality=quality)
+
+        return output.getvalue(), original_size, image.size
+
+
+@lru_cache(maxsize=1)
+def get_preprocess_executor() -> ThreadPoolExecutor:
+    """Return the worker pool shared by all requests for image preprocessing.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so the
+    workers run in parallel and the pool size bounds the CPU used for
+    preprocessing across concurrent requests.
+    """
+    return ThreadPoolExecutor(
+        max_workers=SETTINGS.IMAGE_PREPROCESS_WORKERS,
+        thread_name_prefix="image-preprocess",
+    )
+
+
+def preprocess_uploaded_image(image: UploadedImage) -> UploadedImage:
+    """Run the configured preprocessing stage on an uploaded image.
+
+    The returned image keeps the hash ID of the original bytes, so the image ID
+    shown to the user and stored in receipts does not depend on the settings.
+    Images that cannot be decoded, or that would grow, are returned unchanged.
+
+    Args:
+        image: The uploaded image with its original bytes.
+
+    Returns:
+        UploadedImage: The image to send to the model and store as artifact.
+    """
+    if not SETTINGS.IMAGE_PREPROCESS_ENABLED:
+        return image
+
+    output_format = SETTINGS.IMAGE_PREPROCESS_FORMAT.upper()
+    start = time.perf_counter()
+    try:
+        data, original_size, processed_size = (
+            get_preprocess_executor()
+            .submit(
+                preprocess_image_bytes,
+                image.data,
+                SETTINGS.IMAGE_PREPROCESS_MAX_LONG_EDGE,
+                SETTINGS.IMAGE_PREPROCESS_GRAYSCALE,
+                output_format,
+                SETTINGS.IMAGE_PREPROCESS_QUALITY,
+            )
+            .result()
+        )
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.warning(
+            "Skipping preprocessing of undecodable image",
+            hash_id=image.hash_id,
+            error_message=str(e),
+        )
+        return image
+
+    if len(data) >= len(image.data) and processed_size == original_size:
+        return image
+
+    report = PreprocessReport(
+        hash_id=image.hash_id,
+        original_bytes=len(image.data),
+        processed_bytes=len(data),
+        original_size=original_size,
+        processed_size=processed_size,
+        original_tokens=estimate_image_tokens(*original_size),
+        processed_tokens=estimate_image_tokens(*processed_size),
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 2),
+    )
+    logger.info("Preprocessed receipt image", **report.to_dict())
+
+    return UploadedImage(
+        data=data, mime_type=OUTPUT_MIME_TYPES[output_format], hash_id=image.hash_id
+    )
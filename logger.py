@@ -1,37 +1,202 @@
+import atexit
 import json
 import logging
+import os
+import queue
+import random
 import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional, TextIO
 
-# Set up structured logging for GCP
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+from settings import get_settings
 
-# Configure handler to output JSON logs that work well with GCP
-handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(logging.Formatter("%(message)s"))
-logger.addHandler(handler)
+try:
+    import orjson
+except ImportError:  # The standard library encoder is used instead
+    orjson = None
+
+SETTINGS = get_settings()
+
+SEVERITY_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+# Entries written with a single write call, at most
+WRITER_BATCH_MAX_ENTRIES = 512
+# How long the writer waits for the queue to drain when the process exits
+EXIT_FLUSH_TIMEOUT_SECONDS = 2.0
+
+
+class Lazy:
+    """Log field computed only when the entry is written, e.g. `history=Lazy(dump_history)`."""
+
+    __slots__ = ("function",)
+
+    def __init__(self, function: Callable[[], Any]):
+        self.function = function
+
+
+def truncate_value(value: Any, max_chars: int) -> Any:
+    """Cut the strings of a log field, nested ones included, to a maximum length."""
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return f"{value[:max_chars]}... [truncated {len(value) - max_chars} chars]"
+    if isinstance(value, dict):
+        return {key: truncate_value(item, max_chars) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [truncate_value(item, max_chars) for item in value]
+    return value
+
+
+def encode_entry(entry: Dict[str, Any]) -> str:
+    """Encode a log entry as one line of JSON, with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(entry, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # Integers over 64 bits, the standard encoder handles them
+            pass
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class LogWriter:
+    """Background thread writing the encoded log entries to a stream in batches.
+
+    Logging only encodes the entry and puts it on a bounded queue, the stream
+    is written and flushed by the writer thread, once per batch of queued
+    entries. Entries logged while the queue is full are dropped and counted,
+    the writer reports them with the next batch.
+    """
+
+    def __init__(self, stream: TextIO, max_entries: int):
+        self.stream = stream
+        self._queue: queue.Queue = queue.Queue(maxsize=max_entries)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._dropped = 0
+
+    def write(self, line: str) -> None:
+        """Queue an encoded entry, starting the writer thread of the process on first use."""
+        # Processes forked after the first entry do not inherit the thread
+        if self._thread_pid != os.getpid():
+            self._start()
+
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait until the queued entries are written."""
+        if self._thread_pid != os.getpid():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            # A queue inherited from the parent process can hold a lock taken by its writer
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Any] = [self._queue.get()]
+            while len(batch) < WRITER_BATCH_MAX_ENTRIES:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [item for item in batch if isinstance(item, str)]
+            with self._lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                lines.append(
+                    encode_entry(
+                        {
+                            "severity": "WARNING",
+                            "message": "Log entries dropped, the log queue was full",
+                            "dropped_entries": dropped,
+                        }
+                    )
+                )
+
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except Exception as e:
+                    sys.stderr.write(f"Failed to write log entries: {e}\n")
+
+            # Flush requests are answered once the entries queued before them are written
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+
+# Structured logs for GCP, one JSON entry per line on stdout
+writer = LogWriter(sys.stdout, max_entries=SETTINGS.LOG_QUEUE_MAX_ENTRIES)
+level = SEVERITY_LEVELS[SETTINGS.LOG_LEVEL.upper()]
+atexit.register(writer.flush, EXIT_FLUSH_TIMEOUT_SECONDS)
+
+
+def set_stream(stream: TextIO) -> None:
+    """Write the logs to another stream, e.g. to keep stdout for a command output."""
+    writer.flush()
+    writer.stream = stream
+
+
+def is_enabled(severity: str) -> bool:
+    """Whether entries of a severity are written, to skip building costly fields."""
+    return SEVERITY_LEVELS.get(severity, logging.INFO) >= level
 
 
 def log_structured(severity, message, **kwargs):
     """
     Log a structured message compatible with Google Cloud Logging.
 
+    The entry is encoded by the caller and written to stdout by a background
+    thread. String fields longer than LOG_MAX_FIELD_CHARS are truncated, DEBUG
+    entries are sampled with LOG_DEBUG_SAMPLE_RATE.
+
     Args:
         severity: The log severity ('INFO', 'ERROR', 'WARNING', 'DEBUG')
         message: The main log message
-        **kwargs: Additional key-value pairs to include in the log
+        **kwargs: Additional key-value pairs to include in the log, `Lazy` values
+            are only computed if the entry is written
     """
-    log_entry = {"severity": severity, "message": message, **kwargs}
-
-    json_entry = json.dumps(log_entry)
-    if severity == "ERROR":
-        logger.error(json_entry)
-    elif severity == "WARNING":
-        logger.warning(json_entry)
-    elif severity == "DEBUG":
-        logger.debug(json_entry)
-    else:
-        logger.info(json_entry)
+    if not is_enabled(severity):
+        return
+    if severity == "DEBUG" and SETTINGS.LOG_DEBUG_SAMPLE_RATE < 1.0:
+        if random.random() >= SETTINGS.LOG_DEBUG_SAMPLE_RATE:
+            return
+        kwargs["sample_rate"] = SETTINGS.LOG_DEBUG_SAMPLE_RATE
+
+    for key, value in kwargs.items():
+        if isinstance(value, Lazy):
+            value = value.function()
+        kwargs[key] = truncate_value(value, SETTINGS.LOG_MAX_FIELD_CHARS)
+
+    log_entry = {
+        "severity": severity,
+        "message": truncate_value(message, SETTINGS.LOG_MAX_FIELD_CHARS),
+        **kwargs,
+    }
+    writer.write(encode_entry(log_entry))
 
 
 # Convenience methods
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 
@@ -14,6 +14,20 @@ class ImageData(BaseModel):
     mime_type: str
 
 
+class UploadedImage(BaseModel):
+    """Model for a binary uploaded image.
+
+    Attributes:
+        data: Raw bytes of the image.
+        mime_type: MIME type of the image.
+        hash_id: Hash identifier of the image, computed from its raw bytes.
+    """
+
+    data: bytes
+    mime_type: str
+    hash_id: str
+
+
 class ChatRequest(BaseModel):
     """Model for a chat request.
 
@@ -22,12 +36,28 @@ class ChatRequest(BaseModel):
         files: List of image data objects
         session_id: Session identifier for the conversation.
         user_id: User identifier for the conversation.
+        inline_attachments: Whether response attachments are also sent inline as base64.
+        uploads: List of binary images from a multipart request, never serialized.
     """
 
     text: str
     files: List[ImageData] = []
     session_id: str = "default_session"
     user_id: str = "default_user"
+    inline_attachments: bool = True
+    uploads: List[UploadedImage] = Field(default=[], exclude=True)
+
+
+class AttachmentReference(BaseModel):
+    """Model for a reference to an attachment served by the attachments endpoint.
+
+    Attributes:
+        id: Hash identifier of the image.
+        url: Backend relative URL of the image.
+    """
+
+    id: str
+    url: str
 
 
 class ChatResponse(BaseModel):
@@ -36,11 +66,14 @@ class ChatResponse(BaseModel):
     Attributes:
         response: The text response from the model.
         thinking_process: Optional thinking process of the model.
-        attachments: List of image data to be displayed to the user.
+        attachments: List of image data to be displayed to the user, only
+            filled when the request asked for inline attachments.
+        attachment_refs: List of references to the images to be displayed to the user.
         error: Optional error message if something went wrong.
     """
 
     response: str
     thinking_process: str = ""
     attachments: List[ImageData] = []
+    attachment_refs: List[AttachmentReference] = []
     error: Optional[str] = None
@@ -0,0 +1,376 @@
+# scripts/bulk_import_receipts.py
+"""Bulk import structured receipts into the receipts collection of a user.
+
+Reads receipts from a JSONL or CSV file as a stream, validates them with the
+same rules as the `store_receipt_data` tool, embeds each chunk of receipts
+with batched embedding requests and commits each chunk with a single
+Firestore batch of create-if-absent writes keyed by receipt ID, together with
+the increments of the spending rollups.
+
+Usage:
+    uv run python -m scripts.bulk_import_receipts receipts.jsonl --user-id USER_ID --checkpoint import.ckpt
+
+JSONL records and CSV rows use the `store_receipt_data` argument names
+(`image_id` or `receipt_id`, `store_name`, `transaction_time`,
+`total_amount`, `currency`, `purchased_items`). In CSV files
+`purchased_items` is a JSON encoded list.
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Tuple
+
+from google.cloud.firestore_v1.vector import Vector
+
+import logger
+from expense_manager_agent.tools import (
+    EMBEDDING_FIELD_NAME,
+    RECEIPT_DESC_FORMAT,
+    RECEIPT_FIELDS,
+    ROLLUP_GRANULARITIES,
+    SETTINGS,
+    add_rollup_writes,
+    embed_texts,
+    get_db_client,
+    get_embedding_cache,
+    get_receipt_document,
+    get_lexical_index,
+    get_receipt_id_filter,
+    get_vector_index,
+    publish_local_indexes,
+    validate_receipt_data,
+)
+
+# Firestore limit
+MAX_BATCH_WRITES = 500
+
+# Each receipt is one create plus at most one new rollup document per granularity
+MAX_BATCH_RECEIPTS = MAX_BATCH_WRITES // (1 + len(ROLLUP_GRANULARITIES))
+
+
+@dataclass
+class ChunkResult:
+    """Outcome of importing one chunk of records."""
+
+    stored: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    failed: int = 0
+
+
+@dataclass
+class ImportReport:
+    """Aggregated outcome of an import run."""
+
+    records: int = 0
+    stored: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def add(self, result: ChunkResult, records: int) -> None:
+        self.records += records
+        self.stored += result.stored
+        self.duplicates += result.duplicates
+        self.invalid += result.invalid
+        self.failed += result.failed
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "records": self.records,
+            "stored": self.stored,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(self.records / elapsed, 2) if elapsed else 0.0,
+            "embedding_cache": get_embedding_cache().stats(),
+        }
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any] | str]:
+    """Stream receipt records from a JSONL or CSV file.
+
+    Args:
+        path: Path of the input file, the format is derived from its extension.
+
+    Yields:
+        Dict[str, Any] | str: One raw receipt record, either a CSV row or a JSONL line.
+    """
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield line
+
+
+def to_receipt_arguments(record: Dict[str, Any] | str) -> Dict[str, Any]:
+    """Map a raw input record to `validate_receipt_data` keyword arguments.
+
+    Raises:
+        ValueError: If the record cannot be decoded.
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+        if not isinstance(record, dict):
+            raise ValueError("Record must be a JSON object")
+
+    purchased_items = record.get("purchased_items")
+    if isinstance(purchased_items, str):
+        purchased_items = json.loads(purchased_items or "[]")
+
+    return {
+        "image_id": str(record.get("image_id") or record.get("receipt_id") or ""),
+        "store_name": record.get("store_name"),
+        "transaction_time": record.get("transaction_time"),
+        "total_amount": float(record.get("total_amount")),
+        "purchased_items": purchased_items,
+        "currency": record.get("currency") or "IDR",
+    }
+
+
+def find_existing_receipt_ids(user_id: str, receipt_ids: List[str]) -> set[str]:
+    """Return the subset of receipt IDs that are already stored for a user.
+
+    IDs rejected by the receipt ID bloom filter are never read, the rest are
+    confirmed with a single batched point read.
+    """
+    id_filter = get_receipt_id_filter(user_id)
+    candidates = [receipt_id for receipt_id in receipt_ids if receipt_id in id_filter]
+    if not candidates:
+        return set()
+
+    snapshots = get_db_client().get_all(
+        [get_receipt_document(user_id, receipt_id) for receipt_id in candidates],
+        field_paths=["receipt_id"],
+    )
+    return {snapshot.id for snapshot in snapshots if snapshot.exists}
+
+
+def import_chunk(
+    user_id: str,
+    chunk: List[Tuple[int, Dict[str, Any] | str]],
+    embedding_batch_size: int,
+) -> ChunkResult:
+    """Validate, deduplicate, embed and write one chunk of records.
+
+    Args:
+        user_id: The ID of the user owning the receipts.
+        chunk: (record number, record) pairs.
+        embedding_batch_size: Maximum number of texts per embedding request.
+
+    Returns:
+        ChunkResult: Counters for the chunk.
+    """
+    result = ChunkResult()
+    receipts: Dict[str, Dict[str, Any]] = {}
+
+    for record_number, record in chunk:
+        try:
+            receipt = validate_receipt_data(**to_receipt_arguments(record))
+            if not receipt["receipt_id"]:
+                raise ValueError("Missing receipt ID")
+        except (ValueError, TypeError) as e:
+            result.invalid += 1
+            logger.warning("Skipping invalid receipt", record=record_number, error=str(e))
+            continue
+
+        if receipt["receipt_id"] in receipts:
+            result.duplicates += 1
+            continue
+        receipts[receipt["receipt_id"]] = receipt
+
+    existing_ids = find_existing_receipt_ids(user_id, list(receipts))
+    result.duplicates += len(existing_ids)
+    new_receipts = [
+        receipt for receipt_id, receipt in receipts.items() if receipt_id not in existing_ids
+    ]
+    if not new_receipts:
+        return result
+
+    try:
+        embeddings = embed_texts(
+            [RECEIPT_DESC_FORMAT.format(**receipt) for receipt in new_receipts],
+            batch_size=embedding_batch_size,
+        )
+
+        batch = get_db_client().batch()
+        for receipt, embedding in zip(new_receipts, embeddings):
+            batch.create(
+                get_receipt_document(user_id, receipt["receipt_id"]),
+                {**receipt, EMBEDDING_FIELD_NAME: Vector(embedding)},
+            )
+        add_rollup_writes(batch, user_id, new_receipts)
+        batch.commit()
+    except Exception as e:
+        result.failed += len(new_receipts)
+        logger.error("Failed to import receipt chunk", error_message=str(e))
+        return result
+
+    get_receipt_id_filter(user_id).update(receipt["receipt_id"] for receipt in new_receipts)
+
+    index = get_vector_index(user_id)
+    if index is not None:
+        for receipt, embedding in zip(new_receipts, embeddings):
+            index.add(receipt["receipt_id"], embedding, receipt)
+
+    if SETTINGS.SEARCH_MODE == "hybrid":
+        lexical_index = get_lexical_index(user_id)
+        for receipt in new_receipts:
+            lexical_index.add(
+                receipt["receipt_id"],
+                receipt,
+                {field: receipt[field] for field in RECEIPT_FIELDS},
+            )
+
+    # The backend workers add the receipts to the indexes of the user on their next access
+    publish_local_indexes(user_id, [receipt["receipt_id"] for receipt in new_receipts])
+
+    result.stored += len(new_receipts)
+    return result
+
+
+class Checkpoint:
+    """Tracks the number of leading input records that were fully imported.
+
+    Chunks complete out of order, so the checkpoint only advances over the
+    contiguous run of successfully finished chunks.
+    """
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+        self.records_done = 0
+        self._finished: Dict[int, Tuple[int, bool]] = {}
+        self._next_chunk = 0
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, "r") as file:
+                state = json.load(file)
+            if state.get("source") == source:
+                self.records_done = state["records_done"]
+
+    def finish_chunk(self, chunk_number: int, records: int, succeeded: bool) -> None:
+        with self._lock:
+            self._finished[chunk_number] = (records, succeeded)
+            advanced = False
+            while self._next_chunk in self._finished:
+                records, succeeded = self._finished[self._next_chunk]
+                if not succeeded:
+                    break
+                del self._finished[self._next_chunk]
+                self.records_done += records
+                self._next_chunk += 1
+                advanced = True
+
+            if advanced:
+                self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"source": self.source, "records_done": self.records_done}, file)
+        os.replace(tmp_path, self.path)
+
+
+def run_import(
+    path: str,
+    user_id: str,
+    checkpoint_path: str = "",
+    batch_size: int = 200,
+    embedding_batch_size: int = 50,
+    concurrency: int = 4,
+) -> Dict[str, Any]:
+    """Import every record of a file, resuming from the checkpoint if present.
+
+    Args:
+        path: Path of the JSONL or CSV input file.
+        user_id: The ID of the user owning the receipts.
+        checkpoint_path: Path of the checkpoint file, empty to disable resuming.
+        batch_size: Number of records per chunk, written in one Firestore batch.
+            Capped so that the receipts and their rollups fit in one batch.
+        embedding_batch_size: Maximum number of texts per embedding request.
+        concurrency: Maximum number of chunks processed at the same time.
+
+    Returns:
+        Dict[str, Any]: The throughput report.
+    """
+    batch_size = min(batch_size, MAX_BATCH_RECEIPTS)
+    checkpoint = Checkpoint(checkpoint_path, source=os.path.abspath(path))
+    report = ImportReport()
+    if checkpoint.records_done:
+        logger.info("Resuming import from checkpoint", records_done=checkpoint.records_done)
+
+    records = islice(enumerate(read_records(path)), checkpoint.records_done, None)
+    pending: Dict[Future, Tuple[int, int]] = {}
+
+    def collect(done: set[Future]) -> None:
+        for future in done:
+            chunk_number, records_count = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("Unexpected error in import chunk", error_message=str(e))
+                result = ChunkResult(failed=records_count)
+            report.add(result, records_count)
+            checkpoint.finish_chunk(chunk_number, records_count, result.failed == 0)
+
+        logger.info("Import progress", **report.to_dict())
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        chunk_number = 0
+        while chunk := list(islice(records, batch_size)):
+            # Bound the number of chunks held in memory
+            if len(pending) >= concurrency * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            future = executor.submit(import_chunk, user_id, chunk, embedding_batch_size)
+            pending[future] = (chunk_number, len(chunk))
+            chunk_number += 1
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    return report.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="JSONL or CSV file with receipts")
+    parser.add_argument("--user-id", required=True, help="User owning the imported receipts")
+    parser.add_argument("--checkpoint", default="", help="Checkpoint file for resuming")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--embedding-batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    report = run_import(
+        path=args.path,
+        user_id=args.user_id,
+        checkpoint_path=args.checkpoint,
+        batch_size=args.batch_size,
+        embedding_batch_size=args.embedding_batch_size,
+        concurrency=args.concurrency,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
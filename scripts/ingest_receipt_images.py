@@ -0,0 +1,581 @@
+# scripts/ingest_receipt_images.py
+"""Ingest receipt images in bulk, without going through the chat agent.
+
+Each image goes through a pipeline of bounded concurrent stages:
+
+- decode: read the image, compute its ID from its bytes as the chat does,
+  and preprocess it like a chat upload;
+- extract: one model request with a fixed response schema reads the receipt;
+- embed and write: the receipt is validated and stored like the
+  `store_receipt_data` tool does, with its rollups and local indexes.
+
+Images already stored, by any path, are found by their ID before the model
+is called. Model and embedding requests are rate limited and transient
+errors are retried with exponential backoff. Every finished image is
+appended to the checkpoint file, an interrupted run resumes where it
+stopped and retries the images that failed. A throughput and per-stage
+latency report is printed to stdout at the end, the logs go to stderr.
+
+Usage:
+    uv run python -m scripts.ingest_receipt_images receipts/ --user-id USER_ID --checkpoint ingest.ckpt
+
+The source is a directory of images, or a file listing one image path per
+line, `-` to read the paths from stdin as another process produces them.
+With `--watch`, a directory is scanned again every few seconds for new
+images until the worker is stopped.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from google.api_core.exceptions import GoogleAPICallError
+from google.genai import errors as genai_errors
+from google.genai import types
+from pydantic import BaseModel, Field
+
+import logger
+from expense_manager_agent.async_tools import embed_text, receipt_exists, write_receipt
+from expense_manager_agent.tools import (
+    RECEIPT_DESC_FORMAT,
+    get_embedding_cache,
+    get_genai_client,
+    validate_receipt_data,
+)
+from image_preprocessing import preprocess_uploaded_image
+from schema import UploadedImage
+
+T = TypeVar("T")
+
+EXTRACTION_MODEL = "gemini-2.5-flash"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".heic", ".heif")
+# Statuses of images that are not processed again on the next run, failed ones are
+RESOLVED_STATUSES = ("stored", "duplicate", "not_receipt", "invalid")
+# Statuses of images holding a stored receipt, another copy of them is a duplicate
+STORED_STATUSES = ("stored", "duplicate")
+# Status codes of overloaded or unavailable services, worth retrying
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+MAX_BACKOFF_SECONDS = 30.0
+
+EXTRACTION_PROMPT = """Read the purchase receipt in this image.
+
+- transaction_time is the time of purchase in ISO format "YYYY-MM-DDTHH:MM:SS.ssssssZ".
+- currency is the ISO 4217 code, derived from the store location if not printed, "IDR" if unsure.
+- purchased_items lists every item with its price and quantity, 1 if not printed.
+- If the image is not a purchase receipt, set is_receipt to false and leave the other fields empty.
+"""
+
+
+class ExtractedItem(BaseModel):
+    name: str
+    price: float
+    quantity: int
+
+
+class ReceiptExtraction(BaseModel):
+    """Response schema of the extraction request, the arguments of `store_receipt_data`."""
+
+    is_receipt: bool = Field(description="Whether the image is a purchase receipt.")
+    store_name: str
+    transaction_time: str
+    total_amount: float
+    currency: str
+    purchased_items: List[ExtractedItem]
+
+
+@dataclass
+class IngestionReport:
+    """Outcome, retries and per-stage latencies of an ingestion run."""
+
+    statuses: Counter = field(default_factory=Counter)
+    retries: Counter = field(default_factory=Counter)
+    skipped: int = 0
+    stage_seconds: Dict[str, List[float]] = field(default_factory=dict)
+    rate_limit_wait_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.stage_seconds.setdefault(stage, []).append(seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started_at
+        processed = sum(self.statuses.values())
+        return {
+            "processed": processed,
+            "skipped_from_checkpoint": self.skipped,
+            "statuses": dict(self.statuses),
+            "retries": dict(self.retries),
+            "elapsed_seconds": round(elapsed, 3),
+            "images_per_second": round(processed / elapsed, 2) if elapsed else 0.0,
+            "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 3),
+            "stage_latency_ms": {
+                stage: summarize_latencies(seconds)
+                for stage, seconds in self.stage_seconds.items()
+            },
+            "embedding_cache": get_embedding_cache().stats(),
+        }
+
+
+def summarize_latencies(seconds: List[float]) -> Dict[str, float]:
+    ordered = sorted(value * 1000 for value in seconds)
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.mean(ordered), 2),
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class RateLimiter:
+    """Spaces out requests to stay under a per-minute quota, shared by concurrent tasks.
+
+    Each request is given the next free slot of the schedule and waits for it.
+    """
+
+    def __init__(self, requests_per_minute: float, report: IngestionReport):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.report = report
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            self.report.rate_limit_wait_seconds += slot - now
+            await asyncio.sleep(slot - now)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is transient: a timeout, a lost connection or an overloaded service."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, GoogleAPICallError):
+        return error.code in RETRYABLE_STATUS_CODES
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return False
+
+
+class IngestionCheckpoint:
+    """Journal of the finished images, one JSON line appended per image.
+
+    Images finish out of order, so each one is recorded on its own. An image
+    is resolved if its last record has a resolved status and its file did not
+    change since, a line cut short by an interruption is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._records: Dict[str, Dict[str, Any]] = {}
+        # Status of each resolved image, by image ID
+        self.resolved_statuses: Dict[str, str] = {}
+        self._file = None
+        if not path:
+            return
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._records[record["path"]] = record
+                    if record["status"] in RESOLVED_STATUSES and record.get("image_id"):
+                        self.resolved_statuses[record["image_id"]] = record["status"]
+        self._file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def file_version(path: str) -> List[int]:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def is_resolved(self, path: str) -> bool:
+        record = self._records.get(path)
+        if record is None or record["status"] not in RESOLVED_STATUSES:
+            return False
+        try:
+            return record["version"] == self.file_version(path)
+        except OSError:
+            return False
+
+    def record(self, path: str, image_id: str, status: str) -> None:
+        try:
+            version = self.file_version(path)
+        except OSError:
+            version = None
+        record = {"path": path, "image_id": image_id, "status": status, "version": version}
+        self._records[path] = record
+        if status in RESOLVED_STATUSES and image_id:
+            self.resolved_statuses[image_id] = status
+        if self._file is not None:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def load_image(path: str) -> UploadedImage:
+    """Read an image and preprocess it like a chat upload, keeping the ID of its original bytes."""
+    with open(path, "rb") as file:
+        data = file.read()
+    mime_type = mimetypes.guess_type(path)[0] or "image/jpeg"
+    # The same ID as the image uploaded through the chat
+    image = UploadedImage(
+        data=data, mime_type=mime_type, hash_id=hashlib.sha256(data).hexdigest()[:12]
+    )
+    return preprocess_uploaded_image(image)
+
+
+def scan_directory(directory: str) -> List[str]:
+    """List the images of a directory and its subdirectories, in a stable order."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.abspath(os.path.join(root, name)))
+    return paths
+
+
+async def iter_image_paths(
+    source: str, watch_seconds: float = 0.0, settle_seconds: float = 2.0
+) -> AsyncIterator[str]:
+    """Yield the image paths of a source: a directory, a file of paths, or `-` for stdin.
+
+    Args:
+        source: The directory or the list of image paths.
+        watch_seconds: Scan a directory again after this delay, until cancelled, 0 for one scan.
+        settle_seconds: When watching, skip files modified more recently, they may be
+            still being written.
+    """
+    if source == "-" or os.path.isfile(source):
+        file = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+        base_dir = os.getcwd() if source == "-" else os.path.dirname(os.path.abspath(source))
+        try:
+            while line := await asyncio.to_thread(file.readline):
+                if line.strip():
+                    yield os.path.abspath(os.path.join(base_dir, line.strip()))
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        return
+
+    seen: set[str] = set()
+    while True:
+        now = time.time()
+        for path in await asyncio.to_thread(scan_directory, source):
+            if path in seen:
+                continue
+            if watch_seconds and now - os.path.getmtime(path) < settle_seconds:
+                continue
+            seen.add(path)
+            yield path
+
+        if not watch_seconds:
+            return
+        await asyncio.sleep(watch_seconds)
+
+
+class IngestionPipeline:
+    """Runs each image through the decode, extract, embed and write stages.
+
+    Every stage has its own concurrency limit, so that the model requests,
+    the CPU bound decoding and the data-plane writes of different images
+    overlap without any stage being overloaded.
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        checkpoint: IngestionCheckpoint,
+        report: IngestionReport,
+        model: str = EXTRACTION_MODEL,
+        decode_concurrency: int = 4,
+        extract_concurrency: int = 8,
+        write_concurrency: int = 8,
+        model_rpm: float = 0.0,
+        embedding_rpm: float = 0.0,
+        max_attempts: int = 5,
+        base_backoff_seconds: float = 1.0,
+        thinking_budget: Optional[int] = 0,
+    ):
+        self.user_id = user_id
+        self.checkpoint = checkpoint
+        self.report = report
+        self.model = model
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.decode_slots = asyncio.Semaphore(decode_concurrency)
+        self.extract_slots = asyncio.Semaphore(extract_concurrency)
+        self.write_slots = asyncio.Semaphore(write_concurrency)
+        # Outcome of the images in the pipeline by image ID, a copy waits for it
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.model_limiter = RateLimiter(model_rpm, report)
+        self.embedding_limiter = RateLimiter(embedding_rpm, report)
+        self.config = types.GenerateContentConfig(
+            temperature=0.0,
+            response_mime_type="application/json",
+            response_schema=ReceiptExtraction,
+            thinking_config=(
+                types.ThinkingConfig(thinking_budget=thinking_budget)
+                if thinking_budget is not None
+                else None
+            ),
+        )
+
+    async def with_retries(
+        self,
+        operation: str,
+        call: Callable[[], Awaitable[T]],
+        limiter: Optional[RateLimiter] = None,
+    ) -> T:
+        """Run a remote call, retrying transient errors with exponential backoff and jitter."""
+        for attempt in range(1, self.max_attempts + 1):
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                return await call()
+            except Exception as e:
+                if attempt == self.max_attempts or not is_retryable(e):
+                    raise
+                delay = min(MAX_BACKOFF_SECONDS, self.base_backoff_seconds * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.0)
+                self.report.retries[operation] += 1
+                logger.warning(
+                    "Retrying ingestion request",
+                    operation=operation,
+                    attempt=attempt,
+                    delay_seconds=round(delay, 2),
+                    error_message=str(e),
+                )
+                await asyncio.sleep(delay)
+
+    async def extract(self, image: UploadedImage) -> ReceiptExtraction:
+        response = await get_genai_client().aio.models.generate_content(
+            model=self.model,
+            contents=[
+                types.Part.from_bytes(data=image.data, mime_type=image.mime_type),
+                types.Part(text=EXTRACTION_PROMPT),
+            ],
+            config=self.config,
+        )
+        return ReceiptExtraction.model_validate_json(response.text)
+
+    async def process(self, path: str) -> str:
+        """Ingest one image and record its outcome in the checkpoint.
+
+        Returns:
+            str: The status of the image, "stored", "duplicate", "not_receipt",
+                "invalid" or "failed".
+        """
+        started = time.perf_counter()
+        image_id = ""
+        claimed = False
+        status = "failed"
+        try:
+            async with self.decode_slots:
+                stage_started = time.perf_counter()
+                image = await asyncio.to_thread(load_image, path)
+                self.report.observe("decode", time.perf_counter() - stage_started)
+            image_id = image.hash_id
+
+            # The same image under another path shares its outcome, it is a duplicate if stored
+            previous_status = self.checkpoint.resolved_statuses.get(image_id)
+            if previous_status is None and image_id in self.in_flight:
+                previous_status = await asyncio.shield(self.in_flight[image_id])
+            if previous_status is not None:
+                status = "duplicate" if previous_status in STORED_STATUSES else previous_status
+                return status
+            self.in_flight[image_id] = asyncio.get_running_loop().create_future()
+            claimed = True
+
+            # Already stored through the chat
+            if await receipt_exists(self.user_id, image_id):
+                status = "duplicate"
+                return status
+
+            async with self.extract_slots:
+                stage_started = time.perf_counter()
+                extraction = await self.with_retries(
+                    "extract", lambda: self.extract(image), self.model_limiter
+                )
+                self.report.observe("extract", time.perf_counter() - stage_started)
+            if not extraction.is_receipt:
+                status = "not_receipt"
+                return status
+
+            receipt = validate_receipt_data(
+                image_id=image_id,
+                store_name=extraction.store_name,
+                transaction_time=extraction.transaction_time,
+                total_amount=extraction.total_amount,
+                purchased_items=[item.model_dump() for item in extraction.purchased_items],
+                currency=extraction.currency or "IDR",
+            )
+
+            async with self.write_slots:
+                stage_started = time.perf_counter()
+                embedding = await self.with_retries(
+                    "embed",
+                    lambda: embed_text(RECEIPT_DESC_FORMAT.format(**receipt)),
+                    self.embedding_limiter,
+                )
+                self.report.observe("embed", time.perf_counter() - stage_started)
+
+                stage_started = time.perf_counter()
+                # A retried write whose first attempt was committed finds the receipt stored
+                stored = await self.with_retries(
+                    "write", lambda: write_receipt(self.user_id, receipt, embedding)
+                )
+                self.report.observe("write", time.perf_counter() - stage_started)
+            status = "stored" if stored else "duplicate"
+            return status
+        except ValueError as e:
+            # Unreadable model output or receipt fields rejected by the validation
+            status = "invalid"
+            logger.warning(
+                "Skipping invalid receipt image", path=path, image_id=image_id, error=str(e)
+            )
+            return status
+        except Exception as e:
+            logger.error(
+                "Failed to ingest receipt image",
+                path=path,
+                image_id=image_id,
+                error_message=str(e),
+            )
+            return status
+        finally:
+            if claimed:
+                self.in_flight.pop(image_id).set_result(status)
+            self.report.statuses[status] += 1
+            self.report.observe("total", time.perf_counter() - started)
+            self.checkpoint.record(path, image_id, status)
+
+
+async def run_ingestion(
+    source: str,
+    user_id: str,
+    checkpoint_path: str = "",
+    max_in_flight: int = 32,
+    watch_seconds: float = 0.0,
+    progress_every: int = 50,
+    **pipeline_options: Any,
+) -> Dict[str, Any]:
+    """Ingest every image of a source, skipping the images resolved by a previous run.
+
+    Args:
+        source: Directory of images, file listing image paths, or `-` for stdin.
+        user_id: The ID of the user owning the receipts.
+        checkpoint_path: Path of the checkpoint file, empty to disable resuming.
+        max_in_flight: Maximum number of images in the pipeline at the same time.
+        watch_seconds: Keep scanning a directory for new images with this period.
+        progress_every: Log the report every this many processed images.
+        **pipeline_options: Stage concurrencies, rate limits and retries, see
+            `IngestionPipeline`.
+
+    Returns:
+        Dict[str, Any]: The throughput and latency report.
+    """
+    checkpoint = IngestionCheckpoint(checkpoint_path)
+    report = IngestionReport()
+    pipeline = IngestionPipeline(user_id, checkpoint, report, **pipeline_options)
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks: set[asyncio.Task] = set()
+
+    def finish(task: asyncio.Task) -> None:
+        tasks.discard(task)
+        in_flight.release()
+        processed = sum(report.statuses.values())
+        if progress_every and processed % progress_every == 0:
+            logger.info("Ingestion progress", **report.to_dict())
+
+    try:
+        async for path in iter_image_paths(source, watch_seconds):
+            if checkpoint.is_resolved(path):
+                report.skipped += 1
+                continue
+
+            await in_flight.acquire()
+            task = asyncio.create_task(pipeline.process(path))
+            tasks.add(task)
+            task.add_done_callback(finish)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        checkpoint.close()
+
+    return report.to_dict()
+
+
+def main():
+    # stdout is kept for the report
+    logger.set_stream(sys.stderr)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="Directory of images, file of paths, or - for stdin")
+    parser.add_argument("--user-id", required=True, help="User owning the ingested receipts")
+    parser.add_argument("--checkpoint", default="", help="Checkpoint file for resuming")
+    parser.add_argument("--model", default=EXTRACTION_MODEL)
+    parser.add_argument(
+        "--thinking-budget", type=int, default=0,
+        help="Thinking tokens of the extraction request, -1 to use the model default",
+    )
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--decode-concurrency", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--extract-concurrency", type=int, default=8)
+    parser.add_argument("--write-concurrency", type=int, default=8)
+    parser.add_argument("--model-rpm", type=float, default=0.0, help="0 for no rate limit")
+    parser.add_argument("--embedding-rpm", type=float, default=0.0, help="0 for no rate limit")
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--backoff-seconds", type=float, default=1.0)
+    parser.add_argument(
+        "--watch", type=float, default=0.0, metavar="SECONDS",
+        help="Scan the directory for new images with this period, until stopped",
+    )
+    parser.add_argument("--progress-every", type=int, default=50)
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run_ingestion(
+            source=args.source,
+            user_id=args.user_id,
+            checkpoint_path=args.checkpoint,
+            max_in_flight=args.max_in_flight,
+            watch_seconds=args.watch,
+            progress_every=args.progress_every,
+            model=args.model,
+            decode_concurrency=args.decode_concurrency,
+            extract_concurrency=args.extract_concurrency,
+            write_concurrency=args.write_concurrency,
+            model_rpm=args.model_rpm,
+            embedding_rpm=args.embedding_rpm,
+            max_attempts=args.max_attempts,
+            base_backoff_seconds=args.backoff_seconds,
+            thinking_budget=None if args.thinking_budget < 0 else args.thinking_budget,
+        )
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
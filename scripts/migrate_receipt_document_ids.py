@@ -0,0 +1,128 @@
+# scripts/migrate_receipt_document_ids.py
+"""Re-key receipt documents so that their document ID is their receipt ID.
+
+Receipts used to be written with `COLLECTION.add`, which assigns a random
+document ID. Every such document of the legacy single-user collection is
+copied to `COLLECTION/<receipt_id>`
+and the original is deleted in the same batch. When the target document
+already exists the original is a duplicate and is only deleted.
+
+Run it before `scripts.partition_receipts_by_user`.
+
+Usage:
+    uv run python -m scripts.migrate_receipt_document_ids [--dry-run]
+"""
+
+import argparse
+import json
+from typing import Any, Dict, List
+
+from google.cloud.firestore_v1 import DocumentSnapshot
+
+import logger
+from expense_manager_agent.tools import (
+    get_db_client,
+    get_legacy_collection,
+    validate_document_id,
+)
+
+# Two writes (create + delete) per migrated document, within the 500 writes batch limit
+MIGRATION_BATCH_SIZE = 250
+
+
+def migrate_chunk(snapshots: List[DocumentSnapshot], dry_run: bool) -> Dict[str, int]:
+    """Re-key one chunk of legacy documents.
+
+    Args:
+        snapshots: Documents whose ID differs from their receipt ID.
+        dry_run: Only count what would be done.
+
+    Returns:
+        Dict[str, int]: Counters of migrated, duplicate and invalid documents.
+    """
+    counts = {"migrated": 0, "duplicates": 0, "invalid": 0}
+
+    targets = {}
+    for snapshot in snapshots:
+        try:
+            targets[snapshot.id] = get_legacy_collection().document(
+                validate_document_id(snapshot.get("receipt_id"), "receipt ID")
+            )
+        except (KeyError, ValueError):
+            counts["invalid"] += 1
+            logger.warning("Receipt document has no valid receipt ID", doc_id=snapshot.id)
+
+    db_client = get_db_client()
+    existing = {
+        target.id
+        for target in db_client.get_all(list(targets.values()), field_paths=["receipt_id"])
+        if target.exists
+    }
+
+    batch = db_client.batch()
+    claimed = set()
+    for snapshot in snapshots:
+        target = targets.get(snapshot.id)
+        if target is None:
+            continue
+
+        if target.id in existing or target.id in claimed:
+            counts["duplicates"] += 1
+        else:
+            batch.create(target, snapshot.to_dict())
+            claimed.add(target.id)
+            counts["migrated"] += 1
+        batch.delete(snapshot.reference)
+
+    if not dry_run and (claimed or counts["duplicates"]):
+        batch.commit()
+
+    return counts
+
+
+def run_migration(dry_run: bool = False) -> Dict[str, Any]:
+    """Re-key every legacy receipt document of the collection.
+
+    Args:
+        dry_run: Only count what would be done.
+
+    Returns:
+        Dict[str, Any]: The migration report.
+    """
+    report = {"scanned": 0, "migrated": 0, "duplicates": 0, "invalid": 0}
+    chunk: List[DocumentSnapshot] = []
+
+    def flush():
+        for key, value in migrate_chunk(chunk, dry_run).items():
+            report[key] += value
+        chunk.clear()
+        logger.info("Receipt ID migration progress", dry_run=dry_run, **report)
+
+    # Documents written by this migration are keyed by receipt ID and skipped if streamed
+    for snapshot in get_legacy_collection().stream():
+        report["scanned"] += 1
+        if snapshot.id == snapshot.to_dict().get("receipt_id"):
+            continue
+
+        chunk.append(snapshot)
+        if len(chunk) >= MIGRATION_BATCH_SIZE:
+            flush()
+
+    if chunk:
+        flush()
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would change"
+    )
+    args = parser.parse_args()
+
+    print(json.dumps(run_migration(dry_run=args.dry_run), indent=2))
+
+
+if __name__ == "__main__":
+    main()
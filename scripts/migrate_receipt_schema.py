@@ -0,0 +1,147 @@
+# scripts/migrate_receipt_schema.py
+"""Migrate stored receipts to the current receipt schema version.
+
+Receipts stored before schema version 2 have a free-form ISO string as
+`transaction_time` and no normalized fields. This job streams the receipts
+collection in pages ordered by document ID, normalizes each outdated
+receipt with the same rules as `store_receipt_data` and writes only the
+changed fields, one Firestore batch per page. Users are migrated one after
+the other. It is idempotent and can be interrupted and run again, or one
+user resumed after the last logged document ID.
+
+Normalizing can move a receipt to another UTC day or change its currency
+code, run `scripts.rebuild_spending_rollups` afterwards.
+
+Usage:
+    uv run python -m scripts.migrate_receipt_schema [--dry-run] [--user-id USER_ID [--start-after DOC_ID]]
+"""
+
+import argparse
+import json
+from typing import Any, Dict
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+import logger
+from expense_manager_agent.receipt_schema import receipt_schema_update
+from expense_manager_agent.tools import (
+    FX_TABLE,
+    SETTINGS,
+    get_db_client,
+    get_index_generations,
+    get_receipts_collection,
+    list_user_ids,
+)
+
+# Firestore limit
+MAX_BATCH_WRITES = 500
+
+SCHEMA_SOURCE_FIELDS = ["transaction_time", "total_amount", "currency", "schema_version"]
+
+
+def run_migration(
+    user_id: str, batch_size: int = 250, start_after: str = "", dry_run: bool = False
+) -> Dict[str, Any]:
+    """Bring every stored receipt of a user to the current schema version.
+
+    Args:
+        user_id: The ID of the user.
+        batch_size: Number of receipts read and written per page.
+        start_after: Document ID to resume after, empty to start from the beginning.
+        dry_run: Only count what would be done.
+
+    Returns:
+        Dict[str, Any]: The migration report.
+    """
+    batch_size = min(batch_size, MAX_BATCH_WRITES)
+    report = {"scanned": 0, "migrated": 0, "current": 0, "invalid": 0, "unknown_currency": 0}
+    base_query = (
+        get_receipts_collection(user_id)
+        .select(SCHEMA_SOURCE_FIELDS)
+        .order_by(FieldPath.document_id())
+        .limit(batch_size)
+    )
+    cursor = start_after
+
+    while True:
+        query = base_query.start_after({"__name__": cursor}) if cursor else base_query
+        snapshots = list(query.stream())
+        if not snapshots:
+            break
+
+        batch = get_db_client().batch()
+        writes = 0
+        for snapshot in snapshots:
+            report["scanned"] += 1
+            try:
+                outdated, update = receipt_schema_update(
+                    snapshot.to_dict(), FX_TABLE, SETTINGS.BASE_CURRENCY
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                report["invalid"] += 1
+                logger.warning(
+                    "Receipt cannot be migrated",
+                    user_id=user_id,
+                    doc_id=snapshot.id,
+                    error=str(e),
+                )
+                continue
+
+            if not outdated:
+                report["current"] += 1
+                continue
+
+            if update.get("total_amount_base", 0) is None:
+                report["unknown_currency"] += 1
+            batch.update(snapshot.reference, update)
+            writes += 1
+            report["migrated"] += 1
+
+        if writes and not dry_run:
+            batch.commit()
+
+        cursor = snapshots[-1].id
+        logger.info(
+            "Receipt schema migration progress",
+            user_id=user_id,
+            last_doc_id=cursor,
+            dry_run=dry_run,
+            **report,
+        )
+
+    # The backend workers rebuild the indexes of the user on their next access
+    if report["migrated"] and not dry_run:
+        get_index_generations().bump(user_id)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=250)
+    parser.add_argument("--user-id", default="", help="Only migrate this user, default all users")
+    parser.add_argument(
+        "--start-after", default="", help="Document ID to resume after, requires --user-id"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would change"
+    )
+    args = parser.parse_args()
+    if args.start_after and not args.user_id:
+        parser.error("--start-after requires --user-id")
+
+    user_ids = [args.user_id] if args.user_id else list_user_ids()
+    report = {
+        user_id: run_migration(
+            user_id,
+            batch_size=args.batch_size,
+            start_after=args.start_after,
+            dry_run=args.dry_run,
+        )
+        for user_id in user_ids
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
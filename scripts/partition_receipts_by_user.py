@@ -0,0 +1,169 @@
+# scripts/partition_receipts_by_user.py
+"""Move the receipts of the legacy single-user collection into a user partition.
+
+Receipts used to live in one collection shared by every user. They are now
+stored under `users/<user_id>/receipts/<receipt_id>`, next to the spending
+rollups of the same user. Every legacy receipt is copied to the partition of
+the given user and deleted from the legacy collection in the same batch.
+When the target already exists the legacy document is only deleted. The
+rollups of the user are then rebuilt from their receipts and the legacy
+rollups are deleted. The job can be interrupted and run again.
+
+Run `scripts.migrate_receipt_document_ids` first if receipts still have
+random document IDs.
+
+Usage:
+    uv run python -m scripts.partition_receipts_by_user [--user-id USER_ID] [--dry-run]
+"""
+
+import argparse
+import json
+from typing import Any, Dict, List
+
+from google.cloud.firestore_v1 import DocumentSnapshot
+
+import logger
+from expense_manager_agent.tools import (
+    get_db_client,
+    get_index_generations,
+    get_legacy_collection,
+    get_legacy_rollup_collection,
+    get_receipt_document,
+)
+from scripts.rebuild_spending_rollups import rebuild_rollups
+
+# Two writes (create + delete) per moved document, within the 500 writes batch limit
+PARTITION_BATCH_SIZE = 250
+
+# The user ID of the single-user frontend
+DEFAULT_USER_ID = "default_user"
+
+
+def partition_chunk(
+    user_id: str, snapshots: List[DocumentSnapshot], dry_run: bool
+) -> Dict[str, int]:
+    """Move one chunk of legacy receipts into the partition of a user.
+
+    Args:
+        user_id: The ID of the user owning the receipts.
+        snapshots: Legacy receipt documents.
+        dry_run: Only count what would be done.
+
+    Returns:
+        Dict[str, int]: Counters of moved, duplicate and invalid documents.
+    """
+    counts = {"moved": 0, "duplicates": 0, "invalid": 0}
+
+    targets = {}
+    for snapshot in snapshots:
+        try:
+            targets[snapshot.id] = get_receipt_document(user_id, snapshot.id)
+        except ValueError:
+            counts["invalid"] += 1
+            logger.warning("Receipt document ID cannot be partitioned", doc_id=snapshot.id)
+
+    db_client = get_db_client()
+    existing = {
+        target.id
+        for target in db_client.get_all(list(targets.values()), field_paths=["receipt_id"])
+        if target.exists
+    }
+
+    batch = db_client.batch()
+    for snapshot in snapshots:
+        target = targets.get(snapshot.id)
+        if target is None:
+            continue
+
+        if target.id in existing:
+            counts["duplicates"] += 1
+        else:
+            batch.create(target, snapshot.to_dict())
+            counts["moved"] += 1
+        batch.delete(snapshot.reference)
+
+    if not dry_run and (counts["moved"] or counts["duplicates"]):
+        batch.commit()
+
+    return counts
+
+
+def delete_legacy_rollups(dry_run: bool) -> int:
+    """Delete the rollups of the legacy collection, they are rebuilt per user.
+
+    Returns:
+        int: The number of deleted rollup documents.
+    """
+    doc_refs = list(get_legacy_rollup_collection().list_documents())
+    if dry_run:
+        return len(doc_refs)
+
+    for start in range(0, len(doc_refs), 500):
+        batch = get_db_client().batch()
+        for doc_ref in doc_refs[start : start + 500]:
+            batch.delete(doc_ref)
+        batch.commit()
+
+    return len(doc_refs)
+
+
+def run_partition(user_id: str, dry_run: bool = False) -> Dict[str, Any]:
+    """Move every legacy receipt into the partition of a user and rebuild their rollups.
+
+    Args:
+        user_id: The ID of the user owning the legacy receipts.
+        dry_run: Only count what would be done.
+
+    Returns:
+        Dict[str, Any]: The partition report.
+    """
+    report: Dict[str, Any] = {"scanned": 0, "moved": 0, "duplicates": 0, "invalid": 0}
+    chunk: List[DocumentSnapshot] = []
+
+    def flush():
+        for key, value in partition_chunk(user_id, chunk, dry_run).items():
+            report[key] += value
+        chunk.clear()
+        logger.info("Receipt partition progress", user_id=user_id, dry_run=dry_run, **report)
+
+    for snapshot in get_legacy_collection().stream():
+        report["scanned"] += 1
+        chunk.append(snapshot)
+        if len(chunk) >= PARTITION_BATCH_SIZE:
+            flush()
+
+    if chunk:
+        flush()
+
+    # Invalid documents stay in the legacy collection, keep its rollups until they are fixed
+    if report["invalid"]:
+        logger.warning(
+            "Legacy receipts left in place, legacy rollups kept", invalid=report["invalid"]
+        )
+    else:
+        report["legacy_rollups_deleted"] = delete_legacy_rollups(dry_run)
+
+    report["rollups"] = rebuild_rollups(user_id, dry_run=dry_run)
+
+    # The backend workers rebuild the indexes of the user on their next access
+    if report["moved"] and not dry_run:
+        get_index_generations().bump(user_id)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--user-id", default=DEFAULT_USER_ID, help="User owning the legacy receipts"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would change"
+    )
+    args = parser.parse_args()
+
+    print(json.dumps(run_partition(args.user_id, dry_run=args.dry_run), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# scripts/preprocess_images_report.py
+"""Report the byte and token savings of image preprocessing on sample images.
+
+Runs the same preprocessing as the upload path on local files, with the
+configured settings or the overrides given on the command line, so the
+long edge, format and quality can be tuned before deploying.
+
+Usage:
+    uv run python -m scripts.preprocess_images_report receipts/*.jpg --max-long-edge 1280
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from PIL import UnidentifiedImageError
+
+from image_preprocessing import (
+    PreprocessReport,
+    estimate_image_tokens,
+    preprocess_image_bytes,
+)
+from settings import get_settings
+
+
+def report_image(path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Preprocess one image file and return its report."""
+    with open(path, "rb") as file:
+        data = file.read()
+
+    start = time.perf_counter()
+    try:
+        processed, original_size, processed_size = preprocess_image_bytes(data, **options)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        return {"path": path, "error": str(e)}
+
+    report = PreprocessReport(
+        hash_id=path,
+        original_bytes=len(data),
+        processed_bytes=len(processed),
+        original_size=original_size,
+        processed_size=processed_size,
+        original_tokens=estimate_image_tokens(*original_size),
+        processed_tokens=estimate_image_tokens(*processed_size),
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 2),
+    )
+    return {"path": path, **report.to_dict()}
+
+
+def run_report(paths: List[str], options: Dict[str, Any], workers: int) -> Dict[str, Any]:
+    """Preprocess every image and aggregate the savings.
+
+    Args:
+        paths: Image files.
+        options: Keyword arguments of `preprocess_image_bytes`.
+        workers: Number of images preprocessed at the same time.
+
+    Returns:
+        Dict[str, Any]: Per image reports and totals.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        images = list(executor.map(lambda path: report_image(path, options), paths))
+
+    reported = [image for image in images if "error" not in image]
+    totals = {
+        key: sum(image[key] for image in reported)
+        for key in (
+            "original_bytes",
+            "processed_bytes",
+            "saved_bytes",
+            "original_tokens",
+            "processed_tokens",
+            "saved_tokens",
+        )
+    }
+    return {"options": options, "images": images, "totals": totals}
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="Image files")
+    parser.add_argument(
+        "--max-long-edge", type=int, default=settings.IMAGE_PREPROCESS_MAX_LONG_EDGE
+    )
+    parser.add_argument(
+        "--grayscale",
+        action=argparse.BooleanOptionalAction,
+        default=settings.IMAGE_PREPROCESS_GRAYSCALE,
+    )
+    parser.add_argument(
+        "--format", choices=["WEBP", "JPEG"], default=settings.IMAGE_PREPROCESS_FORMAT.upper()
+    )
+    parser.add_argument("--quality", type=int, default=settings.IMAGE_PREPROCESS_QUALITY)
+    parser.add_argument("--workers", type=int, default=settings.IMAGE_PREPROCESS_WORKERS)
+    args = parser.parse_args()
+
+    options = {
+        "max_long_edge": args.max_long_edge,
+        "grayscale": args.grayscale,
+        "output_format": args.format,
+        "quality": args.quality,
+    }
+    print(json.dumps(run_report(args.paths, options, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
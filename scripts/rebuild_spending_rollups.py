@@ -0,0 +1,109 @@
+# scripts/rebuild_spending_rollups.py
+"""Rebuild the spending rollups from the stored receipts.
+
+Rollups are maintained incrementally when receipts are stored. This script
+recomputes every rollup document of a user from a scan of their receipts,
+to backfill receipts stored before rollups existed. Rollup documents whose
+period has no receipts anymore are deleted. Run it while no receipts are
+being stored, increments written during the scan would be overwritten.
+
+Usage:
+    uv run python -m scripts.rebuild_spending_rollups [--user-id USER_ID] [--dry-run]
+"""
+
+import argparse
+import json
+from typing import Any, Dict
+
+import logger
+from expense_manager_agent.rollups import build_rollup_deltas, parse_transaction_date
+from expense_manager_agent.tools import (
+    get_db_client,
+    get_receipts_collection,
+    get_rollups_collection,
+    list_user_ids,
+)
+
+# Firestore limit
+MAX_BATCH_WRITES = 500
+
+ROLLUP_SOURCE_FIELDS = ["store_name", "transaction_time", "total_amount", "currency"]
+
+
+def rebuild_rollups(user_id: str, dry_run: bool = False) -> Dict[str, Any]:
+    """Recompute and overwrite every rollup document of a user.
+
+    Args:
+        user_id: The ID of the user.
+        dry_run: Only compute the rollups, without writing them.
+
+    Returns:
+        Dict[str, Any]: The rebuild report.
+    """
+    rollups_collection = get_rollups_collection(user_id)
+    report = {"receipts": 0, "invalid": 0, "rollups": 0, "deleted": 0}
+    receipts = []
+    for snapshot in get_receipts_collection(user_id).select(ROLLUP_SOURCE_FIELDS).stream():
+        report["receipts"] += 1
+        data = snapshot.to_dict()
+        try:
+            parse_transaction_date(data["transaction_time"])
+            float(data["total_amount"])
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            report["invalid"] += 1
+            logger.warning(
+                "Skipping receipt without valid amount or time",
+                user_id=user_id,
+                doc_id=snapshot.id,
+                error=str(e),
+            )
+            continue
+        receipts.append(data)
+
+    rollups = build_rollup_deltas(receipts)
+    stale = [
+        doc_ref for doc_ref in rollups_collection.list_documents() if doc_ref.id not in rollups
+    ]
+    report["rollups"] = len(rollups)
+    report["deleted"] = len(stale)
+    if dry_run:
+        return report
+
+    writes = [
+        ("set", rollups_collection.document(rollup_id), data)
+        for rollup_id, data in rollups.items()
+    ]
+    writes += [("delete", doc_ref, None) for doc_ref in stale]
+    for start in range(0, len(writes), MAX_BATCH_WRITES):
+        batch = get_db_client().batch()
+        for operation, doc_ref, data in writes[start : start + MAX_BATCH_WRITES]:
+            if operation == "set":
+                batch.set(doc_ref, data)
+            else:
+                batch.delete(doc_ref)
+        batch.commit()
+        logger.info(
+            "Rollup rebuild progress",
+            user_id=user_id,
+            written=min(start + MAX_BATCH_WRITES, len(writes)),
+            total=len(writes),
+        )
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", default="", help="Only rebuild this user, default all users")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would change"
+    )
+    args = parser.parse_args()
+
+    user_ids = [args.user_id] if args.user_id else list_user_ids()
+    report = {user_id: rebuild_rollups(user_id, dry_run=args.dry_run) for user_id in user_ids}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
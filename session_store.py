@@ -0,0 +1,602 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.adk.sessions.base_session_service import (
+    BaseSessionService,
+    GetSessionConfig,
+    ListEventsResponse,
+    ListSessionsResponse,
+)
+from google.adk.sessions.state import State
+
+SessionKey = Tuple[str, str, str]
+
+
+@dataclass
+class HotSession:
+    """A session held in memory with its estimated size."""
+
+    session: Session
+    size: int
+    last_access: float
+    # Sequence number of the last stored event, 0 when the session has none
+    last_seq: int = 0
+
+
+class BoundedSessionService(BaseSessionService):
+    """Session service with a bounded in-memory hot set and a SQLite store.
+
+    Sessions are written through to SQLite as events are appended, so the
+    conversations survive restarts. Only the recently used sessions are kept
+    in memory, they are evicted by least recent use once the hot set exceeds
+    its session count or byte budget, and when idle for longer than the TTL.
+    Evicted sessions are loaded back from SQLite on their next access.
+
+    Image data of the events is stored once per content hash in a blob table
+    and referenced from the events, so repeated images are not copied.
+
+    The SQLite store can be shared by several processes, such as the workers
+    of the backend. In shared mode every access to a hot session checks that
+    no other process changed it in the store, and reloads it otherwise.
+    """
+
+    def __init__(
+        self,
+        store_path: str = "",
+        max_sessions: int = 256,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 1800,
+        shared: bool = False,
+    ):
+        """Initialize the session service.
+
+        Args:
+            store_path: SQLite file of the persistent store. Empty string keeps
+                sessions in memory only, so evicted sessions are lost.
+            max_sessions: Maximum number of sessions kept in memory.
+            max_bytes: Byte budget of the sessions kept in memory.
+            ttl_seconds: Idle time after which a session is evicted from memory.
+            shared: Whether other processes write to the same store, in which case
+                hot sessions and the app and user state are checked against it.
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._hot: OrderedDict[SessionKey, HotSession] = OrderedDict()
+        self._hot_bytes = 0
+        self._lock = threading.RLock()
+        self._disk: Optional[sqlite3.Connection] = None
+        # A map from app name to a map from user ID to a map from key to the value.
+        self._user_state: dict[str, dict[str, dict[str, Any]]] = {}
+        # A map from app name to a map from key to the value.
+        self._app_state: dict[str, dict[str, Any]] = {}
+        self._stats = {
+            "hits": 0,
+            "disk_loads": 0,
+            "misses": 0,
+            "lru_evictions": 0,
+            "ttl_evictions": 0,
+            "stale_reloads": 0,
+        }
+
+        if shared and not store_path:
+            raise ValueError("A shared session service requires a store path")
+
+        if store_path:
+            directory = os.path.dirname(store_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._disk = sqlite3.connect(
+                store_path, check_same_thread=False, isolation_level=None
+            )
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("PRAGMA synchronous=NORMAL")
+            self._disk.executescript(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL, "
+                "state TEXT NOT NULL, last_update_time REAL NOT NULL, "
+                "PRIMARY KEY (app_name, user_id, session_id));"
+                "CREATE TABLE IF NOT EXISTS events ("
+                "app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL, "
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS events_session "
+                "ON events (app_name, user_id, session_id, seq);"
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "hash TEXT PRIMARY KEY, data BLOB NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS event_blobs ("
+                "app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL, "
+                "hash TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS event_blobs_session "
+                "ON event_blobs (app_name, user_id, session_id);"
+                "CREATE INDEX IF NOT EXISTS event_blobs_hash ON event_blobs (hash);"
+                "CREATE TABLE IF NOT EXISTS app_state ("
+                "app_name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (app_name, key));"
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                "app_name TEXT NOT NULL, user_id TEXT NOT NULL, key TEXT NOT NULL, "
+                "value TEXT NOT NULL, PRIMARY KEY (app_name, user_id, key));"
+            )
+            for app_name, key, value in self._disk.execute(
+                "SELECT app_name, key, value FROM app_state"
+            ):
+                self._app_state.setdefault(app_name, {})[key] = json.loads(value)
+            for app_name, user_id, key, value in self._disk.execute(
+                "SELECT app_name, user_id, key, value FROM user_state"
+            ):
+                self._user_state.setdefault(app_name, {}).setdefault(user_id, {})[
+                    key
+                ] = json.loads(value)
+
+    def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = (
+            session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        )
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=state or {},
+            last_update_time=time.time(),
+        )
+
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            if self._disk is not None:
+                # A session created again under the same ID starts with no events
+                self._disk.execute("BEGIN IMMEDIATE")
+                try:
+                    self._delete_stored_session(key)
+                    self._disk.execute(
+                        "INSERT INTO sessions "
+                        "(app_name, user_id, session_id, state, last_update_time) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (*key, json.dumps(session.state), session.last_update_time),
+                    )
+                    self._disk.execute("COMMIT")
+                except Exception:
+                    self._disk.execute("ROLLBACK")
+                    raise
+            self._remember(key, session, size=0)
+
+            return self._merge_state(app_name, user_id, copy.deepcopy(session))
+
+    def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        with self._lock:
+            session = self._get_stored_session((app_name, user_id, session_id))
+            if session is None:
+                return None
+
+            # Image bytes are immutable and shared between the copies
+            copied_session = copy.deepcopy(session)
+
+        if config:
+            if config.num_recent_events:
+                copied_session.events = copied_session.events[-config.num_recent_events :]
+            elif config.after_timestamp:
+                i = len(copied_session.events) - 1
+                while i >= 0:
+                    if copied_session.events[i].timestamp < config.after_timestamp:
+                        break
+                    i -= 1
+                if i >= 0:
+                    copied_session.events = copied_session.events[i:]
+
+        return self._merge_state(app_name, user_id, copied_session)
+
+    def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        with self._lock:
+            sessions = {
+                key[2]: hot.session.last_update_time
+                for key, hot in self._hot.items()
+                if key[:2] == (app_name, user_id)
+            }
+            if self._disk is not None:
+                for session_id, last_update_time in self._disk.execute(
+                    "SELECT session_id, last_update_time FROM sessions "
+                    "WHERE app_name = ? AND user_id = ?",
+                    (app_name, user_id),
+                ):
+                    sessions.setdefault(session_id, last_update_time)
+
+        return ListSessionsResponse(
+            sessions=[
+                Session(
+                    app_name=app_name,
+                    user_id=user_id,
+                    id=session_id,
+                    last_update_time=last_update_time,
+                )
+                for session_id, last_update_time in sessions.items()
+            ]
+        )
+
+    def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            hot = self._hot.pop(key, None)
+            if hot is not None:
+                self._hot_bytes -= hot.size
+
+            if self._disk is not None:
+                self._disk.execute("BEGIN IMMEDIATE")
+                try:
+                    self._delete_stored_session(key)
+                    self._disk.execute("COMMIT")
+                except Exception:
+                    self._disk.execute("ROLLBACK")
+                    raise
+
+    def list_events(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> ListEventsResponse:
+        with self._lock:
+            session = self._get_stored_session((app_name, user_id, session_id))
+            if session is None:
+                return ListEventsResponse()
+            return ListEventsResponse(events=copy.deepcopy(session.events))
+
+    def append_event(self, session: Session, event: Event) -> Event:
+        # Update the session object of the caller
+        super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        if event.partial:
+            return event
+
+        key = (session.app_name, session.user_id, session.id)
+        with self._lock:
+            self._update_shared_state(session.app_name, session.user_id, event)
+
+            # Write through to the persistent store, an evicted session is loaded from it
+            event_size, previous_seq, seq = self._persist_event(key, session, event)
+
+            hot = self._hot.get(key)
+            if hot is not None and hot.last_seq != previous_seq:
+                # Another process appended events the hot copy is missing
+                del self._hot[key]
+                self._hot_bytes -= hot.size
+                self._stats["stale_reloads"] += 1
+            elif hot is not None:
+                super().append_event(session=hot.session, event=event)
+                hot.session.last_update_time = event.timestamp
+                hot.last_seq = seq
+                hot.size += event_size
+                self._hot_bytes += event_size
+                self._touch(key)
+            elif self._disk is None:
+                return event
+
+            self._evict()
+
+        return event
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hot set size and the hit, load and eviction counters.
+
+        Returns:
+            Dict[str, int]: The session store statistics.
+        """
+        with self._lock:
+            stats = {
+                **self._stats,
+                "hot_sessions": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+            }
+            if self._disk is not None:
+                stats["stored_sessions"] = self._disk.execute(
+                    "SELECT COUNT(*) FROM sessions"
+                ).fetchone()[0]
+                stats["stored_blob_bytes"] = self._disk.execute(
+                    "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+                ).fetchone()[0]
+            return stats
+
+    def _delete_stored_session(self, key: SessionKey) -> None:
+        """Delete a session, its events and its unreferenced images from the store."""
+        # Only the images of this session can become unreferenced, the others are not scanned
+        hashes = [
+            (hash_,) * 2
+            for (hash_,) in self._disk.execute(
+                "SELECT DISTINCT hash FROM event_blobs "
+                "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            )
+        ]
+        for table in ("sessions", "events", "event_blobs"):
+            self._disk.execute(
+                f"DELETE FROM {table} WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            )
+        self._disk.executemany(
+            "DELETE FROM blobs WHERE hash = ? "
+            "AND NOT EXISTS (SELECT 1 FROM event_blobs WHERE hash = ?)",
+            hashes,
+        )
+
+    def _get_stored_session(self, key: SessionKey) -> Optional[Session]:
+        """Return the stored session from the hot set or the persistent store."""
+        hot = self._hot.get(key)
+        if hot is not None and self.shared and self._stored_version(key) != (
+            hot.last_seq,
+            hot.session.last_update_time,
+        ):
+            # Changed or deleted by another process since it was loaded
+            del self._hot[key]
+            self._hot_bytes -= hot.size
+            self._stats["stale_reloads"] += 1
+            hot = None
+
+        if hot is not None:
+            self._stats["hits"] += 1
+            self._touch(key)
+            self._evict()
+            return hot.session
+
+        loaded = self._load_session(key)
+        if loaded is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["disk_loads"] += 1
+        session, size, last_seq = loaded
+        self._remember(key, session, size, last_seq)
+        return session
+
+    def _stored_version(self, key: SessionKey) -> Optional[Tuple[int, float]]:
+        """Return the last event sequence number and update time of a stored session.
+
+        Returns:
+            Optional[Tuple[int, float]]: The version of the session, None if it is not stored.
+        """
+        row = self._disk.execute(
+            "SELECT (SELECT COALESCE(MAX(seq), 0) FROM events "
+            "WHERE app_name = ? AND user_id = ? AND session_id = ?), last_update_time "
+            "FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+            (*key, *key),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def _remember(
+        self, key: SessionKey, session: Session, size: int, last_seq: int = 0
+    ) -> None:
+        """Insert a session into the hot set."""
+        previous = self._hot.pop(key, None)
+        if previous is not None:
+            self._hot_bytes -= previous.size
+
+        self._hot[key] = HotSession(
+            session=session, size=size, last_access=time.monotonic(), last_seq=last_seq
+        )
+        self._hot_bytes += size
+        self._evict()
+
+    def _touch(self, key: SessionKey) -> None:
+        self._hot[key].last_access = time.monotonic()
+        self._hot.move_to_end(key)
+
+    def _evict(self) -> None:
+        """Evict idle sessions, then least recently used ones until the hot set fits."""
+        expired_before = time.monotonic() - self.ttl_seconds
+        while self._hot:
+            key, hot = next(iter(self._hot.items()))
+            if hot.last_access < expired_before:
+                self._stats["ttl_evictions"] += 1
+            elif len(self._hot) > self.max_sessions or (
+                self._hot_bytes > self.max_bytes and len(self._hot) > 1
+            ):
+                self._stats["lru_evictions"] += 1
+            else:
+                return
+
+            del self._hot[key]
+            self._hot_bytes -= hot.size
+
+    def _update_shared_state(self, app_name: str, user_id: str, event: Event) -> None:
+        """Apply the app and user scoped keys of the event state delta."""
+        if not event.actions or not event.actions.state_delta:
+            return
+
+        for key, value in event.actions.state_delta.items():
+            if key.startswith(State.APP_PREFIX):
+                key = key.removeprefix(State.APP_PREFIX)
+                self._app_state.setdefault(app_name, {})[key] = value
+                if self._disk is not None:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO app_state (app_name, key, value) "
+                        "VALUES (?, ?, ?)",
+                        (app_name, key, json.dumps(value)),
+                    )
+            elif key.startswith(State.USER_PREFIX):
+                key = key.removeprefix(State.USER_PREFIX)
+                self._user_state.setdefault(app_name, {}).setdefault(user_id, {})[
+                    key
+                ] = value
+                if self._disk is not None:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO user_state (app_name, user_id, key, value) "
+                        "VALUES (?, ?, ?, ?)",
+                        (app_name, user_id, key, json.dumps(value)),
+                    )
+
+    def _persist_event(
+        self, key: SessionKey, session: Session, event: Event
+    ) -> Tuple[int, int, int]:
+        """Write an event to the persistent store, with image data as blob references.
+
+        Returns:
+            Tuple[int, int, int]: The estimated in-memory size of the event in bytes,
+                the sequence number of the previous event of the session and the
+                sequence number of the event, both 0 without a persistent store.
+        """
+        parts = event.content.parts if event.content and event.content.parts else []
+        images = {
+            idx: part.inline_data.data
+            for idx, part in enumerate(parts)
+            if part.inline_data is not None and part.inline_data.data
+        }
+        document = event.model_dump(
+            mode="json",
+            exclude_none=True,
+            exclude={"content": {"parts": {idx: {"inline_data": {"data"}} for idx in images}}},
+        )
+        image_size = sum(len(data) for data in images.values())
+        if self._disk is None:
+            return len(json.dumps(document)) + image_size, 0, 0
+
+        self._disk.execute("BEGIN IMMEDIATE")
+        try:
+            previous_seq = self._disk.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM events "
+                "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            ).fetchone()[0]
+            for idx, data in images.items():
+                blob_hash = hashlib.sha256(data).hexdigest()
+                document["content"]["parts"][idx]["inline_data"]["blob_ref"] = blob_hash
+                self._disk.execute(
+                    "INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", (blob_hash, data)
+                )
+                self._disk.execute(
+                    "INSERT INTO event_blobs (app_name, user_id, session_id, hash) "
+                    "VALUES (?, ?, ?, ?)",
+                    (*key, blob_hash),
+                )
+
+            serialized = json.dumps(document)
+            seq = self._disk.execute(
+                "INSERT INTO events (app_name, user_id, session_id, event) VALUES (?, ?, ?, ?)",
+                (*key, serialized),
+            ).lastrowid
+            self._disk.execute(
+                "UPDATE sessions SET state = ?, last_update_time = ? "
+                "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (json.dumps(self._session_state(session)), event.timestamp, *key),
+            )
+            self._disk.execute("COMMIT")
+        except Exception:
+            self._disk.execute("ROLLBACK")
+            raise
+
+        return len(serialized) + image_size, previous_seq, seq
+
+    def _load_session(self, key: SessionKey) -> Optional[Tuple[Session, int, int]]:
+        """Load a session and its events from the persistent store.
+
+        Returns:
+            Optional[Tuple[Session, int, int]]: The session, its estimated size in
+                bytes and the sequence number of its last event, None if it is not stored.
+        """
+        if self._disk is None:
+            return None
+
+        row = self._disk.execute(
+            "SELECT state, last_update_time FROM sessions "
+            "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+
+        session = Session(
+            app_name=key[0],
+            user_id=key[1],
+            id=key[2],
+            state=json.loads(row[0]),
+            last_update_time=row[1],
+        )
+        size = 0
+        last_seq = 0
+        blobs: dict[str, bytes] = {}
+        for last_seq, serialized in self._disk.execute(
+            "SELECT seq, event FROM events "
+            "WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq",
+            key,
+        ):
+            size += len(serialized)
+            document = json.loads(serialized)
+            references = {}
+            for idx, part in enumerate(document.get("content", {}).get("parts", [])):
+                blob_hash = part.get("inline_data", {}).pop("blob_ref", None)
+                if blob_hash is not None:
+                    references[idx] = blob_hash
+
+            event = Event.model_validate_json(
+                json.dumps(document) if references else serialized
+            )
+            for idx, blob_hash in references.items():
+                if blob_hash not in blobs:
+                    blobs[blob_hash] = self._disk.execute(
+                        "SELECT data FROM blobs WHERE hash = ?", (blob_hash,)
+                    ).fetchone()[0]
+                    size += len(blobs[blob_hash])
+                # Events referencing the same image share one bytes object
+                event.content.parts[idx].inline_data.data = blobs[blob_hash]
+            session.events.append(event)
+
+        return session, size, last_seq
+
+    @staticmethod
+    def _session_state(session: Session) -> dict[str, Any]:
+        """Session scoped state, without the merged app, user and temporary keys."""
+        return {
+            key: value
+            for key, value in session.state.items()
+            if not key.startswith(
+                (State.APP_PREFIX, State.USER_PREFIX, State.TEMP_PREFIX)
+            )
+        }
+
+    def _load_shared_state(self, app_name: str, user_id: str) -> None:
+        """Reload the app and user scoped state, other processes may have changed it."""
+        with self._lock:
+            self._app_state[app_name] = {
+                key: json.loads(value)
+                for key, value in self._disk.execute(
+                    "SELECT key, value FROM app_state WHERE app_name = ?", (app_name,)
+                )
+            }
+            self._user_state.setdefault(app_name, {})[user_id] = {
+                key: json.loads(value)
+                for key, value in self._disk.execute(
+                    "SELECT key, value FROM user_state WHERE app_name = ? AND user_id = ?",
+                    (app_name, user_id),
+                )
+            }
+
+    def _merge_state(self, app_name: str, user_id: str, copied_session: Session) -> Session:
+        """Merge the app and user scoped state into a session copy."""
+        if self.shared:
+            self._load_shared_state(app_name, user_id)
+
+        for key, value in self._app_state.get(app_name, {}).items():
+            copied_session.state[State.APP_PREFIX + key] = value
+        for key, value in self._user_state.get(app_name, {}).get(user_id, {}).items():
+            copied_session.state[State.USER_PREFIX + key] = value
+        return copied_session
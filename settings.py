@@ -1,11 +1,13 @@
 
 
+from pydantic import Field
 from pydantic_settings import (
     BaseSettings,
     SettingsConfigDict,
     YamlConfigSettingsSource,
     PydanticBaseSettingsSource,
 )
+from functools import lru_cache
 from typing import Type, Tuple
 
 
@@ -19,15 +21,153 @@ class Settings(BaseSettings):
         GCLOUD_LOCATION: Google Cloud location for API services.
         GCLOUD_PROJECT_ID: Google Cloud project identifier.
         BACKEND_URL: URL for the backend service API endpoint.
+        BACKEND_HOST: Interface the backend server listens on.
+        BACKEND_PORT: Port the backend server listens on.
+        BACKEND_WORKERS: Number of backend worker processes, 0 for one per available CPU core.
+            More than one worker requires SESSION_STORE_PATH and INDEX_GENERATIONS_PATH.
         STORAGE_BUCKET_NAME: Name of the Google Cloud Storage bucket for storing receipts.
-        DB_COLLECTION_NAME: Name of the Firestore collection for storing receipts.
+        DB_USER_COLLECTION_NAME: Name of the Firestore collection of users, holding the
+            receipts and spending rollups of each user in subcollections.
+        DB_COLLECTION_NAME: Name of the legacy single-user Firestore collection of receipts,
+            only read when migrating to per-user partitions.
+        DB_ROLLUP_COLLECTION_NAME: Name of the legacy single-user Firestore collection of spending rollups.
+        BASE_CURRENCY: Currency into which receipt amounts are normalized.
+        FX_RATES_PATH: JSON file of exchange rates, empty to use the bundled reference rates.
+        EMBEDDING_CACHE_MAX_ENTRIES: Number of embeddings kept in the in-memory LRU cache.
+        EMBEDDING_CACHE_DIR: Directory of the persistent embedding cache, empty to disable it.
+        EMBEDDING_CACHE_MAX_DISK_BYTES: Size budget in bytes of the persistent embedding cache.
+        BACKEND_UPLOAD_MODE: How the frontend uploads images, "multipart" or "json" (base64).
+        FRONTEND_CONCURRENCY_LIMIT: Number of chat messages the frontend processes at the same
+            time, also the size of its connection pool to the backend.
+        FRONTEND_QUEUE_MAX_SIZE: Number of chat messages waiting in the frontend queue before
+            new ones are rejected.
+        FRONTEND_HTTP_CONNECT_TIMEOUT_SECONDS: Timeout in seconds of a connection from the
+            frontend to the backend.
+        FRONTEND_HTTP_READ_TIMEOUT_SECONDS: Timeout in seconds between two reads of a backend
+            response, the agent can take long before it answers.
+        FRONTEND_HTTP_RETRIES: Maximum number of retries of one frontend request to the backend.
+        FRONTEND_RETRY_BUDGET_RATIO: Retries allowed per request sent, across all frontend requests.
+        FRONTEND_UPLOAD_CACHE_MAX_ENTRIES: Number of base64 encoded uploads kept by the frontend.
+        FRONTEND_ATTACHMENT_CACHE_DIR: Directory of the attachments cached by the frontend,
+            empty for a directory in the system temporary directory.
+        FRONTEND_ATTACHMENT_CACHE_MAX_BYTES: Size budget in bytes of the frontend attachment cache.
+        MAX_UPLOAD_BYTES: Maximum size in bytes of one uploaded image.
+        UPLOAD_SPOOL_MAX_BYTES: Size in bytes after which an uploaded image is spooled to disk.
+        IMAGE_PREPROCESS_ENABLED: Preprocess uploaded images before inference and storage.
+        IMAGE_PREPROCESS_MAX_LONG_EDGE: Longest edge in pixels of preprocessed images, 0 to keep the size.
+        IMAGE_PREPROCESS_GRAYSCALE: Convert preprocessed images to grayscale.
+        IMAGE_PREPROCESS_FORMAT: Output format of preprocessed images, "WEBP" or "JPEG".
+        IMAGE_PREPROCESS_QUALITY: Encoder quality of preprocessed images, from 1 to 100.
+        IMAGE_PREPROCESS_WORKERS: Number of workers shared by all requests for image preprocessing.
+        ARTIFACT_UPLOAD_CONCURRENCY: Maximum number of uploaded images persisted at the same time per request.
+        ATTACHMENT_DOWNLOAD_CONCURRENCY: Maximum number of attachments downloaded at the same time.
+        HISTORY_TOKEN_BUDGET: Estimated token budget of the history sent to the model, 0 to disable compaction.
+        HISTORY_KEEP_RECENT_USER_MESSAGES: Number of recent user turns never compacted.
+        HISTORY_TOOL_RESPONSE_MAX_CHARS: Maximum length of an old tool response before it is truncated.
+        SESSION_STORE_PATH: SQLite file where sessions are persisted, empty to keep them in memory only.
+        SESSION_CACHE_MAX_SESSIONS: Maximum number of sessions kept in memory.
+        SESSION_CACHE_MAX_BYTES: Byte budget of the sessions kept in memory.
+        SESSION_CACHE_TTL_SECONDS: Idle time in seconds after which a session is evicted from memory.
+        INDEX_GENERATIONS_PATH: SQLite file of the receipt index generations shared by the
+            backend workers and scripts, empty to keep them in the memory of each process.
+        WARM_UP_CLIENTS: Create the Firestore, GenAI and other clients at startup instead of on
+            the first request.
+        RECEIPT_ID_FILTER_CAPACITY: Expected number of receipts per user, used to size the receipt ID bloom filters.
+        VECTOR_INDEX_ENABLED: Serve natural language search from the local vector index.
+        VECTOR_INDEX_MODE: Local vector index mode, one of "auto", "flat" or "ivf".
+        VECTOR_INDEX_IVF_MIN_SIZE: Index size from which "auto" mode switches to partitioned search.
+        VECTOR_INDEX_IVF_NPROBE: Number of partitions scanned per query in partitioned search.
+        VECTOR_INDEX_SNAPSHOT_DIR: Directory of the per-user local vector index snapshots, empty to disable them.
+        VECTOR_INDEX_RECALL_SAMPLE_RATE: Fraction of searches compared against Firestore.
+        VECTOR_INDEX_MIN_RECALL: Minimum recall against Firestore before falling back to it.
+        FIRESTORE_TIMEOUT_SECONDS: Timeout in seconds of one Firestore call made by the agent tools.
+        EMBEDDING_TIMEOUT_SECONDS: Timeout in seconds of one embedding request made by the agent tools.
+        SEARCH_MODE: Natural language search ranking, "vector" or "hybrid" (lexical and vector fused).
+        SEARCH_HYBRID_LEXICAL_WEIGHT: Weight of the lexical ranking in hybrid search, from 0 to 1.
+        SEARCH_LEXICAL_FAST_PATH: In hybrid search, answer from the lexical index without
+            embedding the query when a receipt matches every query term.
+        TRACE_EXPORTER: Where the backend exports its spans, "" to disable tracing, "console",
+            "file" (JSON lines in TRACE_FILE_PATH) or "otlp" (OTLP over HTTP to TRACE_OTLP_ENDPOINT).
+        TRACE_FILE_PATH: File the spans are appended to with the "file" exporter.
+        TRACE_OTLP_ENDPOINT: URL of the OpenTelemetry collector receiving the spans with the
+            "otlp" exporter.
+        TRACE_SAMPLE_RATIO: Fraction of the requests traced, from 0 to 1.
+        METRICS_MULTIPROC_DIR: Directory the backend workers write their metrics to, so that
+            /metrics reports the sum of all workers. A temporary directory when empty.
+        LOG_LEVEL: Lowest severity of the log entries written, "DEBUG", "INFO", "WARNING"
+            or "ERROR".
+        LOG_MAX_FIELD_CHARS: Maximum length of a string in a log entry, longer ones are truncated.
+        LOG_DEBUG_SAMPLE_RATE: Fraction of the DEBUG log entries written, from 0 to 1.
+        LOG_QUEUE_MAX_ENTRIES: Log entries waiting for the writer thread, at most. Entries
+            logged while the queue is full are dropped and counted.
     """
 
     GCLOUD_LOCATION: str
     GCLOUD_PROJECT_ID: str
     BACKEND_URL: str = "http://localhost:8081/chat"
+    BACKEND_HOST: str = "0.0.0.0"
+    BACKEND_PORT: int = 8081
+    BACKEND_WORKERS: int = 0
     STORAGE_BUCKET_NAME: str = "personal-expense-assistant-receipts"
+    DB_USER_COLLECTION_NAME: str = "personal-expense-assistant-users"
     DB_COLLECTION_NAME: str = "personal-expense-assistant-receipts"
+    DB_ROLLUP_COLLECTION_NAME: str = "personal-expense-assistant-rollups"
+    BASE_CURRENCY: str = "IDR"
+    FX_RATES_PATH: str = ""
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 4096
+    EMBEDDING_CACHE_DIR: str = ""
+    EMBEDDING_CACHE_MAX_DISK_BYTES: int = 256 * 1024 * 1024
+    BACKEND_UPLOAD_MODE: str = "multipart"
+    FRONTEND_CONCURRENCY_LIMIT: int = 16
+    FRONTEND_QUEUE_MAX_SIZE: int = 128
+    FRONTEND_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    FRONTEND_HTTP_READ_TIMEOUT_SECONDS: float = 180.0
+    FRONTEND_HTTP_RETRIES: int = 2
+    FRONTEND_RETRY_BUDGET_RATIO: float = 0.1
+    FRONTEND_UPLOAD_CACHE_MAX_ENTRIES: int = 64
+    FRONTEND_ATTACHMENT_CACHE_DIR: str = ""
+    FRONTEND_ATTACHMENT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    MAX_UPLOAD_BYTES: int = 32 * 1024 * 1024
+    UPLOAD_SPOOL_MAX_BYTES: int = 16 * 1024 * 1024
+    IMAGE_PREPROCESS_ENABLED: bool = True
+    IMAGE_PREPROCESS_MAX_LONG_EDGE: int = 1536
+    IMAGE_PREPROCESS_GRAYSCALE: bool = True
+    IMAGE_PREPROCESS_FORMAT: str = "WEBP"
+    IMAGE_PREPROCESS_QUALITY: int = 80
+    IMAGE_PREPROCESS_WORKERS: int = 2
+    ARTIFACT_UPLOAD_CONCURRENCY: int = Field(default=4, ge=1)
+    ATTACHMENT_DOWNLOAD_CONCURRENCY: int = Field(default=4, ge=1)
+    HISTORY_TOKEN_BUDGET: int = 32_000
+    HISTORY_KEEP_RECENT_USER_MESSAGES: int = 3
+    HISTORY_TOOL_RESPONSE_MAX_CHARS: int = 2000
+    SESSION_STORE_PATH: str = "sessions.sqlite3"
+    SESSION_CACHE_MAX_SESSIONS: int = 256
+    SESSION_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    SESSION_CACHE_TTL_SECONDS: int = 1800
+    INDEX_GENERATIONS_PATH: str = "index_generations.sqlite3"
+    WARM_UP_CLIENTS: bool = True
+    RECEIPT_ID_FILTER_CAPACITY: int = 10_000
+    VECTOR_INDEX_ENABLED: bool = False
+    VECTOR_INDEX_MODE: str = "auto"
+    VECTOR_INDEX_IVF_MIN_SIZE: int = 4096
+    VECTOR_INDEX_IVF_NPROBE: int = 8
+    VECTOR_INDEX_SNAPSHOT_DIR: str = ""
+    VECTOR_INDEX_RECALL_SAMPLE_RATE: float = 0.0
+    VECTOR_INDEX_MIN_RECALL: float = 0.8
+    FIRESTORE_TIMEOUT_SECONDS: float = 10.0
+    EMBEDDING_TIMEOUT_SECONDS: float = 10.0
+    SEARCH_MODE: str = "hybrid"
+    SEARCH_HYBRID_LEXICAL_WEIGHT: float = 0.5
+    SEARCH_LEXICAL_FAST_PATH: bool = True
+    TRACE_EXPORTER: str = ""
+    TRACE_FILE_PATH: str = "traces.jsonl"
+    TRACE_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACE_SAMPLE_RATIO: float = 1.0
+    METRICS_MULTIPROC_DIR: str = ""
+    LOG_LEVEL: str = "INFO"
+    LOG_MAX_FIELD_CHARS: int = 4096
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0
+    LOG_QUEUE_MAX_ENTRIES: int = 10_000
 
     model_config = SettingsConfigDict(
         yaml_file="settings.yaml", yaml_file_encoding="utf-8"
@@ -69,12 +209,14 @@ class Settings(BaseSettings):
         )
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Create and return a Settings instance with loaded configuration.
+    """Create and return the process-wide Settings instance with loaded configuration.
 
     Initializes a Settings object that loads configuration values from
     environment variables and the YAML configuration file, with environment
-    variables taking precedence.
+    variables taking precedence. The configuration is loaded once per process,
+    call `get_settings.cache_clear()` to load it again.
 
     Returns:
         A fully configured Settings instance containing all application configuration.
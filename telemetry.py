@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Sequence, Tuple
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+import logger
+from settings import get_settings
+
+SETTINGS = get_settings()
+SERVICE_NAME = "personal-expense-assistant-backend"
+METRIC_PREFIX = "expense_"
+# Latency buckets in seconds, from a cache hit to a slow model turn
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_EXPORTERS = ("", "console", "file", "otlp")
+
+TRACER = trace.get_tracer("personal-expense-assistant")
+
+# Set when the backend runs several workers, each worker writes its metrics to files in it
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Gauges declare how the values of the workers are aggregated, counters and histograms are summed
+STAGE_DURATION = Histogram(
+    METRIC_PREFIX + "stage_duration_seconds",
+    "Duration of the stages of a request, such as model calls, tools, Firestore and artifact I/O.",
+    ("stage", "operation"),
+    buckets=DEFAULT_BUCKETS,
+)
+STAGE_IN_FLIGHT = Gauge(
+    METRIC_PREFIX + "stage_in_flight",
+    "Stages of requests running right now.",
+    ("stage",),
+    multiprocess_mode="livesum",
+)
+STAGE_ERRORS = Counter(
+    METRIC_PREFIX + "stage_errors", "Stages that raised an error.", ("stage", "operation")
+)
+LLM_TOKENS = Counter(
+    METRIC_PREFIX + "llm_tokens",
+    "Tokens sent to and generated by the model, as reported by the model or estimated.",
+    ("direction", "source"),
+)
+CACHE_LOOKUPS = Counter(
+    METRIC_PREFIX + "cache_lookups",
+    "Lookups of the caches avoiding a remote call, a hit skips the call.",
+    ("cache", "result"),
+)
+HTTP_RESPONSES = Counter(
+    METRIC_PREFIX + "http_responses",
+    "HTTP responses by route and status code.",
+    ("route", "status"),
+)
+
+
+class StatsCounter:
+    """Counter following a running total kept elsewhere, such as the statistics of a cache.
+
+    Only the growth since the previous update is added to the counter, so the
+    totals of the workers add up like the counters updated where the work happens.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.counter = Counter(METRIC_PREFIX + name, documentation, label_names)
+        self._totals: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def update(self, total: float, **labels: Any) -> None:
+        key = tuple(sorted((name, str(value)) for name, value in labels.items()))
+        with self._lock:
+            # A total lower than the previous one means the statistics were reset
+            previous = self._totals.get(key, 0.0)
+            self._totals[key] = total
+        growth = total - previous if total >= previous else total
+        # The series is reported from the first update, even before any growth
+        child = self.counter.labels(**labels)
+        if growth > 0:
+            child.inc(growth)
+
+
+def prepare_metrics_dir(path: str) -> None:
+    """Create the directory the workers write their metrics to, removing those of a previous run."""
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+
+
+def render_metrics() -> bytes:
+    """Render the metrics in the Prometheus text format, summed over the workers if several run."""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def mark_worker_stopped() -> None:
+    """Drop the live gauges of this worker from the aggregated metrics."""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+@contextmanager
+def stage(name: str, operation: str = "", **attributes: Any) -> Iterator[Any]:
+    """Trace and measure one stage of a request.
+
+    Opens a span nested in the current trace and records the duration, the
+    in-flight count and the errors of the stage in the metrics.
+
+    Args:
+        name: The stage, such as "llm", "tool", "firestore", "embedding" or "artifact".
+        operation: What the stage does, such as the tool name or the Firestore operation.
+        **attributes: Extra span attributes.
+
+    Yields:
+        The span of the stage.
+    """
+    span_name = f"{name} {operation}" if operation else name
+    STAGE_IN_FLIGHT.labels(stage=name).inc()
+    started = time.perf_counter()
+    try:
+        with TRACER.start_as_current_span(
+            span_name, attributes={"stage": name, "operation": operation, **attributes}
+        ) as span:
+            yield span
+    except Exception:
+        STAGE_ERRORS.labels(stage=name, operation=operation).inc()
+        raise
+    finally:
+        STAGE_DURATION.labels(stage=name, operation=operation).observe(
+            time.perf_counter() - started
+        )
+        STAGE_IN_FLIGHT.labels(stage=name).dec()
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Span exporter appending the finished spans to a file, one OpenTelemetry JSON span per line.
+
+    Each batch is written with a single append, so that the workers of the
+    backend can share the file.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def export(self, spans: Sequence[Any]) -> SpanExportResult:
+        lines = "".join(
+            json.dumps(json.loads(span.to_json(indent=None)), separators=(",", ":")) + "\n"
+            for span in spans
+        )
+        try:
+            os.write(self._fd, lines.encode("utf-8"))
+        except OSError as e:
+            logger.error("Failed to write spans", error_message=str(e))
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        os.close(self._fd)
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+def build_span_exporter(exporter: str) -> SpanExporter:
+    """Create the span exporter selected by TRACE_EXPORTER.
+
+    Raises:
+        ValueError: If the exporter is unknown.
+        ImportError: If the OTLP exporter package is not installed.
+    """
+    if exporter == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+        return ConsoleSpanExporter()
+    if exporter == "file":
+        return JsonLinesSpanExporter(SETTINGS.TRACE_FILE_PATH)
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            raise ImportError(
+                "TRACE_EXPORTER=otlp requires the opentelemetry-exporter-otlp-proto-http package"
+            )
+        return OTLPSpanExporter(endpoint=SETTINGS.TRACE_OTLP_ENDPOINT)
+
+    raise ValueError(f"Unknown TRACE_EXPORTER {exporter!r}, use one of {TRACE_EXPORTERS}")
+
+
+def setup_tracing() -> bool:
+    """Export the spans of the process, including those of the agent framework.
+
+    Without TRACE_EXPORTER the spans are not recorded and cost next to nothing.
+    Called once per worker process, the exporter runs in a background thread.
+
+    Returns:
+        bool: True if spans are exported.
+    """
+    if not SETTINGS.TRACE_EXPORTER:
+        return False
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME, "process.pid": os.getpid()}),
+        sampler=ParentBased(TraceIdRatioBased(SETTINGS.TRACE_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(build_span_exporter(SETTINGS.TRACE_EXPORTER)))
+    trace.set_tracer_provider(provider)
+    logger.info(
+        "Tracing enabled",
+        exporter=SETTINGS.TRACE_EXPORTER,
+        sample_ratio=SETTINGS.TRACE_SAMPLE_RATIO,
+    )
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flush the spans still buffered by the exporter."""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
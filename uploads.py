@@ -0,0 +1,140 @@
+import hashlib
+from tempfile import SpooledTemporaryFile
+
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from schema import ChatRequest, UploadedImage
+from settings import get_settings
+
+SETTINGS = get_settings()
+
+CHAT_REQUEST_FIELDS = ("text", "session_id", "user_id", "inline_attachments")
+
+
+class ChatRequestMultipartReader:
+    """Streaming reader of a multipart/form-data chat request.
+
+    Image parts are written into a spooled buffer and hashed while the
+    request body is read, so the raw bytes never go through base64 and the
+    hash ID is known as soon as the upload ends.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.fields: dict[str, str] = {}
+        self.images: list[UploadedImage] = []
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+        self._header_name = b""
+        self._header_value = b""
+        self._headers: dict[bytes, bytes] = {}
+        self._field_name = ""
+        self._field_data = bytearray()
+        self._file: SpooledTemporaryFile | None = None
+        self._file_size = 0
+        self._hasher = None
+
+    def write(self, chunk: bytes) -> None:
+        """Feed the next chunk of the request body."""
+        self._parser.write(chunk)
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._field_data = bytearray()
+        self._file = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._field_name = options.get(b"name", b"").decode("utf-8")
+        if b"filename" in options:
+            self._file = SpooledTemporaryFile(max_size=SETTINGS.UPLOAD_SPOOL_MAX_BYTES)
+            self._file_size = 0
+            self._hasher = hashlib.sha256()
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._file is None:
+            self._field_data.extend(data[start:end])
+            return
+
+        self._file_size += end - start
+        if self._file_size > SETTINGS.MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Uploaded image exceeds {SETTINGS.MAX_UPLOAD_BYTES} bytes",
+            )
+
+        chunk = memoryview(data)[start:end]
+        self._hasher.update(chunk)
+        self._file.write(chunk)
+
+    def _on_part_end(self) -> None:
+        if self._file is None:
+            if self._field_name in CHAT_REQUEST_FIELDS:
+                self.fields[self._field_name] = self._field_data.decode("utf-8")
+            return
+
+        # The spooled buffer is read once into the bytes shared by the artifact and the model
+        self._file.seek(0)
+        self.images.append(
+            UploadedImage(
+                data=self._file.read(),
+                mime_type=self._headers.get(
+                    b"content-type", b"application/octet-stream"
+                ).decode("latin-1"),
+                hash_id=self._hasher.hexdigest()[:12],
+            )
+        )
+        self._file.close()
+        self._file = None
+
+
+async def read_multipart_chat_request(request: Request) -> ChatRequest:
+    """Read a multipart/form-data chat request.
+
+    The form carries the `text`, `session_id`, `user_id` and `inline_attachments` fields of
+    `ChatRequest` and any number of `files` parts with raw image bytes.
+
+    Args:
+        request: The incoming HTTP request.
+
+    Returns:
+        ChatRequest: The chat request, with the images in `uploads`.
+
+    Raises:
+        HTTPException: 415 if the request is not multipart/form-data, 400 if the body
+            is not valid multipart and 413 if an image exceeds MAX_UPLOAD_BYTES.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+
+    reader = ChatRequestMultipartReader(options[b"boundary"])
+    async for chunk in request.stream():
+        try:
+            reader.write(chunk)
+        except MultipartParseError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+
+    return ChatRequest(**{"text": "", **reader.fields}, uploads=reader.images)
@@ -1,22 +1,66 @@
-
-
-from google.cloud import storage
 from settings import get_settings
 import base64
 import re
-from schema import ChatRequest, ImageData
+from schema import ChatRequest, ImageData, UploadedImage
 from google.genai import types
 import hashlib
 import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from google.adk.artifacts import GcsArtifactService
+from image_preprocessing import preprocess_uploaded_image
 import logger
+from telemetry import record_cache_lookup, stage
 
 
 SETTINGS = get_settings()
 
-GCS_BUCKET_CLIENT = storage.Client(project=SETTINGS.GCLOUD_PROJECT_ID).get_bucket(
-    SETTINGS.STORAGE_BUCKET_NAME
-)
+# Process-local record of artifacts known to be persisted, as an LRU of
+# (app_name, user_id, session_id, image_hash_id) keys. Artifacts are content
+# addressed and never deleted, so each backend worker keeps its own record and
+# a miss only costs one existence check in GCS.
+PERSISTED_ARTIFACTS: OrderedDict[tuple[str, str, str, str], None] = OrderedDict()
+PERSISTED_ARTIFACTS_LOCK = threading.Lock()
+PERSISTED_ARTIFACTS_MAX_ENTRIES = 10_000
+
+
+def is_artifact_persisted(key: tuple[str, str, str, str]) -> bool:
+    """Check the process-local cache of persisted artifacts."""
+    with PERSISTED_ARTIFACTS_LOCK:
+        if key in PERSISTED_ARTIFACTS:
+            PERSISTED_ARTIFACTS.move_to_end(key)
+            return True
+        return False
+
+
+def mark_artifact_persisted(key: tuple[str, str, str, str]) -> None:
+    """Record an artifact as persisted in the process-local cache."""
+    with PERSISTED_ARTIFACTS_LOCK:
+        PERSISTED_ARTIFACTS[key] = None
+        PERSISTED_ARTIFACTS.move_to_end(key)
+        while len(PERSISTED_ARTIFACTS) > PERSISTED_ARTIFACTS_MAX_ENTRIES:
+            PERSISTED_ARTIFACTS.popitem(last=False)
+
+
+def decode_image_data(image_data: ImageData) -> UploadedImage:
+    """
+    Decode a base64 encoded image from a JSON chat request.
+
+    Args:
+        image_data: The base64 encoded image data
+
+    Returns:
+        UploadedImage: The raw image bytes with their hash ID
+    """
+    # Decode the base64 image data and use it to generate a hash id
+    image_byte = base64.b64decode(image_data.serialized_image)
+    hasher = hashlib.sha256(image_byte)
+
+    return UploadedImage(
+        data=image_byte, mime_type=image_data.mime_type, hash_id=hasher.hexdigest()[:12]
+    )
 
 
 def store_uploaded_image_as_artifact(
@@ -24,7 +68,7 @@ def store_uploaded_image_as_artifact(
     app_name: str,
     user_id: str,
     session_id: str,
-    image_data: ImageData,
+    image: UploadedImage,
 ) -> tuple[str, bytes]:
     """
     Store an uploaded image as an artifact in Google Cloud Storage.
@@ -34,52 +78,58 @@ def store_uploaded_image_as_artifact(
         app_name: The name of the application
         user_id: The ID of the user
         session_id: The ID of the session
-        image_data: The image data to store
+        image: The uploaded image to store
 
     Returns:
         tuple[str, bytes]: A tuple containing the image hash ID and the image byte
     """
+    image_byte = image.data
+    image_hash_id = image.hash_id
+
+    # Images already persisted by this process skip the list_versions round-trip
+    artifact_key = (app_name, user_id, session_id, image_hash_id)
+    persisted = is_artifact_persisted(artifact_key)
+    record_cache_lookup("artifact_record", persisted)
+    if persisted:
+        return image_hash_id, image_byte
 
-    # Decode the base64 image data and use it to generate a hash id
-    image_byte = base64.b64decode(image_data.serialized_image)
-    hasher = hashlib.sha256(image_byte)
-    image_hash_id = hasher.hexdigest()[:12]
-
-    artifact_versions = artifact_service.list_versions(
-        app_name=app_name,
-        user_id=user_id,
-        session_id=session_id,
-        filename=image_hash_id,
-    )
+    with stage("artifact", "list_versions"):
+        artifact_versions = artifact_service.list_versions(
+            app_name=app_name,
+            user_id=user_id,
+            session_id=session_id,
+            filename=image_hash_id,
+        )
     if artifact_versions:
         logger.info(f"Image {image_hash_id} already exists in GCS, skipping upload")
+        mark_artifact_persisted(artifact_key)
 
         return image_hash_id, image_byte
 
-    artifact_service.save_artifact(
-        app_name=app_name,
-        user_id=user_id,
-        session_id=session_id,
-        filename=image_hash_id,
-        artifact=types.Part(
-            inline_data=types.Blob(mime_type=image_data.mime_type, data=image_byte)
-        ),
-    )
+    with stage("artifact", "save"):
+        artifact_service.save_artifact(
+            app_name=app_name,
+            user_id=user_id,
+            session_id=session_id,
+            filename=image_hash_id,
+            artifact=types.Part(
+                inline_data=types.Blob(mime_type=image.mime_type, data=image_byte)
+            ),
+        )
+    mark_artifact_persisted(artifact_key)
 
     return image_hash_id, image_byte
 
 
-def download_image_from_gcs(
+def load_image_artifact(
     artifact_service: GcsArtifactService,
     app_name: str,
     user_id: str,
     session_id: str,
     image_hash: str,
-) -> tuple[str, str] | None:
+) -> tuple[bytes, str] | None:
     """
-    Downloads an image artifact from Google Cloud Storage and
-    returns it as base64 encoded string with its MIME type.
-    Uses local caching to avoid redundant downloads.
+    Loads an image artifact from Google Cloud Storage as raw bytes with its MIME type.
 
     Args:
         artifact_service: The artifact service to use for downloading artifacts
@@ -89,15 +139,16 @@ def download_image_from_gcs(
         image_hash: The hash identifier of the image to download
 
     Returns:
-        tuple[str, str] | None: A tuple containing (base64_encoded_data, mime_type), or None if download fails
+        tuple[bytes, str] | None: A tuple containing (image_bytes, mime_type), or None if download fails
     """
     try:
-        artifact = artifact_service.load_artifact(
-            app_name=app_name,
-            user_id=user_id,
-            session_id=session_id,
-            filename=image_hash,
-        )
+        with stage("artifact", "load"):
+            artifact = artifact_service.load_artifact(
+                app_name=app_name,
+                user_id=user_id,
+                session_id=session_id,
+                filename=image_hash,
+            )
         if not artifact:
             logger.info(f"Image {image_hash} does not exist in GCS Artifact Service")
             return None
@@ -108,12 +159,86 @@ def download_image_from_gcs(
 
         logger.info(f"Downloaded image {image_hash} with type {mime_type}")
 
-        return base64.b64encode(image_data).decode("utf-8"), mime_type
+        return image_data, mime_type
     except Exception as e:
         logger.error(f"Error downloading image from GCS: {e}")
         return None
 
 
+def download_image_from_gcs(
+    artifact_service: GcsArtifactService,
+    app_name: str,
+    user_id: str,
+    session_id: str,
+    image_hash: str,
+) -> tuple[str, str] | None:
+    """
+    Downloads an image artifact from Google Cloud Storage and
+    returns it as base64 encoded string with its MIME type.
+
+    Args:
+        artifact_service: The artifact service to use for downloading artifacts
+        app_name: The name of the application
+        user_id: The ID of the user
+        session_id: The ID of the session
+        image_hash: The hash identifier of the image to download
+
+    Returns:
+        tuple[str, str] | None: A tuple containing (base64_encoded_data, mime_type), or None if download fails
+    """
+    result = load_image_artifact(
+        artifact_service=artifact_service,
+        app_name=app_name,
+        user_id=user_id,
+        session_id=session_id,
+        image_hash=image_hash,
+    )
+    if result is None:
+        return None
+
+    image_data, mime_type = result
+    return base64.b64encode(image_data).decode("utf-8"), mime_type
+
+
+def parse_byte_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single HTTP byte range.
+
+    Args:
+        range_header: Value of the Range header, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-512".
+        size: Total size of the resource in bytes.
+
+    Returns:
+        tuple[int, int] | None: Inclusive (start, end) offsets, or None if the header
+            should be ignored and the whole resource served.
+
+    Raises:
+        ValueError: If the range cannot be satisfied.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        # Unknown units and multiple ranges are served as a full response
+        return None
+
+    start_str, _, end_str = ranges.strip().partition("-")
+    try:
+        if not start_str:
+            # Suffix range, the last N bytes
+            suffix_length = int(end_str)
+            if suffix_length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(0, size - suffix_length), size - 1
+
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {range_header}")
+
+    if start >= size or end < start:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+
+    return start, min(end, size - 1)
+
+
 def format_user_request_to_adk_content_and_store_artifacts(
     request: ChatRequest, app_name: str, artifact_service: GcsArtifactService
 ) -> types.Content:
@@ -130,17 +255,39 @@ def format_user_request_to_adk_content_and_store_artifacts(
     # Create a list to hold parts
     parts = []
 
-    # Handle image files if present
-    for data in request.files:
-        # Process the image and add string placeholder
+    # Binary uploads are used as is, base64 images from JSON requests are decoded once
+    images = request.uploads or request.files
 
+    def persist_image(data: UploadedImage | ImageData) -> tuple[UploadedImage, str, bytes]:
+        image = data if isinstance(data, UploadedImage) else decode_image_data(data)
+        # The hash ID is computed from the original bytes and kept by preprocessing
+        with stage("image_preprocessing"):
+            image = preprocess_uploaded_image(image)
         image_hash_id, image_byte = store_uploaded_image_as_artifact(
             artifact_service=artifact_service,
             app_name=app_name,
             user_id=request.user_id,
             session_id=request.session_id,
-            image_data=data,
+            image=image,
         )
+        return image, image_hash_id, image_byte
+
+    # Hash, preprocess, check and upload the images concurrently, in the input order.
+    # Each task runs in a copy of the caller context, so its spans join the request trace.
+    if len(images) > 1:
+        with ThreadPoolExecutor(
+            max_workers=min(len(images), SETTINGS.ARTIFACT_UPLOAD_CONCURRENCY)
+        ) as executor:
+            futures = [
+                executor.submit(copy_context().run, persist_image, data) for data in images
+            ]
+            persisted_images = [future.result() for future in futures]
+    else:
+        persisted_images = [persist_image(data) for data in images]
+
+    # Handle image files if present
+    for data, image_hash_id, image_byte in persisted_images:
+        # Add image data and its string placeholder
 
         # Add inline data part
         parts.append(
@@ -277,3 +424,159 @@ def extract_thinking_process(response_text: str) -> tuple[str, str]:
         ).strip()
 
     return sanitized_text, thinking_process
+
+
+class ResponseStreamParser:
+    """Incremental parser of the agent markdown response.
+
+    Streaming counterpart of `extract_thinking_process` and
+    `extract_attachment_ids_and_sanitize_response`: text chunks are fed as
+    they arrive and classified line by line into thinking process, final
+    response and attachment IDs, so each part can be forwarded to the client
+    as soon as it is known. A partial line is only held back while it could
+    still turn into a heading or a code fence.
+    """
+
+    THINKING_HEADING = re.compile(r"^#\s*THINKING PROCESS")
+    FINAL_RESPONSE_HEADING = re.compile(r"^#\s*FINAL RESPONSE")
+    ATTACHMENTS_HEADING = re.compile(r"^#\s*ATTACHMENTS")
+    JSON_FENCE = "```json"
+
+    def __init__(self):
+        self.section = "response"
+        self.thinking_process = ""
+        self.response = ""
+        self.attachment_ids: list[str] = []
+        self._line = ""
+        self._line_emitted = 0
+        self._json_lines: list[str] | None = None
+        self._section_before_json = ""
+        self._pending_whitespace = {"thinking": "", "response": ""}
+
+    def feed(self, chunk: str) -> list[tuple[str, str | list[str]]]:
+        """Feed a chunk of response text.
+
+        Args:
+            chunk: The next piece of the response text.
+
+        Returns:
+            list[tuple[str, str | list[str]]]: Parsed events, either ("thinking", text),
+                ("response", text) or ("attachments", list of image hash IDs).
+        """
+        events = []
+        self._line += chunk
+        while (newline := self._line.find("\n")) != -1:
+            line, self._line = self._line[: newline + 1], self._line[newline + 1 :]
+            events.extend(self._process_line(line))
+            self._line_emitted = 0
+
+        # Flush the unfinished line early when it can no longer be a heading or fence
+        stripped = self._line.lstrip()
+        if stripped and stripped[0] not in "#`" and self._json_lines is None:
+            events.extend(self._emit(self._line[self._line_emitted :]))
+            self._line_emitted = len(self._line)
+
+        return events
+
+    def close(self) -> list[tuple[str, str | list[str]]]:
+        """Flush the remaining text once the response is complete.
+
+        Returns:
+            list[tuple[str, str | list[str]]]: The last parsed events.
+        """
+        events = []
+        if self._line:
+            events.extend(self._process_line(self._line))
+            self._line = ""
+            self._line_emitted = 0
+
+        if self._json_lines is not None:
+            # Unterminated code block, parse what we have
+            events.extend(self._finish_json_block())
+
+        return events
+
+    def _process_line(self, line: str) -> list[tuple[str, str | list[str]]]:
+        """Classify one complete line."""
+        stripped = line.strip()
+
+        if self._json_lines is not None:
+            fence_end = line.find("```")
+            if fence_end == -1:
+                self._json_lines.append(line)
+                return []
+            self._json_lines.append(line[:fence_end])
+            return self._finish_json_block()
+
+        if self.THINKING_HEADING.match(stripped):
+            self.section = "thinking"
+            return []
+        if self.FINAL_RESPONSE_HEADING.match(stripped):
+            self.section = "response"
+            return []
+        if self.section == "response" and self.ATTACHMENTS_HEADING.match(stripped):
+            self.section = "attachments"
+            return []
+        if stripped.startswith(self.JSON_FENCE) and not self.attachment_ids:
+            self._section_before_json = self.section
+            self._json_lines = [stripped[len(self.JSON_FENCE) :]]
+            self.section = "json"
+            return []
+
+        return self._emit(line[self._line_emitted :])
+
+    def _finish_json_block(self) -> list[tuple[str, str | list[str]]]:
+        """Extract attachment IDs from a completed ```json block."""
+        json_str = "".join(self._json_lines).strip()
+        self._json_lines = None
+        self.section = self._section_before_json
+
+        if not json_str.startswith("{"):
+            # Not an attachments block, give it back to the response text
+            return self._emit(f"```json\n{json_str}\n```\n")
+
+        try:
+            json_data = json.loads(json_str)
+            attachments = (
+                json_data.get("attachments", []) if isinstance(json_data, dict) else []
+            )
+            attachment_ids = [
+                sanitize_image_id(attachment_id)
+                for attachment_id in attachments
+                if isinstance(attachment_id, str)
+            ]
+        except json.JSONDecodeError:
+            attachment_ids = [
+                sanitize_image_id(match.strip())
+                for match in re.findall(r"\[IMAGE-ID\s+([^\]]+)\]", json_str)
+                if match.strip()
+            ]
+
+        if not attachment_ids:
+            return []
+
+        self.attachment_ids.extend(attachment_ids)
+        return [("attachments", attachment_ids)]
+
+    def _emit(self, text: str) -> list[tuple[str, str | list[str]]]:
+        """Append text to the current section, trimming leading and trailing whitespace."""
+        if self.section not in self._pending_whitespace or not text:
+            return []
+
+        # Hold trailing whitespace back until we know more text follows
+        body = text.rstrip()
+        if not body:
+            self._pending_whitespace[self.section] += text
+            return []
+
+        trailing = text[len(body) :]
+        current = self.thinking_process if self.section == "thinking" else self.response
+        text = self._pending_whitespace[self.section] + body if current else body.lstrip()
+        self._pending_whitespace[self.section] = trailing
+
+        if self.section == "thinking":
+            self.thinking_process += text
+        else:
+            self.response += text
+
+        return [(self.section, text)]